@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig, RunnableGenerator
+
+try:
+    from .tokens import get_token_counter
+except Exception:
+    from tokens import get_token_counter
+
+
+# USD per 1K prompt / completion tokens by model family, matched on the deployment name.
+# Deployments are priced by their own contract: override or extend with LLM_PRICES, e.g.
+#   LLM_PRICES='{"gpt4o-prod": {"prompt": 0.0025, "completion": 0.01}}'
+DEFAULT_PRICES = OrderedDict([
+    ("4omini", {"prompt": 0.00015, "completion": 0.0006}),
+    ("4o", {"prompt": 0.0025, "completion": 0.01}),
+    ("4turbo", {"prompt": 0.01, "completion": 0.03}),
+    ("432k", {"prompt": 0.06, "completion": 0.12}),
+    ("gpt4", {"prompt": 0.03, "completion": 0.06}),
+    ("35turbo", {"prompt": 0.0005, "completion": 0.0015}),
+])
+UNKNOWN_PRICE = {"prompt": 0.0, "completion": 0.0}
+
+# Tokens OpenAI chat models add around every message and to prime the reply (used when estimating)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def _load_prices() -> Dict[str, dict]:
+    prices = dict()
+    if os.environ.get("LLM_PRICES"):
+        prices.update(json.loads(os.environ["LLM_PRICES"]))
+    return prices
+
+
+def price_for(deployment: Optional[str], prices: Optional[Dict[str, dict]] = None) -> dict:
+    """Per 1K token prices of a deployment: exact entry of LLM_PRICES, else the model family default, else 0"""
+    prices = _load_prices() if prices is None else prices
+    if deployment in prices:
+        return prices[deployment]
+    name = (deployment or "").lower().replace("-", "").replace("_", "").replace(".", "")
+    for family, price in DEFAULT_PRICES.items():
+        if family in name:
+            return price
+    return UNKNOWN_PRICE
+
+
+def estimate_cost(deployment: Optional[str], prompt_tokens: int, completion_tokens: int,
+                  prices: Optional[Dict[str, dict]] = None) -> float:
+    price = price_for(deployment, prices)
+    return (prompt_tokens * price["prompt"] + completion_tokens * price["completion"]) / 1000
+
+
+def _empty_totals() -> dict:
+    return {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+
+
+def _add_call(totals: dict, call: dict) -> None:
+    totals["llm_calls"] += call.get("llm_calls", 1)
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens", "cost"):
+        totals[key] += call[key]
+
+
+def _message_text(message) -> str:
+    text = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = message.additional_kwargs.get("tool_calls") or message.additional_kwargs.get("function_call")
+    if tool_calls:
+        text += json.dumps(tool_calls)
+    return text
+
+
+def _deployment_name(serialized: Optional[dict], kwargs: dict) -> Optional[str]:
+    params = kwargs.get("invocation_params") or dict()
+    for key in ("deployment_name", "azure_deployment", "model", "model_name"):
+        if params.get(key):
+            return params[key]
+    metadata = kwargs.get("metadata") or dict()
+    if metadata.get("ls_model_name"):
+        return metadata["ls_model_name"]
+    return ((serialized or dict()).get("kwargs") or dict()).get("deployment_name")
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Callback handler totalling the tokens and estimated cost of one request: per LLM call, per tool
+    (LLM calls made inside a tool, e.g. the docsearch or sqlsearch agents, are charged to it) and overall.
+
+    Token counts come from the usage the deployment reports. Streamed calls that report none are
+    estimated with tiktoken from the messages and the generated text, and marked "estimated".
+
+        handler = TokenUsageHandler(session_id="s1", user_id="u1")
+        agent_executor.invoke({"question": question}, {"callbacks": [handler]})
+        handler.totals()
+    """
+
+    run_inline = True  # keeps the run tree in order when called from async code
+
+    def __init__(self, session_id: str = "", user_id: str = "", prices: Optional[Dict[str, dict]] = None):
+        self.request_id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.user_id = user_id
+        self.prices = _load_prices() if prices is None else prices
+        self.started = time.time()
+        self.calls: List[dict] = []
+        self._parents: Dict[UUID, Optional[UUID]] = dict()
+        self._tools: Dict[UUID, str] = dict()
+        self._pending: Dict[UUID, dict] = dict()
+        self._lock = threading.Lock()
+
+    def _track(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def _tool_of(self, run_id: UUID) -> Optional[str]:
+        """Name of the innermost tool run the given run belongs to"""
+        seen = set()
+        while run_id is not None and run_id not in seen:
+            if run_id in self._tools:
+                return self._tools[run_id]
+            seen.add(run_id)
+            run_id = self._parents.get(run_id)
+        return None
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._track(run_id, parent_run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._track(run_id, parent_run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._track(run_id, parent_run_id)
+        with self._lock:
+            self._tools[run_id] = kwargs.get("name") or (serialized or dict()).get("name") or "tool"
+
+    def _start_llm(self, serialized, run_id: UUID, parent_run_id: Optional[UUID], prompt_texts: List[str], overhead: int, kwargs: dict) -> None:
+        deployment = _deployment_name(serialized, kwargs)
+        self._track(run_id, parent_run_id)
+        with self._lock:
+            self._pending[run_id] = {"deployment": deployment, "prompt_texts": prompt_texts, "overhead": overhead,
+                                     "started": time.monotonic()}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        batch = messages[0] if messages else []
+        self._start_llm(serialized, run_id, parent_run_id, [_message_text(message) for message in batch],
+                        TOKENS_PER_MESSAGE * len(batch) + TOKENS_PER_REPLY, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start_llm(serialized, run_id, parent_run_id, list(prompts[:1]), 0, kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        with self._lock:
+            pending = self._pending.pop(run_id, None) or {"deployment": None, "prompt_texts": [], "overhead": 0,
+                                                         "started": time.monotonic()}
+        deployment = pending["deployment"] or (response.llm_output or dict()).get("model_name")
+        prompt_tokens, completion_tokens, estimated = self._usage(response, pending, deployment)
+        call = {"deployment": deployment, "tool": None, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "cost": estimate_cost(deployment, prompt_tokens, completion_tokens, self.prices),
+                "estimated": estimated, "latency_ms": (time.monotonic() - pending["started"]) * 1000}
+        with self._lock:
+            call["tool"] = self._tool_of(run_id)
+            self.calls.append(call)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._pending.pop(run_id, None)
+
+    @staticmethod
+    def _usage(response: LLMResult, pending: dict, deployment: Optional[str]):
+        usage = (response.llm_output or dict()).get("token_usage") or dict()
+        if usage.get("total_tokens"):
+            return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), False
+        generations = [generation for batch in response.generations for generation in batch]
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                return usage_metadata.get("input_tokens", 0), usage_metadata.get("output_tokens", 0), False
+        # Streamed without a usage report: count what was sent and generated
+        counter = get_token_counter(deployment)
+        prompt_tokens = sum(counter.count_many(pending["prompt_texts"])) + pending["overhead"]
+        completion_texts = [_message_text(generation.message) if hasattr(generation, "message") else generation.text
+                            for generation in generations]
+        return prompt_tokens, sum(counter.count_many(completion_texts)), True
+
+    def totals(self) -> dict:
+        """Tokens and cost of the request, with the breakdown per tool ("agent" for the brain's own calls),
+        per deployment and per LLM call"""
+        with self._lock:
+            calls = list(self.calls)
+        totals = _empty_totals()
+        tools = dict()
+        deployments = dict()
+        for call in calls:
+            _add_call(totals, call)
+            _add_call(tools.setdefault(call["tool"] or "agent", _empty_totals()), call)
+            _add_call(deployments.setdefault(call["deployment"] or "unknown", _empty_totals()), call)
+        return {"request_id": self.request_id, "session_id": self.session_id, "user_id": self.user_id,
+                "started": self.started, "estimated": any(call["estimated"] for call in calls),
+                **totals, "tools": tools, "deployments": deployments, "calls": calls}
+
+
+class UsageLedger:
+    """Running token and cost totals of finished requests, by user, by session, by deployment and by
+    tool, plus the last max_requests request summaries. Served by the /metrics/token-usage endpoint."""
+
+    def __init__(self, max_requests: int = 1000, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self.requests = deque(maxlen=max_requests)
+        self.totals = _empty_totals()
+        self.by_user: Dict[str, dict] = dict()
+        self.by_session: "OrderedDict[str, dict]" = OrderedDict()
+        self.by_deployment: Dict[str, dict] = dict()
+        self.by_tool: Dict[str, dict] = dict()
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage: dict) -> None:
+        """Adds the totals() of a finished request"""
+        summary = {key: value for key, value in usage.items() if key != "calls"}
+        with self._lock:
+            self.request_count += 1
+            self.requests.append(summary)
+            _add_call(self.totals, usage)
+            _add_call(self.by_user.setdefault(usage["user_id"], _empty_totals()), usage)
+            session = self.by_session.setdefault(usage["session_id"], dict(_empty_totals(), user_id=usage["user_id"]))
+            _add_call(session, usage)
+            self.by_session.move_to_end(usage["session_id"])
+            while len(self.by_session) > self.max_sessions:
+                self.by_session.popitem(last=False)
+            for name, totals in usage["deployments"].items():
+                _add_call(self.by_deployment.setdefault(name, _empty_totals()), totals)
+            for name, totals in usage["tools"].items():
+                _add_call(self.by_tool.setdefault(name, _empty_totals()), totals)
+
+    def stats(self, session_id: Optional[str] = None, user_id: Optional[str] = None) -> dict:
+        """Everything, or the totals and recent requests of one session / user"""
+        with self._lock:
+            if session_id is None and user_id is None:
+                return {"requests": self.request_count, **self.totals, "by_user": dict(self.by_user),
+                        "by_session": dict(self.by_session), "by_deployment": dict(self.by_deployment),
+                        "by_tool": dict(self.by_tool), "recent": list(self.requests)}
+            recent = [request for request in self.requests
+                      if (session_id is None or request["session_id"] == session_id)
+                      and (user_id is None or request["user_id"] == user_id)]
+            if session_id is not None:
+                totals = self.by_session.get(session_id, _empty_totals())
+            else:
+                totals = self.by_user.get(user_id, _empty_totals())
+            return {"session_id": session_id, "user_id": user_id, **totals, "recent": recent}
+
+
+def get_usage_ledger() -> UsageLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger(max_requests=int(os.environ.get("TOKEN_USAGE_MAX_REQUESTS", 1000)))
+        return _ledger
+
+
+def _with_handler(config: RunnableConfig, handler: BaseCallbackHandler) -> RunnableConfig:
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler, inherit=True)
+    else:
+        callbacks = list(callbacks or []) + [handler]
+    return {**config, "callbacks": callbacks}
+
+
+def track_usage(runnable, ledger: Optional[UsageLedger] = None, output_key: str = "usage"):
+    """Runnable running the given one (invoke, stream and stream_events) with a TokenUsageHandler per request.
+
+    session_id / user_id are read from config["configurable"] (as set by RunnableWithMessageHistory). The
+    request totals are streamed as a last {output_key: totals} chunk, so they end up in the final output and
+    in the stream metadata, and are added to the ledger (the shared one by default) when the request ends.
+
+        agent_executor = track_usage(agent_executor)
+    """
+
+    def handler_for(config: RunnableConfig) -> TokenUsageHandler:
+        configurable = config.get("configurable") or dict()
+        return TokenUsageHandler(session_id=configurable.get("session_id", ""), user_id=configurable.get("user_id", ""))
+
+    def transform(inputs: Iterator[dict], config: RunnableConfig) -> Iterator[Any]:
+        request = _merge_inputs(inputs)
+        handler = handler_for(config)
+        try:
+            yield from runnable.stream(request, _with_handler(config, handler))
+            yield {output_key: handler.totals()}
+        finally:
+            (ledger or get_usage_ledger()).record(handler.totals())
+
+    async def atransform(inputs: AsyncIterator[dict], config: RunnableConfig) -> AsyncIterator[Any]:
+        request = _merge_inputs([chunk async for chunk in inputs])
+        handler = handler_for(config)
+        try:
+            async for chunk in runnable.astream(request, _with_handler(config, handler)):
+                yield chunk
+            yield {output_key: handler.totals()}
+        finally:
+            (ledger or get_usage_ledger()).record(handler.totals())
+
+    return RunnableGenerator(transform, atransform)
+
+
+def _merge_inputs(inputs) -> dict:
+    request = dict()
+    for chunk in inputs:
+        request.update(chunk)
+    return request
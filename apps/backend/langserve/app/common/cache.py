@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import time
+import copy
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+DEFAULT_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 300))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 1024))
+
+_search_cache = None
+_search_cache_lock = threading.RLock()
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases and collapses whitespace so trivially different spellings share a cache entry"""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+def make_search_cache_key(query: str, indexes: list, k: int, reranker_threshold: float, sas_token: str = "",
+                          merge_strategy: str = "score", dedup_threshold: Optional[float] = None) -> str:
+    """Cache key of a get_search_results call: (normalized query, indexes, k, reranker_threshold, sas_token, merge_strategy,
+    dedup_threshold)"""
+    key = json.dumps([normalize_query(query), list(indexes), k, reranker_threshold, sas_token, merge_strategy, dedup_threshold])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU store with per-entry expiry time"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCacheBackend:
+    """SQLite-backed LRU store, so cached results survive restarts and are shared between processes"""
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_access REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0], object_pairs_hook=OrderedDict)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                               (key, json.dumps(value), now + ttl, now))
+            # Evict the least recently used entries above max_entries
+            self._conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                               (self.max_entries,))
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class SearchResultCache:
+    """TTL + LRU cache for get_search_results, with hit/miss counters"""
+
+    def __init__(self, backend=None, ttl: float = DEFAULT_TTL):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        # Callers get their own copy, so changing the results never changes the cached entry
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        self.backend.set(key, copy.deepcopy(value), self.ttl)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.backend),
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+def configure_search_cache(ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, path: Optional[str] = None) -> SearchResultCache:
+    """Replaces the shared search cache. With a path the entries are kept on disk (SQLite), otherwise in memory."""
+    global _search_cache
+    backend = DiskCacheBackend(path, max_entries) if path else MemoryCacheBackend(max_entries)
+    with _search_cache_lock:
+        _search_cache = SearchResultCache(backend, ttl=ttl)
+    return _search_cache
+
+
+def get_search_cache() -> SearchResultCache:
+    """Returns the shared search cache, built from SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES and
+    SEARCH_CACHE_PATH (on-disk backend when set) on first use"""
+    with _search_cache_lock:
+        if _search_cache is None:
+            configure_search_cache(path=os.environ.get("SEARCH_CACHE_PATH") or None)
+        return _search_cache
@@ -0,0 +1,127 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+DEFAULT_DEDUP_THRESHOLD = 0.8
+
+
+def shingle_hashes(text: str, size: int = 3) -> np.ndarray:
+    """32-bit hashes of the distinct word n-grams of the lowercased text (of the words themselves for
+    texts shorter than size). The n-gram hashes are combined from the word hashes with numpy."""
+    words = re.findall(r"\w+", text.lower())
+    hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    if len(words) >= size:
+        combined = hashes[:len(words) - size + 1].copy()
+        for offset in range(1, size):
+            combined = (combined * np.uint64(1000003) + hashes[offset:len(words) - size + 1 + offset]) & np.uint64(0xFFFFFFFF)
+        hashes = combined
+    return np.unique(hashes)
+
+
+def word_overlap(text_a: str, text_b: str) -> float:
+    """Share of the distinct words of the shorter text that the other one has too (overlap coefficient
+    of the word sets, from the same lowercased word hashes as the shingles): 1.0 when one text's words
+    are all in the other, 0.0 when they share none or either has no words"""
+    words_a, words_b = shingle_hashes(text_a, size=1), shingle_hashes(text_b, size=1)
+    if not len(words_a) or not len(words_b):
+        return 0.0
+    return len(np.intersect1d(words_a, words_b, assume_unique=True)) / min(len(words_a), len(words_b))
+
+
+def _lsh_bands(threshold: float, num_perm: int) -> tuple:
+    """(bands, rows) whose LSH S-curve threshold (1/bands)**(1/rows) sits safely below threshold,
+    as many rows per band as possible so fewer unrelated chunks become candidates"""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold - 0.15:
+            best = (bands, rows)
+    return best
+
+
+class MinHashDeduplicator:
+    """Near-duplicate detection of chunk texts with MinHash signatures and LSH banding.
+
+    The similarity of two chunks is the Jaccard similarity of their word 3-gram sets, estimated as
+    the share of equal MinHash values. Signatures are indexed by band, so a lookup only compares the
+    chunks sharing a band bucket: signing is linear in the text length and lookups do not grow with
+    the number of indexed chunks (for chunks that are not near-duplicates of each other).
+
+        dedup = MinHashDeduplicator(threshold=0.8)
+        dedup.add("doc-1", dedup.signature(chunk_1))
+        dedup.find(dedup.signature(chunk_2))  # "doc-1" when the chunks are >= 80% similar, else None
+    """
+
+    def __init__(self, threshold: float = DEFAULT_DEDUP_THRESHOLD, num_perm: int = 128, seed: int = 1):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash functions h(x) = (a * x + b mod 2**64) >> 32, a odd
+        self._a = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = _lsh_bands(threshold, num_perm)
+        self._signatures: Dict[Hashable, np.ndarray] = dict()
+        self._buckets = [defaultdict(set) for _ in range(self.bands)]
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        return ((np.outer(hashes, self._a) + self._b) >> np.uint64(32)).min(axis=0)
+
+    @staticmethod
+    def similarity(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+        return float(np.mean(signature_a == signature_b))
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def find(self, signature: np.ndarray) -> Optional[Hashable]:
+        """Key of the most similar indexed chunk at or above the threshold, or None"""
+        candidates = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+        best_key, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = self.similarity(signature, self._signatures[key])
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+    def add(self, key: Hashable, signature: np.ndarray) -> None:
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket[band_key].add(key)
+
+    def remove(self, key: Hashable) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket[band_key].discard(key)
+            if not bucket[band_key]:
+                del bucket[band_key]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+def deduplicate(texts: List[str], scores: List[float], threshold: float = DEFAULT_DEDUP_THRESHOLD) -> List[int]:
+    """Positions of the texts to keep: the highest-scored representative of every group of near-duplicates,
+    in descending score order"""
+    dedup = MinHashDeduplicator(threshold)
+    kept = []
+    for position in sorted(range(len(texts)), key=lambda i: scores[i], reverse=True):
+        signature = dedup.signature(texts[position])
+        if dedup.find(signature) is None:
+            dedup.add(position, signature)
+            kept.append(position)
+    return kept
@@ -99,6 +99,16 @@ AGENT_DOCSEARCH_PROMPT = ChatPromptTemplate.from_messages(
     ]
 )
 
+HISTORY_SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "You keep a running summary of a conversation between a user and an AI assistant. Extend the current summary "
+                   "with the new messages. Keep names, numbers, tool results and open questions the assistant may need later, "
+                   "drop greetings and repetitions. Answer with the new summary only, in at most {max_words} words, "
+                   "in the language of the conversation."),
+        ("human", "Current summary:\n{summary}\n\nNew messages:\n{messages}"),
+    ]
+)
+
 
 
 ####### Welcome Message for the Bot Service #################
@@ -0,0 +1,157 @@
+import os
+import asyncio
+import weakref
+import threading
+from typing import Optional
+
+import httpx
+
+
+# Defaults used when neither configure_search_client() nor the environment say otherwise
+DEFAULT_POOL_SIZE = 20
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> its async client
+_client_lock = threading.Lock()
+_client_overrides = dict()
+
+
+def search_client_settings(**overrides) -> dict:
+    """Returns the settings used to build the pooled Azure AI Search client.
+
+    Values come from (in order of precedence) the overrides passed here, the overrides stored with
+    configure_search_client(), and the AZURE_SEARCH_* environment variables.
+    """
+    settings = {
+        "endpoint": os.environ.get("AZURE_SEARCH_ENDPOINT", ""),
+        "api_key": os.environ.get("AZURE_SEARCH_KEY", ""),
+        "api_version": os.environ.get("AZURE_SEARCH_API_VERSION", ""),
+        "pool_size": int(os.environ.get("AZURE_SEARCH_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        "timeout": float(os.environ.get("AZURE_SEARCH_TIMEOUT", DEFAULT_TIMEOUT)),
+        "connect_timeout": float(os.environ.get("AZURE_SEARCH_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+        "keepalive_expiry": float(os.environ.get("AZURE_SEARCH_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY)),
+        "http2": os.environ.get("AZURE_SEARCH_HTTP2", "false").lower() in ("1", "true", "yes"),
+    }
+    settings.update(_client_overrides)
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    return settings
+
+
+def _client_kwargs(settings: dict) -> dict:
+    limits = httpx.Limits(max_connections=settings["pool_size"],
+                          max_keepalive_connections=settings["pool_size"],
+                          keepalive_expiry=settings["keepalive_expiry"])
+    timeout = httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"])
+    headers = {'Content-Type': 'application/json', 'api-key': settings["api_key"]}
+    params = {'api-version': settings["api_version"]} if settings["api_version"] else {}
+    return dict(base_url=settings["endpoint"], headers=headers, params=params, limits=limits, timeout=timeout)
+
+
+def build_search_client(**overrides) -> httpx.Client:
+    """Builds a keep-alive, connection-pooled client for the Azure AI Search REST API.
+
+    The client carries the endpoint as base_url plus the api-key header and api-version parameter,
+    so callers only pass the relative path (e.g. "/indexes/my-index/docs/search") and the body.
+    HTTP/2 needs the optional h2 package (pip install httpx[http2]); without it the client
+    falls back to HTTP/1.1 keep-alive.
+    """
+    settings = search_client_settings(**overrides)
+    try:
+        return httpx.Client(http2=settings["http2"], **_client_kwargs(settings))
+    except ImportError:
+        print("h2 package not installed, using HTTP/1.1 for Azure AI Search")
+        return httpx.Client(**_client_kwargs(settings))
+
+
+def build_async_search_client(**overrides) -> httpx.AsyncClient:
+    """Async twin of build_search_client(), with the same pool, timeout and HTTP/2 settings"""
+    settings = search_client_settings(**overrides)
+    try:
+        return httpx.AsyncClient(http2=settings["http2"], **_client_kwargs(settings))
+    except ImportError:
+        print("h2 package not installed, using HTTP/1.1 for Azure AI Search")
+        return httpx.AsyncClient(**_client_kwargs(settings))
+
+
+def get_search_client() -> httpx.Client:
+    """Returns the process-wide pooled client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_search_client()
+    return _client
+
+
+def _close_async_client(loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient) -> None:
+    """Closes an async client on its own loop, from outside a coroutine of that loop. The client of a
+    loop that is already closed is only dropped: its connections went with the loop."""
+    if loop.is_closed():
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    else:
+        loop.run_until_complete(client.aclose())
+
+
+def get_async_search_client() -> httpx.AsyncClient:
+    """Returns the shared async client of the running event loop, creating it on first use.
+
+    Async connections belong to the loop that opened them, so each loop gets its own client (e.g.
+    successive asyncio.run() calls in a notebook, or loops in several threads), kept until the loop
+    is gone. The clients of closed loops are dropped when a new one is built.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _client_lock:
+            for closed in [other for other in _async_clients if other.is_closed()]:
+                del _async_clients[closed]  # the client refers to its loop, so it would never be collected
+            client = _async_clients.get(loop)
+            if client is None:
+                client = _async_clients[loop] = build_async_search_client()
+    return client
+
+
+def configure_search_client(endpoint: Optional[str] = None,
+                            api_key: Optional[str] = None,
+                            api_version: Optional[str] = None,
+                            pool_size: Optional[int] = None,
+                            timeout: Optional[float] = None,
+                            connect_timeout: Optional[float] = None,
+                            keepalive_expiry: Optional[float] = None,
+                            http2: Optional[bool] = None) -> None:
+    """Stores new settings for the shared clients. The current clients (if any) are closed and
+    new clients are built with these settings on the next call to get_search_client() or
+    get_async_search_client()."""
+    overrides = dict(endpoint=endpoint, api_key=api_key, api_version=api_version, pool_size=pool_size,
+                     timeout=timeout, connect_timeout=connect_timeout, keepalive_expiry=keepalive_expiry, http2=http2)
+    with _client_lock:
+        _client_overrides.update({key: value for key, value in overrides.items() if value is not None})
+    close_search_client()
+
+
+def close_search_client() -> None:
+    """Closes the shared clients and their pooled connections. Async clients are closed on their own
+    loop: scheduled there when the loop is running (see aclose_search_client to wait for it)."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+        async_clients = list(_async_clients.items())
+        _async_clients.clear()
+    if client is not None:
+        client.close()
+    for loop, async_client in async_clients:
+        _close_async_client(loop, async_client)
+
+
+async def aclose_search_client() -> None:
+    """Closes the async client of the running loop and waits for it, and the other shared clients"""
+    with _client_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    close_search_client()
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, Optional
+
+from langchain_core.runnables import RunnableConfig, RunnableGenerator
+
+try:
+    from .executors import get_executor
+    from .dedup import word_overlap
+except Exception:
+    from executors import get_executor
+    from dedup import word_overlap
+
+
+# Share of the words of the shorter of the tool query and the speculated question the other must have
+# for the tool to claim the speculation (the docsearch agent rephrases the question before searching)
+SPECULATION_MIN_OVERLAP = float(os.environ.get("SPECULATION_MIN_OVERLAP", 0.6))
+
+
+# Speculations started for the current request, by search key. Set by SpeculativeRetrieval.wrap()
+_speculations: contextvars.ContextVar[Optional[Dict[Hashable, "Speculation"]]] = contextvars.ContextVar("speculations", default=None)
+
+
+class Speculation:
+    """One search started ahead of time for the raw user question. The first claim() gets it."""
+
+    def __init__(self, owner: "SpeculativeRetrieval", question: str, future, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.owner = owner
+        self.question = question
+        self.future = future  # asyncio.Task (async requests) or concurrent Future (sync requests)
+        self.loop = loop
+        self.started = time.monotonic()
+        self.finished = None
+        self.claimed = False
+        self.claimed_at = None
+        self.dropped = False
+        self._lock = threading.Lock()
+        future.add_done_callback(self._done)
+
+    def _done(self, future) -> None:
+        self.finished = time.monotonic()
+
+    def claim(self) -> bool:
+        with self._lock:
+            if self.claimed:
+                return False
+            self.claimed = True
+            self.claimed_at = time.monotonic()
+        return True
+
+    def drop(self) -> None:
+        """The tool searched something else: nobody can claim these results any more, the search is cancelled"""
+        with self._lock:
+            if self.claimed:
+                return
+            self.claimed = True
+            self.dropped = True
+        self.owner._count("mismatched")
+        self.cancel()
+
+    def _used(self, result: Any) -> Any:
+        # The tool would have started its search when it claimed it, everything done before is saved time
+        self.owner._record_use(min(self.claimed_at, self.finished or self.claimed_at) - self.started)
+        return result
+
+    async def aresult(self) -> Any:
+        if isinstance(self.future, Future):
+            return self._used(await asyncio.wrap_future(self.future))
+        return self._used(await self.future)
+
+    def result(self) -> Any:
+        """Blocking wait, from a worker thread (never from the event loop running the speculation)"""
+        if isinstance(self.future, Future):
+            return self._used(self.future.result())
+        return asyncio.run_coroutine_threadsafe(self.aresult(), self.loop).result()
+
+    def cancel(self) -> None:
+        self.future.cancel()
+
+
+class SpeculativeRetrieval:
+    """Starts retrieval for the raw user question while the brain agent's routing LLM call runs.
+
+    wrap() returns a runnable that, for every request, starts search(question) in the background and
+    then runs the agent. When the agent routes to the tool whose search_key matches, the tool claims
+    the warm results (claim_speculation) instead of searching, provided it searches the same question or
+    a rephrasing of it sharing most of its words (else the speculation is dropped); otherwise the
+    speculative search is cancelled when the request ends. stats() reports the hit rate and the latency saved.
+
+        speculative = doc_search.speculative_retrieval()
+        brain = speculative.wrap(brain_agent_executor)
+    """
+
+    def __init__(self, key: Hashable, asearch: Callable[[str], Awaitable[Any]], search: Callable[[str], Any]):
+        self.key = key
+        self.asearch = asearch
+        self.search = search
+        self._lock = threading.Lock()
+        self._counters = {"started": 0, "used": 0, "cancelled": 0, "mismatched": 0, "latency_saved_ms": 0.0}
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _record_use(self, saved_seconds: float) -> None:
+        with self._lock:
+            self._counters["used"] += 1
+            self._counters["latency_saved_ms"] += saved_seconds * 1000
+
+    def _finish(self, speculation: Speculation) -> None:
+        with self._lock:
+            self._counters["started"] += 1
+            if not speculation.claimed or speculation.dropped:
+                self._counters["cancelled"] += 1
+        if not speculation.claimed:
+            speculation.cancel()
+
+    @asynccontextmanager
+    async def aspeculate(self, question: str):
+        """Async requests: the search is an asyncio task, cancelled on exit when nobody claimed it"""
+        speculation = Speculation(self, question, asyncio.ensure_future(self.asearch(question)), asyncio.get_running_loop())
+        previous = _speculations.get()
+        _speculations.set({**(previous or {}), self.key: speculation})
+        try:
+            yield speculation
+        finally:
+            _speculations.set(previous)
+            self._finish(speculation)
+
+    @contextmanager
+    def speculate(self, question: str):
+        """Sync requests: the search runs on its own "speculation" executor. Not on "search": search() waits
+        for the per-index queries it sends there, so sharing it would deadlock once all its workers wait."""
+        speculation = Speculation(self, question, get_executor("speculation").submit(self.search, question))
+        previous = _speculations.get()
+        _speculations.set({**(previous or {}), self.key: speculation})
+        try:
+            yield speculation
+        finally:
+            _speculations.set(previous)
+            self._finish(speculation)
+
+    def wrap(self, runnable, question_key: str = "question"):
+        """Runnable running the given one (invoke, stream and stream_events) with speculation around each request"""
+
+        def transform(inputs: Iterator[dict], config: RunnableConfig) -> Iterator[Any]:
+            request = _merge_inputs(inputs)
+            with self.speculate(request[question_key]):
+                yield from runnable.stream(request, config)
+
+        async def atransform(inputs: AsyncIterator[dict], config: RunnableConfig) -> AsyncIterator[Any]:
+            request = _merge_inputs([chunk async for chunk in inputs])
+            async with self.aspeculate(request[question_key]):
+                async for chunk in runnable.astream(request, config):
+                    yield chunk
+
+        return RunnableGenerator(transform, atransform)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["hit_rate"] = counters["used"] / counters["started"] if counters["started"] else 0.0
+        counters["mean_latency_saved_ms"] = counters["latency_saved_ms"] / counters["used"] if counters["used"] else 0.0
+        return counters
+
+
+def _merge_inputs(inputs) -> dict:
+    request = dict()
+    for chunk in inputs:
+        request.update(chunk)
+    return request
+
+
+def normalize_query(query: str) -> str:
+    """Query compared with the speculated question: case, spacing and end punctuation do not matter"""
+    return " ".join(query.lower().split()).strip(" ?!.¿¡")
+
+
+def same_search(query: str, question: str, min_overlap: Optional[float] = None) -> bool:
+    """Whether results for question can stand in for a search of query: the same normalized text, or
+    at least min_overlap (SPECULATION_MIN_OVERLAP, 0.6) of the words of the shorter one in the other"""
+    if normalize_query(query) == normalize_query(question):
+        return True
+    return word_overlap(query, question) >= (SPECULATION_MIN_OVERLAP if min_overlap is None else min_overlap)
+
+
+def claim_speculation(key: Hashable, query: str, min_overlap: Optional[float] = None) -> Optional[Speculation]:
+    """The unclaimed speculation of the current request for this search key, or None.
+    When the tool searches something else than the speculated question (see same_search), the
+    speculation is dropped (cancelled) and None is returned, so results for an unrelated query are
+    never substituted."""
+    speculation = (_speculations.get() or {}).get(key)
+    if speculation is None:
+        return None
+    if not same_search(query, speculation.question, min_overlap):
+        speculation.drop()
+        return None
+    if speculation.claim():
+        return speculation
+    return None
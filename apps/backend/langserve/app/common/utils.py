@@ -3,7 +3,7 @@ import os
 import pandas as pd
 import json
 from io import BytesIO
-from typing import Any, Dict, List, Optional, Awaitable, Callable, Tuple, Type, Union
+from typing import Any, AsyncIterator, Dict, List, Optional, Awaitable, Callable, Tuple, Type, Union
 import requests
 import asyncio
 
@@ -26,7 +26,7 @@ from langchain.callbacks.manager import AsyncCallbackManagerForToolRun, Callback
 from langchain.pydantic_v1 import BaseModel, Field, Extra
 from langchain.tools import BaseTool, StructuredTool, tool
 from typing import Dict, List
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import BaseOutputParser, OutputParserException
 from langchain.chains import LLMChain
@@ -51,76 +51,330 @@ from langchain_openai import AzureOpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from operator import itemgetter
 from typing import List
 
 try:
     from .prompts import (AGENT_DOCSEARCH_PROMPT, CSV_PROMPT_PREFIX, MSSQL_AGENT_PREFIX)
+    from .search_client import get_search_client, get_async_search_client
+    from .executors import get_executor
+    from .local_search import search_backend, get_local_search_engine
+    from .merge import StreamingMerger
+    from .context_packer import pack_documents
+    from .resilience import get_search_resilience, SearchUnavailable
+    from .speculation import SpeculativeRetrieval, claim_speculation
+    from .semantic_cache import semantic_cache_scope
+    from .cache import get_search_cache, make_search_cache_key
 except Exception as e:
     print("HOLAAAAA")
     print(e)
     from prompts import (AGENT_DOCSEARCH_PROMPT, CSV_PROMPT_PREFIX, MSSQL_AGENT_PREFIX)
+    from search_client import get_search_client, get_async_search_client
+    from executors import get_executor
+    from local_search import search_backend, get_local_search_engine
+    from merge import StreamingMerger
+    from context_packer import pack_documents
+    from resilience import get_search_resilience, SearchUnavailable
+    from speculation import SpeculativeRetrieval, claim_speculation
+    from semantic_cache import semantic_cache_scope
+    from cache import get_search_cache, make_search_cache_key
+
+
+def build_search_payload(query: str, k: int) -> dict:
+    """Body of the hybrid (semantic + vector) query sent to each index"""
+    return {
+        "search": query,
+        "select": "id, title, chunk, name, location",
+        "queryType": "semantic",
+        "vectorQueries": [{"text": query, "fields": "chunkVector", "kind": "text", "k": k}],
+        "semanticConfiguration": "my-semantic-config",
+        "captions": "extractive",
+        "answers": "extractive",
+        "count":"true",
+        "top": k    
+    }
+
+
+def search_index(query: str, index: str, k: int) -> dict:
+    """Runs the hybrid (semantic + vector) query against a single index and returns the raw response.
+    Uses the shared keep-alive client, so repeated queries reuse pooled connections.
+    With SEARCH_BACKEND=local the query runs on the offline engine in common/local_search.py instead."""
+    
+    if search_backend() == "local":
+        return get_local_search_engine().search_index(query, index, k)
+    
+    search_payload = build_search_payload(query, k)
+    client = get_search_client()
+    
+    # Deadline, retries on 429/503, optional hedging and the per-index circuit breaker (common/resilience.py)
+    def send(timeout):
+        return client.post("/indexes/" + index + "/docs/search", content=json.dumps(search_payload), timeout=timeout)
+
+    return get_search_resilience().call(index, send)
+
+
+def degraded_response(index: str, error: Exception) -> dict:
+    """Empty response standing in for an index that could not answer, so the other indexes still count"""
+    print(f"Skipping index {index}: {error}")
+    return {"value": [], "@search.degraded": str(error)}
+
+
+def _check_degraded(agg_search_results: dict) -> bool:
+    """True when some index was skipped; raises SearchUnavailable when all of them were"""
+    degraded = [index for index, response in agg_search_results.items() if "@search.degraded" in response]
+    if degraded and len(degraded) == len(agg_search_results):
+        raise SearchUnavailable(", ".join(degraded), "no index answered")
+    return bool(degraded)
 
 
 def get_search_results(query: str, indexes: list, 
                        k: int = 5,
                        reranker_threshold: int = 1,
-                       sas_token: str = "") -> List[dict]:
-    """Performs multi-index hybrid search and returns ordered dictionary with the combined results"""
+                       sas_token: str = "",
+                       max_concurrency: int = 4,
+                       use_cache: bool = False,
+                       merge_strategy: str = "score",
+                       dedup_threshold: Optional[float] = None) -> List[dict]:
+    """Performs multi-index hybrid search and returns ordered dictionary with the combined results.
+    
+    The indexes are queried at the same time (fan-out), with at most max_concurrency requests in flight,
+    so latency tracks the slowest index instead of the sum of all of them. Use max_concurrency=1 to
+    query the indexes one after another.
+    With use_cache=True, repeated questions are answered from the shared TTL/LRU search cache.
+    merge_strategy selects how the results of the indexes are ranked together (see merge_search_results).
+    With dedup_threshold (0-1), near-duplicate chunks across indexes are collapsed before the top k cut.
+    An index that cannot answer (see common/resilience.py) is skipped and the others are merged; results
+    missing an index are not cached. SearchUnavailable is raised only when no index answered.
+    """
+    
+    if use_cache:
+        cache_key = make_search_cache_key(query, indexes, k, reranker_threshold, sas_token, merge_strategy, dedup_threshold)
+        cached_results = get_search_cache().get(cache_key)
+        if cached_results is not None:
+            return cached_results
+    
+    agg_search_results = dict()
+    
+    if max_concurrency > 1 and len(indexes) > 1:
+        # Runs on the shared "search" executor, keeping at most max_concurrency queries of this call in flight
+        executor = get_executor("search")
+        pending = list(indexes)
+        futures = dict()
+        in_flight = set()
+        while pending or in_flight:
+            while pending and len(in_flight) < max_concurrency:
+                index = pending.pop(0)
+                futures[index] = executor.submit(search_index, query, index, k)
+                in_flight.add(futures[index])
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        # Collect in the order of indexes so the merge behaves exactly like the sequential loop
+        for index in indexes:
+            try:
+                agg_search_results[index] = futures[index].result()
+            except SearchUnavailable as e:
+                agg_search_results[index] = degraded_response(index, e)
+    else:
+        for index in indexes:
+            try:
+                agg_search_results[index] = search_index(query, index, k)
+            except SearchUnavailable as e:
+                agg_search_results[index] = degraded_response(index, e)
+    
+    degraded = _check_degraded(agg_search_results)
+    
+    ordered_content = merge_search_results(agg_search_results, k=k, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                                           strategy=merge_strategy, dedup_threshold=dedup_threshold)
+    if use_cache and not degraded:
+        get_search_cache().set(cache_key, ordered_content)
+    
+    return ordered_content
+
+
+async def asearch_index(query: str, index: str, k: int) -> dict:
+    """Async twin of search_index, on the shared async client"""
     
-    headers = {'Content-Type': 'application/json','api-key': os.environ["AZURE_SEARCH_KEY"]}
-    params = {'api-version': os.environ['AZURE_SEARCH_API_VERSION']}
+    if search_backend() == "local":
+        return await get_executor("search").run(get_local_search_engine().search_index, query, index, k)
+    
+    search_payload = build_search_payload(query, k)
+    client = get_async_search_client()
+    
+    async def send(timeout):
+        return await client.post("/indexes/" + index + "/docs/search", content=json.dumps(search_payload), timeout=timeout)
+
+    return await get_search_resilience().acall(index, send)
+
+
+async def aget_search_results(query: str, indexes: list, 
+                              k: int = 5,
+                              reranker_threshold: int = 1,
+                              sas_token: str = "",
+                              max_concurrency: int = 4,
+                              use_cache: bool = False,
+                              merge_strategy: str = "score",
+                              dedup_threshold: Optional[float] = None) -> List[dict]:
+    """Async twin of get_search_results. The indexes are queried concurrently on the event loop
+    (at most max_concurrency at a time), so no thread is held while waiting on the network."""
+    
+    if use_cache:
+        cache_key = make_search_cache_key(query, indexes, k, reranker_threshold, sas_token, merge_strategy, dedup_threshold)
+        cached_results = get_search_cache().get(cache_key)
+        if cached_results is not None:
+            return cached_results
+    
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def search(index):
+        async with semaphore:
+            try:
+                return await asearch_index(query, index, k)
+            except SearchUnavailable as e:
+                return degraded_response(index, e)
+    
+    responses = await asyncio.gather(*[search(index) for index in indexes])
+    agg_search_results = dict(zip(indexes, responses))
+    degraded = _check_degraded(agg_search_results)
+    
+    ordered_content = merge_search_results(agg_search_results, k=k, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                                           strategy=merge_strategy, dedup_threshold=dedup_threshold)
+    if use_cache and not degraded:
+        get_search_cache().set(cache_key, ordered_content)
+    
+    return ordered_content
+
 
+async def astream_search_results(query: str, indexes: list, 
+                                  k: int = 5,
+                                  reranker_threshold: int = 1,
+                                  sas_token: str = "",
+                                  max_concurrency: int = 4,
+                                  merge_strategy: str = "score",
+                                  dedup_threshold: Optional[float] = None) -> AsyncIterator[dict]:
+    """Streaming twin of aget_search_results. Yields a provisional top k each time an index answers,
+    then the final ranking (merged in the order of indexes, same as aget_search_results):
+    
+        {"final": False, "indexes": ["srch-index-files"], "results": OrderedDict(...)}
+        ...
+        {"final": True, "indexes": [...all...], "results": OrderedDict(...)}
+    
+    Closing the generator early cancels the queries still in flight.
+    """
+    
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def search(index):
+        async with semaphore:
+            try:
+                return index, await asearch_index(query, index, k)
+            except SearchUnavailable as e:
+                return index, degraded_response(index, e)
+    
+    tasks = [asyncio.ensure_future(search(index)) for index in indexes]
+    merger = StreamingMerger(k=k, strategy=merge_strategy, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                             dedup_threshold=dedup_threshold)
     agg_search_results = dict()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, search_results = await next_done
+            agg_search_results[index] = search_results
+            if len(agg_search_results) < len(indexes):
+                merger.add(index, search_results['value'])
+                yield {"final": False, "indexes": list(agg_search_results), "results": merger.results()}
+    finally:
+        for task in tasks:
+            task.cancel()
     
-    for index in indexes:
-        search_payload = {
-            "search": query,
-            "select": "id, title, chunk, name, location",
-            "queryType": "semantic",
-            "vectorQueries": [{"text": query, "fields": "chunkVector", "kind": "text", "k": k}],
-            "semanticConfiguration": "my-semantic-config",
-            "captions": "extractive",
-            "answers": "extractive",
-            "count":"true",
-            "top": k    
-        }
+    agg_search_results = {index: agg_search_results[index] for index in indexes}
+    _check_degraded(agg_search_results)
+    yield {"final": True, "indexes": list(indexes),
+           "results": merge_search_results(agg_search_results, k=k, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                                           strategy=merge_strategy, dedup_threshold=dedup_threshold)}
+
 
-        resp = requests.post(os.environ['AZURE_SEARCH_ENDPOINT'] + "/indexes/" + index + "/docs/search",
-                         data=json.dumps(search_payload), headers=headers, params=params)
+def _batch_result(query: str, results, started: float, error: Optional[Exception] = None) -> dict:
+    return {"query": query, "results": results, "elapsed_ms": (time.perf_counter() - started) * 1000, "error": error}
 
-        search_results = resp.json()
-        agg_search_results[index] = search_results
+
+def get_search_results_batch(queries: List[str], indexes: list,
+                             max_concurrent_queries: int = 8,
+                             return_exceptions: bool = False,
+                             **search_kwargs) -> List[dict]:
+    """Runs get_search_results for many queries (evaluation sets, bulk jobs) and returns, in the order of queries:
+    
+        [{"query": ..., "results": OrderedDict(...), "elapsed_ms": 231.4, "error": None}, ...]
     
-    content = dict()
-    ordered_content = OrderedDict()
+    At most max_concurrent_queries queries run at a time, on the shared "search-batch" executor; each of them
+    fans out to its indexes on the shared "search" executor and connection pool as usual. search_kwargs
+    (k, reranker_threshold, sas_token, max_concurrency, use_cache, merge_strategy, dedup_threshold) go to
+    get_search_results. With return_exceptions=True a failed query gets results=None and its exception in
+    "error" instead of failing the batch.
+    """
     
+    def run(query):
+        started = time.perf_counter()
+        try:
+            return _batch_result(query, get_search_results(query, indexes, **search_kwargs), started)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return _batch_result(query, None, started, e)
+    
+    executor = get_executor("search-batch")
+    batch_results = [None] * len(queries)
+    pending = list(enumerate(queries))
+    in_flight = dict()
+    while pending or in_flight:
+        while pending and len(in_flight) < max(1, max_concurrent_queries):
+            position, query = pending.pop(0)
+            in_flight[executor.submit(run, query)] = position
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            batch_results[in_flight.pop(future)] = future.result()
+    
+    return batch_results
+
+
+async def aget_search_results_batch(queries: List[str], indexes: list,
+                                    max_concurrent_queries: int = 8,
+                                    return_exceptions: bool = False,
+                                    **search_kwargs) -> List[dict]:
+    """Async twin of get_search_results_batch, running aget_search_results on the shared async client"""
+    
+    semaphore = asyncio.Semaphore(max(1, max_concurrent_queries))
+    
+    async def run(query):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                return _batch_result(query, await aget_search_results(query, indexes, **search_kwargs), started)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return _batch_result(query, None, started, e)
+    
+    return list(await asyncio.gather(*[run(query) for query in queries]))
+
+
+def merge_search_results(agg_search_results: dict, k: int = 5, reranker_threshold: int = 1, sas_token: str = "",
+                         strategy: str = "score", dedup_threshold: Optional[float] = None) -> OrderedDict:
+    """Combines the raw responses of several indexes ({index: response}) into one ordered dictionary
+    with the top k results above the reranker threshold.
+    
+    Results are streamed through a bounded heap (memory O(k)). strategy="score" ranks by the raw
+    reranker score; "rrf" (reciprocal rank fusion) and "minmax" make scores comparable across indexes.
+    An id returned by several indexes keeps its best score. An entry's "score" is the score it is ranked by
+    (the raw reranker score with strategy="score"), "reranker_score" always the raw reranker score.
+    dedup_threshold collapses near-duplicate chunks (MinHash similarity at or above it) into the best-scored one.
+    """
+    
+    merger = StreamingMerger(k=k, strategy=strategy, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                             dedup_threshold=dedup_threshold)
     for index,search_results in agg_search_results.items():
-        for result in search_results['value']:
-            if result['@search.rerankerScore'] > reranker_threshold: # Show results that are at least N% of the max possible score=4
-                content[result['id']]={
-                                        "title": result['title'], 
-                                        "name": result['name'], 
-                                        "chunk": result['chunk'],
-                                        "location": result['location'] + sas_token if result['location'] else "",
-                                        "caption": result['@search.captions'][0]['text'],
-                                        "score": result['@search.rerankerScore'],
-                                        "index": index
-                                    }
-                
-
-    topk = k
-        
-    count = 0  # To keep track of the number of results added
-    for id in sorted(content, key=lambda x: content[x]["score"], reverse=True):
-        ordered_content[id] = content[id]
-        count += 1
-        if count >= topk:  # Stop after adding topK results
-            break
+        merger.add(index, search_results['value'])
 
-    return ordered_content
+    return merger.results()
 
 
 
@@ -130,14 +384,65 @@ class CustomAzureSearchRetriever(BaseRetriever):
     topK : int
     reranker_threshold : int
     sas_token : str = ""
+    max_concurrency : int = 4
+    use_cache : bool = True
+    merge_strategy : str = "score"
+    dedup_threshold : Optional[float] = None
     
     
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> List[Document]:
         
-        ordered_results = get_search_results(query, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, sas_token=self.sas_token)
+        ordered_results = get_search_results(query, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, 
+                                             sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache, 
+                                             merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
+        
+        return self.to_documents(ordered_results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        
+        ordered_results = await aget_search_results(query, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, 
+                                                    sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache, 
+                                                    merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
         
+        return self.to_documents(ordered_results)
+
+    async def astream_documents(self, query: str) -> AsyncIterator[dict]:
+        """Yields {"final": bool, "indexes": [...], "documents": [...]} as the indexes answer:
+        provisional top documents first, then the reconciled ranking with final=True"""
+        
+        async for update in astream_search_results(query, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, 
+                                                   sas_token=self.sas_token, max_concurrency=self.max_concurrency, 
+                                                   merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold):
+            yield {"final": update["final"], "indexes": update["indexes"], "documents": self.to_documents(update["results"])}
+
+    def _search_kwargs(self) -> dict:
+        return dict(k=self.topK, reranker_threshold=self.reranker_threshold, sas_token=self.sas_token, max_concurrency=self.max_concurrency,
+                    use_cache=self.use_cache, merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
+
+    def batch_documents(self, queries: List[str], max_concurrent_queries: int = 8, return_exceptions: bool = False) -> List[dict]:
+        """Documents of many queries, in input order: [{"query", "documents", "elapsed_ms", "error"}, ...]"""
+        
+        batch_results = get_search_results_batch(queries, self.indexes, max_concurrent_queries=max_concurrent_queries,
+                                                 return_exceptions=return_exceptions, **self._search_kwargs())
+        return [self._batch_documents(result) for result in batch_results]
+
+    async def abatch_documents(self, queries: List[str], max_concurrent_queries: int = 8, return_exceptions: bool = False) -> List[dict]:
+        
+        batch_results = await aget_search_results_batch(queries, self.indexes, max_concurrent_queries=max_concurrent_queries,
+                                                        return_exceptions=return_exceptions, **self._search_kwargs())
+        return [self._batch_documents(result) for result in batch_results]
+
+    def _batch_documents(self, result: dict) -> dict:
+        documents = self.to_documents(result["results"]) if result["results"] is not None else None
+        return {"query": result["query"], "documents": documents, "elapsed_ms": result["elapsed_ms"], "error": result["error"]}
+
+    @staticmethod
+    def to_documents(ordered_results: OrderedDict) -> List[Document]:
+        """Converts the results of get_search_results into LangChain Documents"""
         top_docs = []
         for key,value in ordered_results.items():
             location = value["location"] if value["location"] is not None else ""
@@ -150,6 +455,12 @@ class CustomAzureSearchRetriever(BaseRetriever):
 ############################### AGENTS AND TOOL CLASSES #############################################
 #####################################################################################################
         
+
+def _child_config(run_manager) -> Optional[dict]:
+    """Config handing a tool run's callbacks (token accounting, tracing) down to the agent or chain it runs"""
+    return {"callbacks": run_manager.get_child()} if run_manager else None
+
+
 class SearchInput(BaseModel):
     query: str = Field(description="should be a search query")
     return_direct: bool = Field(
@@ -157,6 +468,11 @@ class SearchInput(BaseModel):
         default=False,
     )
 
+def doc_search_key(indexes: List[str], k: int, reranker_th: int, sas_token: str, merge_strategy: str, dedup_threshold: Optional[float]) -> tuple:
+    """Identifies the searches of a GetDocSearchResults_Tool, so a speculative search with the same settings can stand in for them"""
+    return (tuple(indexes), k, reranker_th, sas_token, merge_strategy, dedup_threshold)
+
+
 class GetDocSearchResults_Tool(BaseTool):
     name = "docsearch"
     description = "useful when the questions includes the term: docsearch"
@@ -166,29 +482,60 @@ class GetDocSearchResults_Tool(BaseTool):
     k: int = 10
     reranker_th: int = 1
     sas_token: str = "" 
+    max_concurrency: int = 4
+    use_cache: bool = True
+    merge_strategy: str = "score"
+    dedup_threshold: Optional[float] = None
+    max_context_tokens: Optional[int] = None  # when set, the results are packed into this many tokens
 
     def _run(
         self, query: str,  return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
 
+        # Results searched ahead of time for the user question (SpeculativeRetrieval), when the request has them
+        speculation = claim_speculation(doc_search_key(self.indexes, self.k, self.reranker_th, self.sas_token,
+                                                       self.merge_strategy, self.dedup_threshold), query)
+        if speculation is not None:
+            try:
+                return self._pack(CustomAzureSearchRetriever.to_documents(speculation.result()), run_manager)
+            except Exception as e:
+                print(e)
+
         retriever = CustomAzureSearchRetriever(indexes=self.indexes, topK=self.k, reranker_threshold=self.reranker_th, 
-                                               sas_token=self.sas_token, callback_manager=self.callbacks)
+                                               sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache,
+                                               merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold,
+                                               callback_manager=self.callbacks)
         results = retriever.get_relevant_documents(query=query)
         
-        return results
+        return self._pack(results, run_manager)
 
     async def _arun(
         self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool asynchronously."""
         
+        speculation = claim_speculation(doc_search_key(self.indexes, self.k, self.reranker_th, self.sas_token,
+                                                       self.merge_strategy, self.dedup_threshold), query)
+        if speculation is not None:
+            try:
+                return self._pack(CustomAzureSearchRetriever.to_documents(await speculation.aresult()),
+                                  run_manager.get_sync() if run_manager else None)
+            except Exception as e:
+                print(e)
+        
         retriever = CustomAzureSearchRetriever(indexes=self.indexes, topK=self.k, reranker_threshold=self.reranker_th, 
-                                               sas_token=self.sas_token, callback_manager=self.callbacks)
-        # Please note below that running a non-async function like run_agent in a separate thread won't make it truly asynchronous. 
-        # It allows the function to be called without blocking the event loop, but it may still have synchronous behavior internally.
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(ThreadPoolExecutor(), retriever.get_relevant_documents, query)
+                                               sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache,
+                                               merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold,
+                                               callback_manager=self.callbacks)
+        # The retriever queries Azure AI Search with the async client, so no thread is used while waiting on the network
+        results = await retriever.aget_relevant_documents(query)
         
+        return self._pack(results, run_manager.get_sync() if run_manager else None)
+
+    def _pack(self, results: List[Document], run_manager: Optional[CallbackManagerForToolRun] = None) -> List[Document]:
+        """The results packed into max_context_tokens, when set; the tokens used and dropped go to the log and the tool run"""
+        if self.max_context_tokens is not None:
+            results = pack_documents(results, self.max_context_tokens, run_manager=run_manager)
         return results
 
 class DocSearchAgent(BaseTool):
@@ -203,30 +550,61 @@ class DocSearchAgent(BaseTool):
     k: int = 10
     reranker_th: int = 1
     sas_token: str = ""   
+    max_concurrency: int = 4
+    use_cache: bool = True
+    merge_strategy: str = "score"
+    dedup_threshold: Optional[float] = None
+    max_context_tokens: Optional[int] = None
+    semantic_cache: Any = None  # optional SemanticCache answering paraphrased questions (per indexes and user_id / tenant_id of the request)
     
     class Config:
         extra = Extra.allow  # Allows setting attributes not declared in the model
     
     def __init__(self, **data):
         super().__init__(**data)
-        tools = [GetDocSearchResults_Tool(indexes=self.indexes, k=self.k, reranker_th=self.reranker_th, sas_token=self.sas_token)]
+        tools = [GetDocSearchResults_Tool(indexes=self.indexes, k=self.k, reranker_th=self.reranker_th, sas_token=self.sas_token,
+                                          max_concurrency=self.max_concurrency, use_cache=self.use_cache,
+                                          merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold,
+                                          max_context_tokens=self.max_context_tokens)]
 
         agent = create_openai_tools_agent(self.llm, tools, AGENT_DOCSEARCH_PROMPT)
 
         self.agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=self.verbose, callback_manager=self.callbacks, handle_parsing_errors=True)
         
+    def speculative_retrieval(self) -> SpeculativeRetrieval:
+        """SpeculativeRetrieval running this agent's search for the raw user question, claimed by its docsearch tool"""
+        search_kwargs = dict(k=self.k, reranker_threshold=self.reranker_th, sas_token=self.sas_token, max_concurrency=self.max_concurrency,
+                             use_cache=self.use_cache, merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
+        return SpeculativeRetrieval(key=doc_search_key(self.indexes, self.k, self.reranker_th, self.sas_token, self.merge_strategy,
+                                                       self.dedup_threshold),
+                                    asearch=lambda question: aget_search_results(question, self.indexes, **search_kwargs),
+                                    search=lambda question: get_search_results(question, self.indexes, **search_kwargs))
     
     def _run(self, query: str,  return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        scope = semantic_cache_scope(run_manager, *self.indexes)
+        if self.semantic_cache is not None:
+            cached_answer = self.semantic_cache.lookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
-            result = self.agent_executor.invoke({"question": query})
+            result = self.agent_executor.invoke({"question": query}, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                self.semantic_cache.add(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
             return str(e)  # Return an empty string or some error indicator
 
     async def _arun(self, query: str,  return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
+        scope = semantic_cache_scope(run_manager, *self.indexes)
+        if self.semantic_cache is not None:
+            cached_answer = await self.semantic_cache.alookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
-            result = await self.agent_executor.ainvoke({"question": query})
+            result = await self.agent_executor.ainvoke({"question": query}, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                await self.semantic_cache.aadd(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
@@ -264,7 +642,7 @@ class CSVTabularAgent(BaseTool):
     def _run(self, query: str, return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         try:
             # Use the initialized agent_executor to invoke the query
-            result = self.agent_executor.invoke(query)
+            result = self.agent_executor.invoke(query, _child_config(run_manager))
             return result['output']
         except Exception as e:
             print("Error...Error...")
@@ -275,7 +653,7 @@ class CSVTabularAgent(BaseTool):
         # Note: Implementation assumes the agent_executor and its methods support async operations
         try:
             # Use the initialized agent_executor to asynchronously invoke the query
-            result = await self.agent_executor.ainvoke(query)
+            result = await self.agent_executor.ainvoke(query, _child_config(run_manager))
             return result['output']
         except Exception as e:
             print(e)
@@ -291,6 +669,7 @@ class SQLSearchAgent(BaseTool):
 
     llm: AzureChatOpenAI
     k: int = 30
+    semantic_cache: Any = None  # optional SemanticCache answering paraphrased questions (per user_id / tenant_id of the request)
 
     class Config:
         extra = Extra.allow  # Allows setting attributes not declared in the model
@@ -334,9 +713,16 @@ class SQLSearchAgent(BaseTool):
         }
 
     def _run(self, query: str, return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        scope = semantic_cache_scope(run_manager)
+        if self.semantic_cache is not None:
+            cached_answer = self.semantic_cache.lookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
             # Use the initialized agent_executor to invoke the query
-            result = self.agent_executor.invoke(query)
+            result = self.agent_executor.invoke(query, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                self.semantic_cache.add(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
@@ -344,9 +730,16 @@ class SQLSearchAgent(BaseTool):
 
     async def _arun(self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         # Note: Implementation assumes the agent_executor and its methods support async operations
+        scope = semantic_cache_scope(run_manager)
+        if self.semantic_cache is not None:
+            cached_answer = await self.semantic_cache.alookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
             # Use the initialized agent_executor to asynchronously invoke the query
-            result = await self.agent_executor.ainvoke(query)
+            result = await self.agent_executor.ainvoke(query, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                await self.semantic_cache.aadd(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
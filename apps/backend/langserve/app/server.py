@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 import os
 import sys
+import asyncio
+from contextlib import asynccontextmanager
 from operator import itemgetter
 from datetime import datetime
-from typing import Any, Dict, TypedDict
+from typing import Any, Dict, Optional, TypedDict
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -44,16 +46,32 @@ from common.utils import (
     #BingSearchAgent
 )
 from common.prompts import CUSTOM_CHATBOT_PROMPT, WELCOME_MESSAGE
+from common.executors import executor_stats, shutdown_executors
+from common.search_client import aclose_search_client
+from common.cache import get_search_cache
+from common.resilience import get_search_resilience
+from common.semantic_cache import SemanticCache
+from common.accounting import get_usage_ledger, track_usage
+from common.history import TokenWindowChatHistory, get_summary_cache
 
 # Env variable needed by langchain
 
 os.environ["OPENAI_API_VERSION"] = os.environ["AZURE_OPENAI_API_VERSION"]
 
+# Release the shared tool executors and pooled search connections when the server stops
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await asyncio.to_thread(shutdown_executors)
+    await aclose_search_client()  # the async client of this loop, then the sync one and those of other loops
+
+
 # Declaration of the App
 app = FastAPI(
     title="LangChain Server",
     version="1.0",
     description="A simple api server using Langchain's Runnable interfaces",
+    lifespan=lifespan,
 )
 
 
@@ -73,6 +91,49 @@ async def redirect_root_to_docs():
     return RedirectResponse("/docs")
 
 
+# Queue depth and active workers of the shared tool executors
+@app.get("/metrics/executors")
+async def get_executor_metrics():
+    return executor_stats()
+
+
+# Hit/miss counters of the shared search result cache
+@app.get("/metrics/search-cache")
+async def get_search_cache_metrics():
+    return get_search_cache().stats()
+
+
+# Hit/miss counters of the semantic answer cache (empty when it is disabled)
+@app.get("/metrics/semantic-cache")
+async def get_semantic_cache_metrics():
+    return semantic_cache.stats() if semantic_cache is not None else {}
+
+
+# Retries, hedged requests and circuit breaker state per search index
+@app.get("/metrics/search-resilience")
+async def get_search_resilience_metrics():
+    return get_search_resilience().stats()
+
+
+# How often the speculative docsearch results were used, and the latency they saved (empty when disabled)
+@app.get("/metrics/speculative-retrieval")
+async def get_speculative_retrieval_metrics():
+    return speculative_retrieval.stats() if speculative_retrieval is not None else {}
+
+
+# Tokens and estimated cost of the /agent requests: totals by user, session, deployment and tool, and the
+# last requests. session_id / user_id narrow it down to one conversation or user.
+@app.get("/metrics/token-usage")
+async def get_token_usage_metrics(session_id: Optional[str] = None, user_id: Optional[str] = None):
+    return get_usage_ledger().stats(session_id=session_id, user_id=user_id)
+
+
+# Rolling chat history summaries: reused as they were, extended with newly folded turns, or rebuilt
+@app.get("/metrics/chat-history")
+async def get_chat_history_metrics():
+    return get_summary_cache().stats()
+
+
 ###################### Simple route/chain -> just the llms
 add_routes(
     app,
@@ -133,22 +194,23 @@ def get_session_history(session_id: str, user_id: str) -> CosmosDBChatMessageHis
 
     # prepare the cosmosdb instance
     cosmos.prepare_cosmos()
-    return cosmos
+
+    # Only the last CHAT_HISTORY_MAX_TOKENS tokens of the conversation go to the brain agent, older turns
+    # as a rolling summary (0 sends the full history)
+    if CHAT_HISTORY_MAX_TOKENS <= 0:
+        return cosmos
+    return TokenWindowChatHistory(cosmos, llm=summary_llm, max_tokens=CHAT_HISTORY_MAX_TOKENS,
+                                  model=os.environ.get("AZURE_OPENAI_MODEL_NAME"), session_key=(session_id, user_id))
 
 
 # Set LLM
 llm = AzureChatOpenAI(deployment_name=os.environ.get("AZURE_OPENAI_MODEL_NAME"), temperature=0.0, max_tokens=2000, streaming=True)
 
-# Initialize our Tools/Experts
-# doc_indexes = ["srch-index-files", "srch-index-csv"]
-
-# doc_search = DocSearchAgent(llm=llm, indexes=doc_indexes,
-#                    k=6, reranker_th=1,
-#                    sas_token=os.environ['BLOB_SAS_TOKEN'],
-#                    name="docsearch",
-#                    description="useful when the questions includes the term: docsearch",
-#                    verbose=False)
+# Chat history window and the LLM folding older turns into its summary
+CHAT_HISTORY_MAX_TOKENS = int(os.environ.get("CHAT_HISTORY_MAX_TOKENS", 2000))
+summary_llm = AzureChatOpenAI(deployment_name=os.environ.get("AZURE_OPENAI_MODEL_NAME"), temperature=0.0, max_tokens=500)
 
+# Initialize our Tools/Experts
 # book_indexes = ["srch-index-books"]
 
 # book_search = DocSearchAgent(llm=llm, indexes=book_indexes,
@@ -163,7 +225,22 @@ llm = AzureChatOpenAI(deployment_name=os.environ.get("AZURE_OPENAI_MODEL_NAME"),
 #                              description="useful when the questions includes the term: bing",
 #                              verbose=False)
 
-sql_search = SQLSearchAgent(llm=llm, k=30,
+# Optional semantic cache: answers paraphrases of earlier questions without running the expert agent again
+semantic_cache = None
+if os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true":
+    semantic_cache = SemanticCache(threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.92)),
+                                   ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", 3600)))
+
+doc_indexes = os.environ.get("DOC_SEARCH_INDEXES", "srch-index-files,srch-index-csv").split(",")
+
+doc_search = DocSearchAgent(llm=llm, indexes=doc_indexes,
+                   k=6, reranker_th=1, semantic_cache=semantic_cache,
+                   sas_token=os.environ.get("BLOB_SAS_TOKEN", ""),
+                   name="docsearch",
+                   description="useful when the questions includes the term: docsearch",
+                   verbose=False)
+
+sql_search = SQLSearchAgent(llm=llm, k=30, semantic_cache=semantic_cache,
                     name="sqlsearch",
                     description="useful when the questions includes the term: sqlsearch",
                     verbose=False)
@@ -197,12 +274,26 @@ cb_manager = CallbackManager(handlers=[cb_handler])
 #                              verbose=True)
 
 
-tools = [sql_search]
+tools = [doc_search, sql_search]
 
 # Create the brain Agent
 
 agent = create_openai_tools_agent(llm, tools, CUSTOM_CHATBOT_PROMPT)
 agent_executor = AgentExecutor(agent=agent, tools=tools)
+
+# Optional speculative retrieval: the docsearch search for the raw question starts together with the routing LLM call,
+# its results are used if the brain picks the docsearch tool and cancelled otherwise
+speculative_retrieval = None
+doc_search_tools = [tool for tool in tools if isinstance(tool, DocSearchAgent)]
+if os.environ.get("SPECULATIVE_RETRIEVAL_ENABLED", "false").lower() == "true" and doc_search_tools:
+    speculative_retrieval = doc_search_tools[0].speculative_retrieval()
+    agent_executor = speculative_retrieval.wrap(agent_executor)
+
+# Token and cost accounting per request (keyed by session_id / user_id): the totals are streamed as a last
+# {"usage": ...} chunk and added to /metrics/token-usage
+if os.environ.get("TOKEN_ACCOUNTING_ENABLED", "true").lower() == "true":
+    agent_executor = track_usage(agent_executor)
+
 brain_agent_executor = RunnableWithMessageHistory(
     agent_executor,
     get_session_history,
@@ -235,6 +326,7 @@ class Input(TypedDict):
 
 class Output(BaseModel):
     output: Any
+    usage: Optional[Dict[str, Any]] = None  # tokens and estimated cost of the request
 
 # Add API route
 
@@ -0,0 +1,53 @@
+"""Document Intelligence analysis of a synthetic corpus against the local FakeDocumentAnalysisClient
+(a fixed latency per request plus a latency per page, like the service): one request per file, one file
+after the other, vs page ranges of --pages-per-request pages with several pollers in flight.
+The page maps must be identical; the speed-up follows the number of requests in flight.
+
+    python benchmarks/bench_analyze_concurrency.py --files 3 --pages 200 --in-flight 1 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_pdf_ingest import synthetic_pdf
+from common.doc_intelligence import iter_analyzed_pages
+from common.fake_doc_intelligence import FakeDocumentAnalysisClient
+
+
+def analyze(paths: list, in_flight: int, pages_per_request: int, args):
+    with FakeDocumentAnalysisClient(latency=args.latency, latency_per_page=args.latency_per_page) as client:
+        start = time.perf_counter()
+        pages = list(iter_analyzed_pages(paths, client=client, max_in_flight=in_flight,
+                                         pages_per_request=pages_per_request, cache=False))
+        ms = (time.perf_counter() - start) * 1000
+        return pages, ms, len(client.requests), client.peak_in_flight
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--pages-per-request", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--latency-per-page", type=float, default=0.01)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"doc{i}.pdf") for i in range(args.files)]
+        for i, path in enumerate(paths):
+            synthetic_pdf(path, args.pages, lines=20, seed=i)
+
+        print(f"{args.files} files x {args.pages} pages, {args.latency}s + {args.latency_per_page}s/page per request")
+        expected, sequential_ms = None, None
+        for in_flight in args.in_flight:
+            pages, ms, requests, peak = analyze(paths, in_flight, args.pages_per_request, args)
+            if expected is None:
+                expected, sequential_ms = pages, ms
+            assert pages == expected, "page texts, numbers or offsets differ"
+            print(f"  {f'{in_flight} in flight':<14} {ms:9.1f} ms  ({sequential_ms / ms:4.1f}x)"
+                  f"  {requests:3d} requests, peak {peak} in flight")
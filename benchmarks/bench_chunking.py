@@ -0,0 +1,82 @@
+"""Token-aware chunking of a synthetic page stream (documents with repeated headers and footers, as
+scanned reports have): TokenChunker with lengths tokenized every time (the length_function of a
+splitter built on tiktoken) vs the memoized TokenCounter, then on process pools of increasing size.
+The chunks must be identical.
+
+    python benchmarks/bench_chunking.py --documents 40 --pages 30 --workers 1 2 4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.chunking import TokenChunker, iter_chunks
+from common.pdf_pages import PdfPage
+from common.tokens import TokenCounter
+
+
+WORDS = ("incident response runbook the analyst escalates alerts from the security operations center after "
+         "triage containment eradication and recovery of the affected hosts and accounts").split()
+
+
+def synthetic_pages(documents: int, pages: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    stream = []
+    for d in range(documents):
+        name = f"report{d}.pdf"
+        header = f"CONFIDENTIAL - Security Operations - {name}\n"
+        offset = 0
+        for page_num in range(pages):
+            paragraphs = ["\n".join(". ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20)))
+                                              for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(2, 5)))
+                          for _ in range(rng.randint(3, 6))]
+            text = header + "\n\n".join(paragraphs) + f"\n\nPage {page_num + 1} - Internal use only\n"
+            stream.append(PdfPage(name, page_num, offset, text))
+            offset += len(text)
+    return stream
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--chunk-tokens", type=int, default=512)
+    parser.add_argument("--overlap-tokens", type=int, default=64)
+    parser.add_argument("--encoding", default="cl100k_base")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.documents, args.pages)
+    print(f"{args.documents} documents x {args.pages} pages, {sum(len(page.text) for page in pages)} characters, {os.cpu_count()} cores")
+
+    unmemoized = TokenCounter(args.encoding, memo_size=0)
+    chunker = TokenChunker(args.chunk_tokens, args.overlap_tokens, model=args.encoding, counter=unmemoized)
+    expected, unmemoized_ms = timed(lambda: list(iter_chunks(pages, chunker, max_workers=1)))
+    print(f"  {'not memoized':<16} {unmemoized_ms:9.1f} ms  {len(expected)} chunks, {unmemoized.misses} strings tokenized")
+
+    memoized = TokenCounter(args.encoding)
+    chunker = TokenChunker(args.chunk_tokens, args.overlap_tokens, model=args.encoding, counter=memoized)
+    result, ms = timed(lambda: list(iter_chunks(pages, chunker, max_workers=1)))
+    assert result == expected, "chunks differ"
+    print(f"  {'memoized':<16} {ms:9.1f} ms  ({unmemoized_ms / ms:4.1f}x)  {memoized.misses} strings tokenized,"
+          f" hit rate {memoized.stats()['hit_rate']:.0%}")
+    result, ms = timed(lambda: list(iter_chunks(pages, chunker, max_workers=1)))
+    assert result == expected, "chunks differ"
+    print(f"  {'memoized again':<16} {ms:9.1f} ms  ({unmemoized_ms / ms:4.1f}x)  same pages re-chunked (e.g. re-ingestion)")
+
+    for workers in args.workers:
+        if workers <= 1:
+            continue
+        chunker = TokenChunker(args.chunk_tokens, args.overlap_tokens, model=args.encoding, counter=TokenCounter(args.encoding))
+        result, ms = timed(lambda: list(iter_chunks(pages, chunker, max_workers=workers)))
+        assert result == expected, "chunks differ"
+        print(f"  {f'{workers} workers':<16} {ms:9.1f} ms  ({unmemoized_ms / ms:4.1f}x)")
@@ -0,0 +1,76 @@
+"""Near-duplicate elimination cost vs number of search hits. The time per hit should stay flat (linear scaling).
+
+    python benchmarks/bench_dedup.py --indexes 3 --max-hits 8000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.dedup import deduplicate
+from common.merge import StreamingMerger
+
+
+WORDS = ("azure search index chunk vector semantic reranker score query document page table "
+         "model token prompt answer source file book csv agent memory latency cost").split()
+
+
+def synthetic_results(indexes: int, hits: int, duplicate_share: float = 0.3, seed: int = 0) -> dict:
+    """hits per index; duplicate_share of them repeat an earlier chunk (any index) with one word changed"""
+    rng = random.Random(seed)
+    chunks = []
+    agg = dict()
+    for i in range(indexes):
+        index = f"index-{i}"
+        value = []
+        for j in range(hits):
+            if chunks and rng.random() < duplicate_share:
+                words = rng.choice(chunks).split()
+                words[rng.randrange(len(words))] = rng.choice(WORDS)
+                chunk = " ".join(words)
+            else:
+                chunk = " ".join(rng.choice(WORDS) for _ in range(150))
+            chunks.append(chunk)
+            value.append({"id": f"{index}-{j}", "title": "t", "name": "n", "chunk": chunk, "location": "l",
+                          "@search.captions": [{"text": "caption"}], "@search.rerankerScore": round(rng.uniform(1, 4), 4)})
+        agg[index] = {"value": value}
+    return agg
+
+
+def merge(agg: dict, k: int, dedup_threshold=None):
+    merger = StreamingMerger(k=k, reranker_threshold=1, dedup_threshold=dedup_threshold)
+    for index, search_results in agg.items():
+        merger.add(index, search_results['value'])
+    return merger.results()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--indexes", type=int, default=3)
+    parser.add_argument("--max-hits", type=int, default=8000, help="largest number of hits per index")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--k", type=int, default=50)
+    args = parser.parse_args()
+
+    hits = 500
+    while hits <= args.max_hits:
+        agg = synthetic_results(args.indexes, hits)
+        total = args.indexes * hits
+        texts = [hit["chunk"] for search_results in agg.values() for hit in search_results["value"]]
+        scores = [hit["@search.rerankerScore"] for search_results in agg.values() for hit in search_results["value"]]
+
+        kept, dedup_ms = timed(deduplicate, texts, scores, args.threshold)
+        _, plain_ms = timed(merge, agg, args.k)
+        _, merge_ms = timed(merge, agg, args.k, args.threshold)
+        print(f"{total:>6} hits  deduplicate all {dedup_ms:8.1f} ms ({dedup_ms / total * 1000:6.1f} us/hit, kept {len(kept)})  "
+              f"merge k={args.k} {plain_ms:6.1f} ms -> with dedup {merge_ms:7.1f} ms ({merge_ms / total * 1000:5.1f} us/hit)")
+        hits *= 2
@@ -0,0 +1,112 @@
+"""Document Intelligence page assembly on synthetic large layouts (long pages, many tables, overlapping
+spans and spans crossing page boundaries): the original per-character assembly of parse_pdf vs the
+page -> tables index and sorted span intervals of iter_result_pages. The outputs must be byte-identical.
+
+    python benchmarks/bench_doc_intelligence.py --pages 50 --page-length 20000 --tables 10
+"""
+import argparse
+import html
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace as NS
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.doc_intelligence import iter_result_pages
+
+
+def original_table_to_html(table):
+    table_html = "<table>"
+    rows = [sorted([cell for cell in table.cells if cell.row_index == i], key=lambda cell: cell.column_index) for i in range(table.row_count)]
+    for row_cells in rows:
+        table_html += "<tr>"
+        for cell in row_cells:
+            tag = "th" if (cell.kind == "columnHeader" or cell.kind == "rowHeader") else "td"
+            cell_spans = ""
+            if cell.column_span > 1: cell_spans += f" colSpan={cell.column_span}"
+            if cell.row_span > 1: cell_spans += f" rowSpan={cell.row_span}"
+            table_html += f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>"
+        table_html +="</tr>"
+    table_html += "</table>"
+    return table_html
+
+
+def original(form_recognizer_results):
+    """The Form Recognizer branch of parse_pdf before"""
+    offset = 0
+    page_map = []
+    for page_num, page in enumerate(form_recognizer_results.pages):
+        tables_on_page = [table for table in form_recognizer_results.tables if table.bounding_regions[0].page_number == page_num + 1]
+        page_offset = page.spans[0].offset
+        page_length = page.spans[0].length
+        table_chars = [-1]*page_length
+        for table_id, table in enumerate(tables_on_page):
+            for span in table.spans:
+                for i in range(span.length):
+                    idx = span.offset - page_offset + i
+                    if idx >=0 and idx < page_length:
+                        table_chars[idx] = table_id
+        page_text = ""
+        added_tables = set()
+        for idx, table_id in enumerate(table_chars):
+            if table_id == -1:
+                page_text += form_recognizer_results.content[page_offset + idx]
+            elif not table_id in added_tables:
+                page_text += original_table_to_html(tables_on_page[table_id])
+                added_tables.add(table_id)
+        page_text += " "
+        page_map.append((page_num, offset, page_text))
+        offset += len(page_text)
+    return page_map
+
+
+def synthetic_result(pages: int, page_length: int, tables: int, rows: int = 20, columns: int = 8, seed: int = 0):
+    """AnalyzeResult-like object: pages of page_length characters, tables with 1-3 spans each, some of
+    them overlapping the previous table or running past the end of their page"""
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz     <>&\n"
+    content = "".join(rng.choice(alphabet) for _ in range(pages * page_length))
+    result_pages, result_tables = [], []
+    for page_num in range(pages):
+        page_offset = page_num * page_length
+        result_pages.append(NS(spans=[NS(offset=page_offset, length=page_length)]))
+        for _ in range(tables):
+            spans = []
+            for _ in range(rng.randint(1, 3)):
+                start = page_offset + rng.randrange(page_length)
+                spans.append(NS(offset=start, length=rng.randint(50, 1500)))
+            cells = [NS(row_index=r, column_index=c, kind=rng.choice(["content", "columnHeader", "rowHeader"]),
+                        column_span=rng.choice([1, 1, 2]), row_span=rng.choice([1, 1, 2]), content=f"<{r}&{c}>")
+                     for r in range(rows) for c in range(columns)]
+            rng.shuffle(cells)
+            result_tables.append(NS(row_count=rows, cells=cells, spans=spans,
+                                    bounding_regions=[NS(page_number=page_num + 1)]))
+    rng.shuffle(result_tables)
+    return NS(content=content, pages=result_pages, tables=result_tables)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-length", type=int, default=20000)
+    parser.add_argument("--tables", type=int, default=10, help="tables per page")
+    args = parser.parse_args()
+
+    result = synthetic_result(args.pages, args.page_length, args.tables)
+    expected, original_ms = timed(original, result)
+    page_map, new_ms = timed(lambda: [(page.page_num, page.offset, page.text) for page in iter_result_pages(result, "doc.pdf")])
+    assert page_map == expected, "page maps differ"
+    assert "".join(text for _, _, text in page_map).encode() == "".join(text for _, _, text in expected).encode()
+
+    print(f"{args.pages} pages x {args.page_length} characters, {args.tables} tables per page, "
+          f"{sum(len(text) for _, _, text in expected)} characters out (byte-identical)")
+    print(f"  {'per-character original':<24} {original_ms:9.1f} ms")
+    print(f"  {'span intervals':<24} {new_ms:9.1f} ms  ({original_ms / new_ms:5.1f}x)")
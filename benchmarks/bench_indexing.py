@@ -0,0 +1,88 @@
+"""Pushing chunk documents to a search index, against the local fake search server with a fixed latency
+per request: one request per document (a requests call per chunk) vs IndexPusher batches of up to 1000
+with 1 and several uploads in flight, then a second push of the same corpus with a share of the chunks
+changed and some documents shortened (only those chunks are sent, the missing ones are deleted), and a
+push through a share of injected 503s with Retry-After.
+
+    python benchmarks/bench_indexing.py --chunks 20000 --latency 0.05 --workers 1 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.fake_search import FakeSearchServer
+from common.indexing import IndexManifest, IndexPusher
+from common.search_client import build_search_client
+
+
+INDEX = "bench-push"
+
+
+def synthetic_chunks(n: int, names: int = 200, version: int = 0, changed_share: float = 0.0, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(n):
+        name = f"runbook{i % names}.pdf"
+        text = f"Chunk {i} of {name}. " * 40
+        if version and rng.random() < changed_share:
+            text += f" revised in version {version}"
+        chunks.append({"id": f"chunk-{i}", "title": name, "name": name, "location": f"{name}_page_{i // names + 1}", "chunk": text})
+    return chunks
+
+
+def one_by_one(client, chunks: list) -> None:
+    for chunk in chunks:
+        client.post(f"/indexes/{INDEX}/docs/index", json={"value": [dict(chunk, **{"@search.action": "mergeOrUpload"})]}).raise_for_status()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--one-by-one", type=int, default=500, help="documents sent one per request (timed, then extrapolated)")
+    parser.add_argument("--changed", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks)
+    with FakeSearchServer() as server, tempfile.TemporaryDirectory() as tmp:
+        server.inject(INDEX, latency=args.latency)
+        client = build_search_client(endpoint=server.url, api_key="fake", api_version="2023-11-01", pool_size=32)
+        print(f"{args.chunks} chunks, {args.latency * 1000:.0f} ms per request")
+
+        _, ms = timed(one_by_one, client, chunks[:args.one_by_one])
+        per_request_ms = ms / args.one_by_one * args.chunks
+        print(f"  {'one per request':<22} {per_request_ms:9.1f} ms  (extrapolated from {args.one_by_one})")
+        for workers in args.workers:
+            pusher = IndexPusher(INDEX, client=client, max_workers=workers)
+            stats, ms = timed(pusher.push, chunks)
+            assert stats["uploaded"] == args.chunks and not stats["failed"]
+            print(f"  {f'batches, {workers} in flight':<22} {ms:9.1f} ms  ({per_request_ms / ms:5.1f}x)  {stats['batches']} requests")
+
+        workers = max(args.workers)
+        manifest = IndexManifest.for_index(INDEX, tmp)
+        IndexPusher(INDEX, manifest=manifest, client=client, max_workers=workers).push(chunks)
+        changed = synthetic_chunks(args.chunks, version=1, changed_share=args.changed)
+        changed = [chunk for i, chunk in enumerate(changed) if not (i % 200 == 7 and i >= args.chunks // 2)]  # a shorter runbook7.pdf
+        stats, ms = timed(IndexPusher(INDEX, manifest=manifest, client=client, max_workers=workers).push, changed)
+        print(f"  {'incremental push':<22} {ms:9.1f} ms  {stats['uploaded']} uploaded, {stats['unchanged']} unchanged,"
+              f" {stats['deleted']} deleted")
+        assert len(server.indexed(INDEX)) == len(changed)
+
+        server.inject(INDEX, latency=args.latency, error_rate=args.error_rate, status=503, retry_after=0.1)
+        pusher = IndexPusher(INDEX, client=client, max_workers=workers, backoff_base=0.05)
+        stats, ms = timed(pusher.push, synthetic_chunks(args.chunks, version=2, changed_share=1.0))
+        print(f"  {f'{args.error_rate:.0%} 503s':<22} {ms:9.1f} ms  {stats['uploaded']} uploaded, {stats['failed']} failed,"
+              f" {stats['throttled']} throttled, {stats['retries']} retries")
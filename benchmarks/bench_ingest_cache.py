@@ -0,0 +1,55 @@
+"""Re-ingesting an unchanged corpus with the content-addressed ingestion cache: first run (parse and
+store), second run (cache hits) and the cost of hashing the files alone, which a warm run should be close to.
+
+    python benchmarks/bench_ingest_cache.py --files 4 --pages 300 --workers 1
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_pdf_ingest import synthetic_pdf
+from common.ingest_cache import IngestionCache, file_fingerprint
+from common.pdf_pages import iter_pypdf_pages
+
+
+def ingest(paths: list, cache, workers: int) -> list:
+    return [(page.source, page.offset, page.text) for page in iter_pypdf_pages(paths, max_workers=workers, cache=cache)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"doc{i}.pdf") for i in range(args.files)]
+        for i, path in enumerate(paths):
+            synthetic_pdf(path, args.pages, seed=i)
+        cache = IngestionCache(os.path.join(tmp, "cache"))
+
+        expected, uncached_ms = timed(ingest, paths, False, args.workers)
+        cold, cold_ms = timed(ingest, paths, cache, args.workers)
+        warm, warm_ms = timed(ingest, paths, cache, args.workers)
+        _, hash_ms = timed(lambda: [file_fingerprint(path) for path in paths])
+        assert expected == cold == warm, "cached pages differ"
+
+        corpus_mb = sum(os.path.getsize(path) for path in paths) / 2 ** 20
+        cache_mb = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(cache.directory) for name in names) / 2 ** 20
+        print(f"{args.files} files x {args.pages} pages ({corpus_mb:.1f} MB of PDF, {cache_mb:.1f} MB cached), {args.workers} workers")
+        print(f"  {'no cache':<22} {uncached_ms:9.1f} ms")
+        print(f"  {'cold cache (store)':<22} {cold_ms:9.1f} ms")
+        print(f"  {'warm cache (hits)':<22} {warm_ms:9.1f} ms  ({uncached_ms / warm_ms:5.1f}x)")
+        print(f"  {'hashing only':<22} {hash_ms:9.1f} ms")
+        print(f"  {cache.stats()}")
@@ -0,0 +1,85 @@
+"""Sort-then-truncate merge (the original get_search_results) vs the bounded-heap StreamingMerger.
+
+    python benchmarks/bench_merge.py --hits 2000 --indexes 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.merge import StreamingMerger
+
+
+def sort_then_truncate(agg_search_results: dict, k: int, reranker_threshold: float = 1, sas_token: str = "") -> OrderedDict:
+    """The merge step of get_search_results before the streaming merger"""
+    content = dict()
+    ordered_content = OrderedDict()
+    for index, search_results in agg_search_results.items():
+        for result in search_results['value']:
+            if result['@search.rerankerScore'] > reranker_threshold:
+                content[result['id']] = {
+                                        "title": result['title'],
+                                        "name": result['name'],
+                                        "chunk": result['chunk'],
+                                        "location": result['location'] + sas_token if result['location'] else "",
+                                        "caption": result['@search.captions'][0]['text'],
+                                        "score": result['@search.rerankerScore'],
+                                        "index": index
+                                    }
+    count = 0
+    for id in sorted(content, key=lambda x: content[x]["score"], reverse=True):
+        ordered_content[id] = content[id]
+        count += 1
+        if count >= k:
+            break
+    return ordered_content
+
+
+def streaming(agg_search_results: dict, k: int, strategy: str = "score") -> OrderedDict:
+    merger = StreamingMerger(k=k, strategy=strategy, reranker_threshold=1)
+    for index, search_results in agg_search_results.items():
+        merger.add(index, search_results['value'])
+    return merger.results()
+
+
+def synthetic_results(indexes: int, hits: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    agg = dict()
+    for i in range(indexes):
+        index = f"index-{i}"
+        scores = sorted((round(rng.uniform(0, 4), 4) for _ in range(hits)), reverse=True)
+        agg[index] = {"value": [{"id": f"{index}-{j}", "title": "t", "name": "n", "chunk": "c" * 1000, "location": "l",
+                                 "@search.captions": [{"text": "caption"}], "@search.rerankerScore": score}
+                                for j, score in enumerate(scores)]}
+    return agg
+
+
+def measure(fn, *args, repeat: int = 20):
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat * 1000, peak / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--indexes", type=int, default=3)
+    parser.add_argument("--hits", type=int, default=2000, help="hits returned per index")
+    args = parser.parse_args()
+
+    agg = synthetic_results(args.indexes, args.hits)
+    for k in (100, 300, 500):
+        assert list(sort_then_truncate(agg, k)) == list(streaming(agg, k)), "rankings differ"
+        for name, fn, extra in [("sort+truncate", sort_then_truncate, ()), ("heap score", streaming, ("score",)),
+                                ("heap rrf", streaming, ("rrf",)), ("heap minmax", streaming, ("minmax",))]:
+            ms, kib = measure(fn, agg, k, *extra)
+            print(f"k={k:<4} {name:<14} {ms:8.2f} ms  peak {kib:9.1f} KiB")
@@ -0,0 +1,114 @@
+"""PDF text extraction of a synthetic corpus (a few documents of several hundred pages): the original
+one-file-after-another read_pdf_files loop vs iter_pypdf_pages on process pools of increasing size.
+The speed-up follows the number of cores; on a single core the pool only adds its overhead.
+Then the peak memory of building the read_pdf_files lists vs streaming the pages to a consumer.
+
+    python benchmarks/bench_pdf_ingest.py --files 4 --pages 300 --workers 1 2 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.pdf_pages import iter_pypdf_pages
+
+
+WORDS = ("the azure document intelligence service extracts text tables and layout from scanned forms "
+         "invoices contracts and research papers before they are chunked embedded and indexed").split()
+
+
+def synthetic_pdf(path: str, pages: int, lines: int = 60, seed: int = 0) -> None:
+    """PDF of pages pages with lines lines of Helvetica text each"""
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({NameObject("/Type"): NameObject("/Font"), NameObject("/Subtype"): NameObject("/Type1"),
+                                                NameObject("/BaseFont"): NameObject("/Helvetica")}))
+    for _ in range(pages):
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        text = " ".join("(" + " ".join(rng.choice(WORDS) for _ in range(12)) + ") '" for _ in range(lines))
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 9 Tf 11 TL 40 770 Td {text} ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def original(files: list) -> list:
+    """read_pdf_files before: PdfReader + extract_text, one page after another"""
+    text_list, sources_list = [], []
+    for file in files:
+        offset = 0
+        page_map = []
+        for page_num, p in enumerate(PdfReader(file).pages):
+            page_text = p.extract_text()
+            page_map.append((page_num, offset, page_text))
+            offset += len(page_text)
+        for page_num, _, page_text in page_map:
+            text_list.append(page_text)
+            sources_list.append(file.name + "_page_" + str(page_num + 1))
+    return [text_list, sources_list]
+
+
+def parallel(files: list, workers: int, pages_per_task: int) -> list:
+    text_list, sources_list = [], []
+    for page in iter_pypdf_pages(files, max_workers=workers, pages_per_task=pages_per_task):
+        text_list.append(page.text)
+        sources_list.append(page.source)
+    return [text_list, sources_list]
+
+
+def streamed(files: list) -> int:
+    """A consumer that handles each page as it comes (here, counting characters) instead of keeping them"""
+    return sum(len(page.text) for page in iter_pypdf_pages(files, max_workers=1))
+
+
+def peak_memory_mb(fn, *args) -> float:
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pages-per-task", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"doc{i}.pdf") for i in range(args.files)]
+        for i, path in enumerate(paths):
+            synthetic_pdf(path, args.pages, seed=i)
+
+        files = [open(path, "rb") for path in paths]
+        expected, original_ms = timed(original, files)
+        print(f"{args.files} files x {args.pages} pages, {sum(map(len, expected[0]))} characters, {os.cpu_count()} cores")
+        print(f"  {'original loop':<20} {original_ms:9.1f} ms")
+        for workers in args.workers:
+            result, ms = timed(parallel, files, workers, args.pages_per_task)
+            assert result == expected, "page texts or sources differ"
+            print(f"  {f'{workers} workers':<20} {ms:9.1f} ms  ({original_ms / ms:4.1f}x)")
+
+        print("Peak Python memory, in process:")
+        print(f"  {'read_pdf_files lists':<20} {peak_memory_mb(original, files):9.1f} MB")
+        print(f"  {'streamed pages':<20} {peak_memory_mb(streamed, files):9.1f} MB")
+        for f in files:
+            f.close()
@@ -0,0 +1,101 @@
+"""Search latency tails with and without hedged requests, plus retries and the circuit breaker,
+against the fake search server with injected latency and errors.
+
+    python benchmarks/bench_resilience.py --requests 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.fake_search import FakeSearchServer
+from common.resilience import SearchResilience, SearchUnavailable
+from common.search_client import build_async_search_client, build_search_client
+
+
+def search_sender(client, index: str):
+    body = json.dumps({"search": "question", "top": 5})
+
+    def send(timeout):
+        return client.post("/indexes/" + index + "/docs/search", content=body, timeout=timeout)
+    return send
+
+
+def percentiles(latencies: list) -> str:
+    ordered = sorted(latencies)
+    p = lambda q: ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * 1000
+    return f"p50 {p(50):7.1f} ms  p95 {p(95):7.1f} ms  p99 {p(99):7.1f} ms  max {ordered[-1] * 1000:7.1f} ms"
+
+
+def run_tail(client, policy: SearchResilience, requests: int) -> list:
+    send = search_sender(client, "slow-index")
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        policy.call("slow-index", send)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def arun_tail(server_url: str, policy: SearchResilience, requests: int) -> list:
+    client = build_async_search_client(endpoint=server_url, api_key="fake")
+    body = json.dumps({"search": "question", "top": 5})
+
+    async def send(timeout):
+        return await client.post("/indexes/slow-index/docs/search", content=body, timeout=timeout)
+
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        await policy.acall("slow-index", send)
+        latencies.append(time.perf_counter() - started)
+    await client.aclose()
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="share of calls answered slowly")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="extra seconds of a slow call")
+    args = parser.parse_args()
+
+    with FakeSearchServer() as server:
+        client = build_search_client(endpoint=server.url, api_key="fake", pool_size=8)
+
+        server.inject("slow-index", latency=0.005, slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+        print("Latency tail,", args.requests, "sequential calls with", f"{args.slow_rate:.0%} slow answers")
+        for name, policy in [("no hedging", SearchResilience(hedge=False)), ("hedged after p95", SearchResilience(hedge=True))]:
+            print(f"  sync  {name:<17} {percentiles(run_tail(client, policy, args.requests))}  {policy.stats()['hedges']} hedges")
+            policy = SearchResilience(hedge=policy.hedge)
+            latencies = asyncio.run(arun_tail(server.url, policy, args.requests))
+            print(f"  async {name:<17} {percentiles(latencies)}  {policy.stats()['hedges']} hedges")
+
+        server.inject("throttled-index", fail_next=2, status=429, retry_after=0.2)
+        policy = SearchResilience(max_attempts=3)
+        started = time.perf_counter()
+        result = policy.call("throttled-index", search_sender(client, "throttled-index"))
+        print(f"429 twice with Retry-After 0.2s: {len(result['value'])} results after {policy.stats()['retries']} retries "
+              f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        server.inject("broken-index", error_rate=1.0, status=503)
+        policy = SearchResilience(max_attempts=2, backoff_base=0.01, failure_threshold=3, reset_timeout=0.5)
+        outcomes = []
+        for _ in range(6):
+            try:
+                policy.call("broken-index", search_sender(client, "broken-index"))
+                outcomes.append("ok")
+            except SearchUnavailable as e:
+                outcomes.append(e.reason.split(" after")[0])
+        broken_requests = sum(1 for method, path in server.requests if "broken-index" in path)
+        print(f"Always 503: {outcomes} -> {broken_requests} requests sent, circuit {policy.breaker('broken-index').state}")
+        server.clear_faults()
+        time.sleep(0.5)
+        policy.call("broken-index", search_sender(client, "broken-index"))
+        print(f"After recovery and reset_timeout: circuit {policy.breaker('broken-index').state}")
+        client.close()
@@ -0,0 +1,78 @@
+"""Per-query cost of a fresh connection (what a bare requests.post does) vs the pooled keep-alive client.
+
+Runs against the local fake search server by default. Point it at a real service with --endpoint
+(AZURE_SEARCH_KEY / AZURE_SEARCH_API_VERSION are read from the environment) to include the TLS handshake.
+
+    python benchmarks/bench_search_client.py --queries 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.fake_search import FakeSearchServer
+from common.search_client import build_search_client
+
+
+PAYLOAD = json.dumps({"search": "tickets del cliente Procesar", "top": 5})
+
+
+def run_fresh(endpoint: str, index: str, queries: int) -> list:
+    headers = {'Content-Type': 'application/json', 'api-key': os.environ.get("AZURE_SEARCH_KEY", "fake")}
+    params = {'api-version': os.environ.get("AZURE_SEARCH_API_VERSION", "2023-11-01")}
+    timings = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        # New client per call: one TCP (+TLS) handshake per query
+        with httpx.Client() as client:
+            client.post(endpoint + "/indexes/" + index + "/docs/search", content=PAYLOAD, headers=headers, params=params)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_pooled(endpoint: str, index: str, queries: int) -> list:
+    client = build_search_client(endpoint=endpoint,
+                                 api_key=os.environ.get("AZURE_SEARCH_KEY", "fake"),
+                                 api_version=os.environ.get("AZURE_SEARCH_API_VERSION", "2023-11-01"))
+    timings = []
+    with client:
+        for _ in range(queries):
+            start = time.perf_counter()
+            client.post("/indexes/" + index + "/docs/search", content=PAYLOAD)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list, connections=None):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[int(len(timings_ms) * 0.95) - 1]
+    line = f"{name:<8} mean {statistics.mean(timings_ms):7.3f} ms  p50 {statistics.median(timings_ms):7.3f} ms  p95 {p95:7.3f} ms"
+    if connections is not None:
+        line += f"  connections {connections}"
+    print(line)
+    return statistics.mean(timings_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index", default="srch-index-files")
+    parser.add_argument("--endpoint", default=None, help="Real Azure AI Search endpoint (default: local fake server)")
+    args = parser.parse_args()
+
+    if args.endpoint:
+        fresh = report("fresh", run_fresh(args.endpoint, args.index, args.queries))
+        pooled = report("pooled", run_pooled(args.endpoint, args.index, args.queries))
+    else:
+        with FakeSearchServer() as server:
+            fresh = report("fresh", run_fresh(server.url, args.index, args.queries), server.connections)
+            before = server.connections
+            pooled = report("pooled", run_pooled(server.url, args.index, args.queries), server.connections - before)
+
+    print(f"handshake savings per query: {fresh - pooled:.3f} ms ({fresh / pooled:.1f}x)")
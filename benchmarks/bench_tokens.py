@@ -0,0 +1,67 @@
+"""Token counting of thousands of chunks: per-call tiktoken.get_encoding + encode (the original
+num_tokens_from_string loop) vs the cached, batched and memoized TokenCounter.
+
+    python benchmarks/bench_tokens.py --chunks 5000 --encoding cl100k_base
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import tiktoken
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.tokens import TokenCounter
+
+
+WORDS = ("the azure search index returns chunks of documents with scores and captions that the agent "
+         "packs into the prompt before calling the model deployment for an answer").split()
+
+
+def synthetic_chunks(n: int, words: int = 300, repeat_share: float = 0.2, seed: int = 0) -> list:
+    """n chunks of about words words; repeat_share of them repeat an earlier chunk (same page indexed twice)"""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(n):
+        if chunks and rng.random() < repeat_share:
+            chunks.append(rng.choice(chunks))
+        else:
+            chunks.append(" ".join(rng.choice(WORDS) for _ in range(words)) + f" {rng.random()}")
+    return chunks
+
+
+def original(chunks: list, encoding_name: str) -> list:
+    return [len(tiktoken.get_encoding(encoding_name).encode(chunk)) for chunk in chunks]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--encoding", default="cl100k_base", help="cl100k_base or o200k_base")
+    parser.add_argument("--threads", type=int, default=min(8, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks, args.words)
+    tiktoken.get_encoding(args.encoding)  # download / load outside of the timings
+
+    expected, original_ms = timed(original, chunks, args.encoding)
+    counter = TokenCounter(args.encoding, num_threads=1)
+    one_by_one, one_by_one_ms = timed(lambda: [counter.count(chunk) for chunk in chunks])
+    counter = TokenCounter(args.encoding, num_threads=args.threads)
+    batched, batched_ms = timed(counter.count_many, chunks)
+    memoized, memoized_ms = timed(counter.count_many, chunks)
+    assert expected == one_by_one == batched == memoized, "token counts differ"
+
+    print(f"{args.chunks} chunks, {sum(expected)} {args.encoding} tokens")
+    for name, ms in [("original loop", original_ms), ("counter, one by one", one_by_one_ms),
+                     (f"count_many, {args.threads} threads", batched_ms), ("count_many, memoized", memoized_ms)]:
+        print(f"  {name:<24} {ms:9.1f} ms  ({original_ms / ms:5.1f}x)")
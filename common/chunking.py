@@ -0,0 +1,219 @@
+import os
+import bisect
+import hashlib
+from itertools import groupby
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from .tokens import TokenCounter, get_token_counter
+except Exception:
+    from tokens import TokenCounter, get_token_counter
+
+
+DEFAULT_CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", 512))
+DEFAULT_CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 64))
+DEFAULT_CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", 1))
+INDEX_BATCH_SIZE = 1000  # most documents Azure AI Search takes in one index request
+
+# Paragraphs, lines, sentences, words; text with none of them is cut in halves
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+class Chunk(NamedTuple):
+    """A piece of a document ready to index: offset is where text starts in the document (the page
+    offsets of the page map), first_page and last_page the pages (0-based) it comes from"""
+    id: str
+    name: str
+    chunk_num: int
+    text: str
+    tokens: int
+    offset: int
+    first_page: int
+    last_page: int
+
+    @property
+    def location(self) -> str:
+        """Source name of the first page, as read_pdf_files names it"""
+        return self.name + "_page_" + str(self.first_page + 1)
+
+    def to_document(self, source_field: Optional[str] = None) -> dict:
+        """Search index document (the id, title, name, location, chunk fields of the notebook indexes), plus
+        the full path of the file in source_field when given (IndexPusher keeps it out of the index)"""
+        title = os.path.basename(self.name)
+        document = {"id": self.id, "title": title, "name": title, "location": self.location, "chunk": self.text}
+        if source_field:
+            document[source_field] = self.name
+        return document
+
+
+def chunk_id(name: str, text: str, occurrence: int = 0) -> str:
+    """Index key of a chunk, from its document and its text (occurrence tells repeats of the same text in
+    the document apart), and only made of characters keys allow. Editing a document only changes the keys
+    of the chunks whose text changed: the later chunks keep theirs and are not pushed again."""
+    return hashlib.sha256(f"{name}\x00{occurrence}\x00{text}".encode("utf-8")).hexdigest()[:40]
+
+
+class TokenChunker:
+    """Splits documents into chunks of at most chunk_tokens tokens, consecutive chunks sharing about
+    overlap_tokens tokens.
+
+    Each page is split recursively on paragraphs, lines, sentences and words until every piece fits,
+    then pieces are merged greedily across pages. Lengths come from a TokenCounter (the shared, memoized
+    one of model by default), so every piece is tokenized once and text repeated across pages and
+    documents (headers, footers, boilerplate) is not tokenized again. The merge adds up piece counts, as
+    RecursiveCharacterTextSplitter does; Chunk.tokens is the exact count of the chunk text.
+
+        chunker = TokenChunker(chunk_tokens=512, overlap_tokens=64, model="text-embedding-ada-002")
+        chunks = chunker.split_document(name, [text for _, _, text in parse_pdf(file)])
+    """
+
+    def __init__(self, chunk_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_CHUNK_OVERLAP,
+                 model: Optional[str] = None, counter=None, separators: Sequence[str] = SEPARATORS):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError(f"overlap_tokens ({overlap_tokens}) must be smaller than chunk_tokens ({chunk_tokens})")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.model = model
+        self.separators = tuple(separators)
+        self._counter = counter
+
+    @property
+    def counter(self):
+        """Anything with count(text) -> int; get_token_counter(model) by default"""
+        if self._counter is None:
+            self._counter = get_token_counter(self.model)
+        return self._counter
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if isinstance(state["_counter"], TokenCounter):
+            state["_counter"] = None  # a worker process uses its own shared counter (and memo)
+        return state
+
+    def _split(self, text: str, start: int, end: int, separators: Tuple[str, ...], pieces: list) -> None:
+        """Appends (start, end, tokens) pieces of text[start:end] that fit in chunk_tokens, in order"""
+        count = self.counter.count
+        tokens = count(text[start:end])
+        if tokens <= self.chunk_tokens or end - start <= 1:
+            pieces.append((start, end, tokens))
+            return
+        while separators and text.find(separators[0], start, end) < 0:
+            separators = separators[1:]
+        if not separators:
+            middle = (start + end) // 2
+            self._split(text, start, middle, (), pieces)
+            self._split(text, middle, end, (), pieces)
+            return
+        separator, rest = separators[0], separators[1:]
+        position = start
+        while position < end:
+            found = text.find(separator, position, end)
+            stop = end if found < 0 else found + len(separator)  # the separator stays with the piece before it
+            self._split(text, position, stop, rest, pieces)
+            position = stop
+
+    def split_document(self, name: str, texts: Iterable[str]) -> List[Chunk]:
+        """Chunks of one document from the texts of its pages, in order"""
+        texts = list(texts)
+        text = "".join(texts)
+        page_starts = []
+        pieces = []
+        offset = 0
+        for page_text in texts:
+            page_starts.append(offset)
+            if page_text:
+                self._split(text, offset, offset + len(page_text), self.separators, pieces)
+            offset += len(page_text)
+
+        chunks = []
+        occurrences = dict()
+        i = 0
+        while i < len(pieces):
+            j = i
+            total = 0
+            while j < len(pieces) and (j == i or total + pieces[j][2] <= self.chunk_tokens):
+                total += pieces[j][2]
+                j += 1
+            self._add_chunk(chunks, occurrences, name, text, pieces[i][0], pieces[j - 1][1], page_starts)
+            if j == len(pieces):
+                break
+            # Step back over the last pieces of the chunk that fit in the overlap, always moving forward, and
+            # only when the next piece still fits after them (else the next chunk would be the overlap alone)
+            k = j
+            overlap = 0
+            while k - 1 > i and overlap + pieces[k - 1][2] <= self.overlap_tokens:
+                k -= 1
+                overlap += pieces[k][2]
+            i = k if overlap + pieces[j][2] <= self.chunk_tokens else j
+        return chunks
+
+    def _add_chunk(self, chunks: list, occurrences: dict, name: str, text: str, start: int, end: int, page_starts: list) -> None:
+        chunk_text = text[start:end]
+        stripped = chunk_text.strip()
+        if not stripped:
+            return
+        start += len(chunk_text) - len(chunk_text.lstrip())
+        end = start + len(stripped)
+        chunk_num = len(chunks)
+        occurrence = occurrences[stripped] = occurrences.get(stripped, -1) + 1
+        chunks.append(Chunk(chunk_id(name, stripped, occurrence), name, chunk_num, stripped, self.counter.count(stripped), start,
+                            bisect.bisect_right(page_starts, start) - 1, bisect.bisect_right(page_starts, end - 1) - 1))
+
+
+def _split_document(chunker: TokenChunker, name: str, texts: List[str]) -> List[Chunk]:
+    return chunker.split_document(name, texts)
+
+
+def iter_documents(pages) -> Iterator[Tuple[str, List[str]]]:
+    """(name, page texts) of the documents of a page stream (PdfPage or anything with .name and .text)"""
+    for name, document_pages in groupby(pages, key=lambda page: page.name):
+        yield name, [page.text for page in document_pages]
+
+
+def iter_chunks(pages, chunker: Optional[TokenChunker] = None, max_workers: Optional[int] = None,
+                max_pending: Optional[int] = None) -> Iterator[Chunk]:
+    """Yields the chunks of a page stream (iter_pdf_files, iter_pypdf_pages, ...) in order, one document
+    at a time.
+
+    With max_workers > 1 (default CHUNK_WORKERS, 1) documents are split on a process pool, at most
+    max_pending documents (2 per worker) ahead of the consumer, so pages keep streaming in while earlier
+    documents are chunked. Each worker memoizes the token counts of the documents it has seen.
+
+        for batch in iter_index_batches(iter_chunks(iter_pdf_files(files), max_workers=4)):
+            upload(batch)
+    """
+    chunker = chunker or TokenChunker()
+    max_workers = DEFAULT_CHUNK_WORKERS if max_workers is None else max_workers
+    if max_workers <= 1:
+        for name, texts in iter_documents(pages):
+            yield from chunker.split_document(name, texts)
+        return
+
+    max_pending = max_pending or 2 * max_workers
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+    documents = iter_documents(pages)
+    pending = deque()
+    try:
+        for name, texts in documents:
+            pending.append(pool.submit(_split_document, chunker, name, texts))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # The consumer may stop early: drop the queued documents instead of splitting them
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_index_batches(chunks: Iterable[Chunk], batch_size: int = INDEX_BATCH_SIZE) -> Iterator[List[dict]]:
+    """Search index documents of the chunks in lists of at most batch_size (1000, the service limit)"""
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk.to_document())
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
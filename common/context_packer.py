@@ -0,0 +1,104 @@
+import re
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Iterator, List, Tuple
+
+from langchain_core.documents import Document
+
+try:
+    from .tokens import DEFAULT_ENCODING, count_tokens, get_token_counter
+except Exception:
+    from tokens import DEFAULT_ENCODING, count_tokens, get_token_counter
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PackedContext:
+    """Documents that fit the token budget, in score order, with what was kept and dropped"""
+    documents: List[Document] = field(default_factory=list)
+    tokens_used: int = 0
+    tokens_dropped: int = 0
+    truncated: int = 0  # documents cut at a sentence boundary
+    dropped: int = 0    # documents left out entirely
+
+    def report(self) -> dict:
+        return {"documents": len(self.documents), "tokens_used": self.tokens_used, "tokens_dropped": self.tokens_dropped,
+                "truncated": self.truncated, "dropped": self.dropped}
+
+
+def _sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) offsets of the sentences of text, the whitespace between them left out"""
+    start = 0
+    for boundary in _SENTENCE_END.finditer(text):
+        yield start, boundary.start()
+        start = boundary.end()
+    yield start, len(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    """Longest run of whole leading sentences of text within max_tokens ("" when the first sentence does not fit).
+    The result is a prefix of text, so the newlines and spacing between the kept sentences are unchanged."""
+    ends = []
+    used = 0
+    for start, end in _sentence_spans(text):
+        tokens = count_tokens(text[start:end], encoding_name)
+        if used + tokens > max_tokens:
+            break
+        ends.append(end)
+        used += tokens
+    # Sentences encoded one by one can merge differently with the text between them, trim until the prefix fits
+    while ends and count_tokens(text[:ends[-1]], encoding_name) > max_tokens:
+        ends.pop()
+    return text[:ends[-1]] if ends else ""
+
+
+def pack_context(documents: List[Document], max_tokens: int, encoding_name: str = DEFAULT_ENCODING,
+                 min_tokens: int = 32) -> PackedContext:
+    """Fills a token budget with the page_content of ranked documents, greedily by metadata["score"].
+
+    A document that does not fit whole is cut at the last sentence boundary that fits, as long as at
+    least min_tokens of budget are left; otherwise it is dropped and the next (smaller) ones are tried.
+    Truncated copies carry metadata["truncated"] = True, the input documents are not changed.
+
+        packed = pack_context(retriever.invoke(question), max_tokens=3000)
+        packed.documents, packed.report()
+    """
+    packed = PackedContext()
+    ranked = sorted(documents, key=lambda doc: doc.metadata.get("score", 0), reverse=True)
+    doc_tokens = get_token_counter(encoding_name).count_many(doc.page_content for doc in ranked)
+    for doc, tokens in zip(ranked, doc_tokens):
+        remaining = max_tokens - packed.tokens_used
+        if tokens <= remaining:
+            packed.documents.append(doc)
+            packed.tokens_used += tokens
+            continue
+
+        content = truncate_to_tokens(doc.page_content, remaining, encoding_name) if remaining >= min_tokens else ""
+        if content:
+            kept = count_tokens(content, encoding_name)
+            packed.documents.append(Document(page_content=content, metadata=dict(doc.metadata, truncated=True)))
+            packed.tokens_used += kept
+            packed.tokens_dropped += tokens - kept
+            packed.truncated += 1
+        else:
+            packed.tokens_dropped += tokens
+            packed.dropped += 1
+
+    return packed
+
+
+def pack_documents(documents: List[Document], max_tokens: int, encoding_name: str = DEFAULT_ENCODING,
+                   run_manager=None) -> List[Document]:
+    """pack_context(documents, max_tokens).documents, with the report (tokens used and dropped) logged at
+    INFO and, given a callback run_manager (e.g. of a tool run), sent to its on_text so it shows in the trace"""
+    packed = pack_context(documents, max_tokens, encoding_name)
+    report = packed.report()
+    logger.info("Context packed into %d tokens: %s", max_tokens, report)
+    if run_manager is not None:
+        run_manager.on_text(f"Context packed into {max_tokens} tokens: {json.dumps(report)}\n")
+    return packed.documents
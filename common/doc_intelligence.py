@@ -0,0 +1,170 @@
+import os
+import html
+import heapq
+from io import BytesIO
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional
+
+from pypdf import PdfWriter
+
+try:
+    from .pdf_pages import PdfPage, iter_page_jobs, iter_range_jobs, open_pdf
+    from .ingest_cache import resolve_cache
+except Exception:
+    from pdf_pages import PdfPage, iter_page_jobs, iter_range_jobs, open_pdf
+    from ingest_cache import resolve_cache
+
+
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("DOC_INTELLIGENCE_MAX_IN_FLIGHT", 1))
+DEFAULT_PAGES_PER_REQUEST = int(os.environ.get("DOC_INTELLIGENCE_PAGES_PER_REQUEST", 50))
+
+
+def table_to_html(table) -> str:
+    """HTML of a Document Intelligence table, cells grouped by row in one pass"""
+    cells_by_row = defaultdict(list)
+    for cell in table.cells:
+        cells_by_row[cell.row_index].append(cell)
+    parts = ["<table>"]
+    for i in range(table.row_count):
+        parts.append("<tr>")
+        for cell in sorted(cells_by_row.get(i, ()), key=lambda cell: cell.column_index):
+            tag = "th" if (cell.kind == "columnHeader" or cell.kind == "rowHeader") else "td"
+            cell_spans = ""
+            if cell.column_span > 1: cell_spans += f" colSpan={cell.column_span}"
+            if cell.row_span > 1: cell_spans += f" rowSpan={cell.row_span}"
+            parts.append(f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>")
+        parts.append("</tr>")
+    parts.append("</table>")
+    return "".join(parts)
+
+
+def tables_by_page(tables) -> Dict[int, list]:
+    """Tables of an analyze result by the page number (1-based) of their first bounding region, in result order"""
+    index = defaultdict(list)
+    for table in tables:
+        index[table.bounding_regions[0].page_number].append(table)
+    return index
+
+
+def assemble_page_text(content: str, page, tables_on_page: list, to_html: Callable = table_to_html) -> str:
+    """Text of a page with the characters covered by table spans replaced by the table HTML, emitted once
+    where the table starts. Where spans of several tables overlap, the later table of the page owns the
+    characters (as the per-character marking did).
+
+    The table spans are sorted into intervals and walked once, emitting slices of content between them,
+    so the cost grows with the number of spans, not with the page length times the number of tables.
+    """
+    page_offset = page.spans[0].offset
+    page_length = page.spans[0].length
+    intervals = []
+    for table_id, table in enumerate(tables_on_page):
+        for span in table.spans:
+            start = max(span.offset - page_offset, 0)
+            end = min(span.offset - page_offset + span.length, page_length)
+            if start < end:
+                intervals.append((start, table_id, end))
+    intervals.sort()
+
+    parts = []
+    added_tables = set()
+    active = []  # heap of (-table_id, end): the highest table id covering the position is on top
+    position = 0
+    i = 0
+    while position < page_length:
+        while i < len(intervals) and intervals[i][0] <= position:
+            _, table_id, end = intervals[i]
+            heapq.heappush(active, (-table_id, end))
+            i += 1
+        while active and active[0][1] <= position:
+            heapq.heappop(active)
+        next_start = intervals[i][0] if i < len(intervals) else page_length
+        if not active:
+            parts.append(content[page_offset + position:page_offset + next_start])
+            position = next_start
+            continue
+        table_id = -active[0][0]
+        if table_id not in added_tables:
+            parts.append(to_html(tables_on_page[table_id]))
+            added_tables.add(table_id)
+        position = min(next_start, active[0][1])
+    return "".join(parts)
+
+
+def iter_result_pages(result, name: str) -> Iterator[PdfPage]:
+    """Pages of an analyze result (AnalyzeResult) one at a time, tables as HTML, each text followed by a space"""
+    page_tables = tables_by_page(result.tables or [])
+    offset = 0
+    for page_num, page in enumerate(result.pages):
+        page_text = assemble_page_text(result.content, page, page_tables.get(page_num + 1, [])) + " "
+        yield PdfPage(name, page_num, offset, page_text)
+        offset += len(page_text)
+
+
+def build_document_analysis_client(endpoint: Optional[str] = None, key: Optional[str] = None):
+    """DocumentAnalysisClient of FORM_RECOGNIZER_ENDPOINT / FORM_RECOGNIZER_KEY (or the given ones)"""
+    from azure.ai.formrecognizer import DocumentAnalysisClient
+    from azure.core.credentials import AzureKeyCredential
+    return DocumentAnalysisClient(endpoint=endpoint or os.environ["FORM_RECOGNIZER_ENDPOINT"],
+                                  credential=AzureKeyCredential(key or os.environ["FORM_RECOGNIZER_KEY"]))
+
+
+def document_intelligence_version(model: str) -> dict:
+    """Cache version key of Document Intelligence analysis"""
+    return {"parser": "document-intelligence", "model": model}
+
+
+def pdf_page_range(source, start: int, stop: int) -> bytes:
+    """The pages [start, stop) of a PDF (path or bytes) as a PDF of their own, written with PdfWriter"""
+    reader = open_pdf(source)
+    writer = PdfWriter()
+    for page_num in range(start, stop):
+        writer.add_page(reader.pages[page_num])
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class AnalysisJob:
+    """A running begin_analyze_document poller; result() waits for it and returns the text of its pages"""
+
+    def __init__(self, poller):
+        self.poller = poller
+
+    def result(self) -> List[str]:
+        return [page.text for page in iter_result_pages(self.poller.result(), "")]
+
+
+def iter_analyzed_pages(files, client=None, model: str = "prebuilt-document", max_in_flight: Optional[int] = None,
+                        pages_per_request: Optional[int] = None, cache=None) -> Iterator[PdfPage]:
+    """Yields the pages of the PDFs analyzed by Document Intelligence, one at a time and in order.
+
+    With max_in_flight > 1 (default DOC_INTELLIGENCE_MAX_IN_FLIGHT, 1), PDFs longer than pages_per_request
+    pages (DOC_INTELLIGENCE_PAGES_PER_REQUEST, 50) are split into page ranges with PdfWriter, and up to
+    max_in_flight begin_analyze_document pollers run at once, across ranges and files. The pages of the
+    ranges are stitched back with offsets counted from the first page of their file, as one request would.
+    A table running across two ranges comes back as two tables, one per range. Files that are not PDFs
+    (images, Office documents) are sent whole, and PDFs are only opened to count their pages when split.
+
+    client is anything with begin_analyze_document(model, document=...) (DocumentAnalysisClient by default,
+    FakeDocumentAnalysisClient in tests and benchmarks). Files in the ingestion cache are not sent.
+
+        for page in iter_analyzed_pages(files, max_in_flight=8): ...
+    """
+    max_in_flight = DEFAULT_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+    if max_in_flight <= 1:
+        pages_per_request = 0  # one request per file, one file after the other
+    client = client or build_document_analysis_client()
+    cache = resolve_cache(cache)
+    version = document_intelligence_version(model)
+
+    def start_job(source, start: int, stop: Optional[int], page_count: Optional[int]) -> AnalysisJob:
+        if page_count is not None and (start > 0 or stop < page_count):
+            return AnalysisJob(client.begin_analyze_document(model, document=pdf_page_range(source, start, stop)))
+        if isinstance(source, str):
+            with open(source, "rb") as document:
+                return AnalysisJob(client.begin_analyze_document(model, document=document))
+        return AnalysisJob(client.begin_analyze_document(model, document=source))
+
+    jobs = iter_range_jobs(files, DEFAULT_PAGES_PER_REQUEST if pages_per_request is None else pages_per_request, cache,
+                           version, start_job)
+    yield from iter_page_jobs(jobs, max_in_flight, cache, version)
@@ -0,0 +1,110 @@
+import os
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+
+DEFAULT_MAX_WORKERS = int(os.environ.get("TOOL_EXECUTOR_MAX_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+
+_executors = dict()
+_executor_sizes = dict()
+_executors_lock = threading.Lock()
+
+
+class BoundedExecutor:
+    """Fixed-size thread pool for blocking tool work, with queue depth and active worker counters.
+
+    Tasks run with a copy of the caller's context, so LangChain callbacks and tracing still see
+    the run they belong to.
+    """
+
+    def __init__(self, name: str, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"tool-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        context = contextvars.copy_context()
+
+        def task():
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._executor.submit(context.run, task)
+        except RuntimeError:
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._dequeue_cancelled)
+        return future
+
+    def _dequeue_cancelled(self, future: Future) -> None:
+        # Only a task that never started can be cancelled (future.cancel() or shutdown(cancel_futures=True)):
+        # task() did not take it off the queue
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Runs a blocking function on the pool and awaits its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"max_workers": self.max_workers, "queued": self._queued,
+                    "active": self._active, "completed": self._completed}
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+def configure_executor(name: str, max_workers: int) -> None:
+    """Sets the pool size for a named executor (e.g. one per tool class).
+    A running pool with that name is replaced; tasks already submitted to it still finish."""
+    with _executors_lock:
+        _executor_sizes[name] = max_workers
+        old = _executors.pop(name, None)
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def get_executor(name: str = "default") -> BoundedExecutor:
+    """Returns the shared executor with this name, creating it on first use"""
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = BoundedExecutor(name, _executor_sizes.get(name, DEFAULT_MAX_WORKERS))
+            _executors[name] = executor
+        return executor
+
+
+def executor_stats() -> Dict[str, dict]:
+    """Queue depth, active workers and completed tasks of every shared executor"""
+    with _executors_lock:
+        executors = list(_executors.values())
+    return {executor.name: executor.stats() for executor in executors}
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    """Shuts down every shared executor, dropping the tasks that have not started yet"""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait, cancel_futures=True)
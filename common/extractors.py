@@ -0,0 +1,230 @@
+import os
+import re
+import time
+import logging
+from io import BytesIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    from .pdf_pages import PdfPage, extract_page_texts, pages_from_texts, pdf_name, pdf_source, pypdf_version
+    from .ingest_cache import resolve_cache
+except Exception:
+    from pdf_pages import PdfPage, extract_page_texts, pages_from_texts, pdf_name, pdf_source, pypdf_version
+    from ingest_cache import resolve_cache
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", 1))
+# Formats without pages (Word, HTML, text) are cut into pages of about this many characters
+PAGE_CHARS = int(os.environ.get("EXTRACT_PAGE_CHARS", 4000))
+
+
+class Extractor(NamedTuple):
+    """extract(source) returns the page texts of a document, source being a path or the bytes of an upload.
+    version goes into the ingestion cache key: change it when the text extract produces changes."""
+    format: str
+    extensions: Tuple[str, ...]
+    extract: Callable[[object], Iterable[str]]
+    version: dict
+
+
+_extractors: Dict[str, Extractor] = dict()
+_extensions: Dict[str, str] = dict()
+
+
+def register_extractor(format: str, extensions: Iterable[str], extract: Callable[[object], Iterable[str]], **version) -> Extractor:
+    """Adds (or replaces) the extractor of a format, used for files with one of the extensions.
+
+    Extraction runs in worker processes, so extract must be a module-level function of a module that
+    registers it when imported (forked workers also see extractors registered before the pool starts).
+
+        register_extractor("markdown", [".md"], extract_markdown, parser="markdown", version=1)
+    """
+    extractor = Extractor(format, tuple(extension.lower() for extension in extensions), extract,
+                          dict(version or {"parser": format}))
+    _extractors[format] = extractor
+    for extension in extractor.extensions:
+        _extensions[extension] = format
+    return extractor
+
+
+def registered_extensions() -> List[str]:
+    return sorted(_extensions)
+
+
+def get_extractor(file) -> Extractor:
+    """Extractor of a path or file-like object, by the extension of its name"""
+    extension = os.path.splitext(pdf_name(file))[1].lower()
+    if extension not in _extensions:
+        raise ValueError(f"No extractor for {extension or 'files without extension'} ({pdf_name(file)}), "
+                         f"registered: {', '.join(registered_extensions())}")
+    return _extractors[_extensions[extension]]
+
+
+def paginate(text: str, page_chars: int = PAGE_CHARS) -> List[str]:
+    """Pages of about page_chars characters of a text without pages, cut at a paragraph, line or word
+    boundary when there is one. The pages put together are the text, so offsets stay exact."""
+    pages = []
+    position = 0
+    while position < len(text):
+        end = position + page_chars
+        if end < len(text):
+            for boundary in ("\n\n", "\n", " "):
+                cut = text.rfind(boundary, position + page_chars // 2, end)
+                if cut >= 0:
+                    end = cut + len(boundary)
+                    break
+        pages.append(text[position:end])
+        position = end
+    return pages
+
+
+def _read_bytes(source) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def extract_pdf(source) -> List[str]:
+    return extract_page_texts(source)
+
+
+def extract_docx(source) -> List[str]:
+    import docx2txt
+    return paginate(docx2txt.process(BytesIO(source) if isinstance(source, bytes) else source))
+
+
+def extract_html(source) -> List[str]:
+    """Visible text of an HTML page (scripts, styles and templates dropped), blank lines collapsed"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(_read_bytes(source), "html.parser")
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    text = re.sub(r"\n\s*\n+", "\n\n", soup.get_text("\n"))
+    return paginate(text.strip())
+
+
+def extract_text(source) -> List[str]:
+    return paginate(_read_bytes(source).decode("utf-8", errors="replace"))
+
+
+register_extractor("pdf", [".pdf"], extract_pdf, **pypdf_version())  # same cache entries as iter_pypdf_pages
+register_extractor("docx", [".docx"], extract_docx, parser="docx2txt", page_chars=PAGE_CHARS)
+register_extractor("html", [".html", ".htm"], extract_html, parser="html.parser", page_chars=PAGE_CHARS)
+register_extractor("text", [".txt", ".md", ".log"], extract_text, parser="text", page_chars=PAGE_CHARS)
+
+
+def _extract(format: str, source) -> Tuple[List[str], float]:
+    start = time.perf_counter()
+    texts = list(_extractors[format].extract(source))
+    return texts, time.perf_counter() - start
+
+
+class ExtractionStats:
+    """Per-format files, pages, characters, input bytes, extraction seconds (summed over workers), cache hits and
+    errors, and the files that failed to extract ({name: error})"""
+
+    def __init__(self):
+        self.formats: Dict[str, dict] = dict()
+        self.failed: Dict[str, str] = dict()
+        self.started = time.perf_counter()
+
+    def record(self, format: str, **counts) -> None:
+        row = self.formats.setdefault(format, {"files": 0, "pages": 0, "characters": 0, "bytes": 0, "seconds": 0.0,
+                                               "cached": 0, "errors": 0})
+        for counter, value in counts.items():
+            row[counter] += value
+
+    def record_failure(self, format: str, name: str, error: str) -> None:
+        self.record(format, errors=1)
+        self.failed[name] = error
+
+    def summary(self) -> dict:
+        """The counters plus pages/s and MB/s of extraction per format, the failed files and the wall time so far"""
+        formats = dict()
+        for format, row in self.formats.items():
+            seconds = row["seconds"]
+            formats[format] = dict(row, seconds=round(seconds, 3),
+                                   pages_per_second=round(row["pages"] / seconds, 1) if seconds else None,
+                                   mb_per_second=round(row["bytes"] / 2 ** 20 / seconds, 2) if seconds else None)
+        return {"formats": formats, "failed": dict(self.failed), "wall_seconds": round(time.perf_counter() - self.started, 3)}
+
+
+def _source_size(source) -> int:
+    return len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+
+def iter_extracted_pages(files, max_workers: Optional[int] = None, max_pending: Optional[int] = None, cache=None,
+                         stats: Optional[ExtractionStats] = None) -> Iterator[PdfPage]:
+    """Yields the pages of documents of any registered format (PDF, DOCX, HTML, text) one at a time and in
+    order, as PdfPage (name, page_num, offset, text) like the PDF readers, so chunking and indexing do not
+    care about the format.
+
+    With max_workers > 1 (EXTRACT_WORKERS, 1) files are extracted on a process pool, at most max_pending
+    (2 per worker) ahead of the consumer. Files in the ingestion cache are not extracted again. A file
+    that fails to extract is logged, recorded in stats.failed and skipped; unknown extensions raise
+    ValueError before any work.
+
+        stats = ExtractionStats()
+        for page in iter_extracted_pages(files, max_workers=4, stats=stats): ...
+        stats.summary()
+    """
+    files = list(files)
+    extractors = [get_extractor(file) for file in files]
+    max_workers = DEFAULT_EXTRACT_WORKERS if max_workers is None else max_workers
+    cache = resolve_cache(cache)
+    stats = stats if stats is not None else ExtractionStats()
+    pool = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+
+    def start(file, extractor: Extractor) -> tuple:
+        key = cache.file_key(file, **extractor.version) if cache is not None else None
+        texts = cache.load(key) if key is not None else None
+        if texts is not None:
+            return pdf_name(file), extractor, True, None, None, texts
+        source = pdf_source(file)
+        job = pool.submit(_extract, extractor.format, source) if pool is not None else None
+        return pdf_name(file), extractor, False, key, source, job
+
+    jobs = iter(zip(files, extractors))
+    pending = deque()
+    try:
+        for file, extractor in jobs:
+            pending.append(start(file, extractor))
+            if len(pending) >= (max_pending or 2 * max_workers):
+                break
+        while pending:
+            name, extractor, cached, key, source, job = pending.popleft()
+            if cached:
+                texts = list(job)
+                stats.record(extractor.format, files=1, pages=len(texts), characters=sum(map(len, texts)), cached=1)
+            else:
+                try:
+                    texts, seconds = job.result() if job is not None else _extract(extractor.format, source)
+                except Exception as e:
+                    logger.warning("Skipping %s: %s: %s", name, type(e).__name__, e)
+                    stats.record_failure(extractor.format, name, f"{type(e).__name__}: {e}")
+                    texts = None
+                else:
+                    stats.record(extractor.format, files=1, pages=len(texts), characters=sum(map(len, texts)),
+                                 bytes=_source_size(source), seconds=seconds)
+                    if key is not None:
+                        writer = cache.writer(key, **extractor.version)
+                        try:
+                            for text in texts:
+                                writer.add(text)
+                            writer.commit()
+                        finally:
+                            writer.discard()
+            next_file = next(jobs, None)
+            if next_file is not None:
+                pending.append(start(*next_file))
+            if texts is not None:
+                yield from pages_from_texts(name, texts)
+    finally:
+        if pool is not None:
+            # The consumer may stop early: drop the queued files instead of extracting them
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,91 @@
+import time
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Optional
+
+from pypdf import PdfReader
+
+
+class FakePoller:
+    """What begin_analyze_document returns: result() blocks until the analysis is done"""
+
+    def __init__(self, future):
+        self._future = future
+
+    def result(self, timeout: Optional[float] = None):
+        return self._future.result(timeout)
+
+    def done(self) -> bool:
+        return self._future.done()
+
+
+class FakeDocumentAnalysisClient:
+    """Local stand-in for azure.ai.formrecognizer.DocumentAnalysisClient, for tests and benchmarks.
+
+    begin_analyze_document(model, document=bytes or file) returns at once and analyzes in the background:
+    it waits latency + latency_per_page * pages, like the service queue and OCR, then returns an
+    AnalyzeResult-like object (content, pages with spans, tables) built from the pypdf text of the pages.
+    With tables_per_page, the first line of every page comes back as a one-row table.
+
+        client = FakeDocumentAnalysisClient(latency=0.5, latency_per_page=0.02)
+        pages = list(iter_analyzed_pages(files, client=client, max_in_flight=8))
+        client.requests, client.peak_in_flight
+    """
+
+    def __init__(self, latency: float = 0.5, latency_per_page: float = 0.01, tables_per_page: int = 0, max_workers: int = 64):
+        self.latency = latency
+        self.latency_per_page = latency_per_page
+        self.tables_per_page = tables_per_page
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fake-doc-intelligence")
+        self._lock = threading.Lock()
+        self.requests = []  # (model, pages) of every request
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def begin_analyze_document(self, model: str, document, **kwargs) -> FakePoller:
+        data = document if isinstance(document, bytes) else document.read()
+        reader = PdfReader(BytesIO(data))
+        with self._lock:
+            self.requests.append((model, len(reader.pages)))
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return FakePoller(self._executor.submit(self._analyze, reader))
+
+    def _analyze(self, reader: PdfReader):
+        try:
+            time.sleep(self.latency + self.latency_per_page * len(reader.pages))
+            return self._result(reader)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _result(self, reader: PdfReader):
+        content = []
+        offset = 0
+        pages = []
+        tables = []
+        for page_num, page in enumerate(reader.pages):
+            text = page.extract_text()
+            pages.append(SimpleNamespace(page_number=page_num + 1, spans=[SimpleNamespace(offset=offset, length=len(text))]))
+            first_line = text.split("\n", 1)[0]
+            if self.tables_per_page and first_line:
+                words = first_line.split()
+                cells = [SimpleNamespace(row_index=0, column_index=i, kind="content", column_span=1, row_span=1, content=word)
+                         for i, word in enumerate(words)]
+                tables.append(SimpleNamespace(row_count=1, column_count=len(words), cells=cells,
+                                              spans=[SimpleNamespace(offset=offset, length=len(first_line))],
+                                              bounding_regions=[SimpleNamespace(page_number=page_num + 1)]))
+            content.append(text)
+            offset += len(text)
+        return SimpleNamespace(content="".join(content), pages=pages, tables=tables)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,245 @@
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+
+MAX_BATCH_DOCUMENTS = 1000
+
+
+def fake_documents(index: str, n: int = 20) -> List[dict]:
+    """Builds n deterministic documents for an index, with decreasing reranker scores"""
+    return [{
+                "id": f"{index}-{i}",
+                "title": f"{index} document {i}",
+                "name": f"{index}_{i}.pdf",
+                "chunk": f"Chunk {i} of {index}. " * 10,
+                "location": f"https://fake.blob.core.windows.net/{index}/{index}_{i}.pdf",
+                "@search.rerankerScore": round(3.9 - i * 0.1, 2),
+                "@search.captions": [{"text": f"Caption {i} of {index}", "highlights": ""}],
+            } for i in range(n)]
+
+
+class FakeSearchHandler(BaseHTTPRequestHandler):
+    """Answers the subset of the Azure AI Search REST API used by this repo"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real service
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_json()
+        with self.server.lock:
+            self.server.requests.append(("POST", path))
+
+        match = re.fullmatch(r"/indexes/([^/]+)/docs/search", path)
+        if match:
+            index = match.group(1)
+            if self._inject_fault(index):
+                return
+            docs = self.server.documents.get(index) or fake_documents(index)
+            top = int(body.get("top", 5))
+            self._send_json(200, {"@odata.count": len(docs), "value": docs[:top]})
+            return
+        match = re.fullmatch(r"/indexes/([^/]+)/docs/index", path)
+        if match:
+            index = match.group(1)
+            if self._inject_fault(index):
+                return
+            self._index_documents(index, body.get("value", []))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    def _index_documents(self, index: str, actions: List[dict]):
+        """Applies upload / merge / mergeOrUpload / delete actions keyed by id, answering per document like the service"""
+        if len(actions) > MAX_BATCH_DOCUMENTS:
+            self._send_json(413, {"error": {"message": f"Too many documents in the batch: {len(actions)}"}})
+            return
+        results = []
+        with self.server.lock:
+            indexed = self.server.indexed.setdefault(index, dict())
+            for action in actions:
+                document = {key: value for key, value in action.items() if key != "@search.action"}
+                key = document.get("id")
+                kind = action.get("@search.action", "upload")
+                if kind == "delete":
+                    indexed.pop(key, None)
+                    results.append({"key": key, "status": True, "errorMessage": None, "statusCode": 200})
+                elif kind == "merge" and key not in indexed:
+                    results.append({"key": key, "status": False, "errorMessage": "Document not found.", "statusCode": 404})
+                else:
+                    created = key not in indexed
+                    indexed[key] = dict(indexed.get(key, {}), **document) if kind != "upload" else document
+                    results.append({"key": key, "status": True, "errorMessage": None, "statusCode": 201 if created else 200})
+        status = 200 if all(result["status"] for result in results) else 207
+        self._send_json(status, {"value": results})
+
+    def _inject_fault(self, index: str) -> bool:
+        """Applies the latency and errors injected for the index, returns True when an error was sent"""
+        with self.server.lock:
+            fault = self.server.faults.get(index)
+            if fault is None:
+                return False
+            delay = fault["latency"]
+            if fault["slow_rate"] and self.server.random.random() < fault["slow_rate"]:
+                delay += fault["slow_latency"]
+            fail = fault["fail_next"] > 0 or (fault["error_rate"] and self.server.random.random() < fault["error_rate"])
+            if fault["fail_next"] > 0:
+                fault["fail_next"] -= 1
+        if delay:
+            time.sleep(delay)
+        if not fail:
+            return False
+        body = json.dumps({"error": {"message": "Injected failure"}}).encode("utf-8")
+        self.send_response(fault["status"])
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if fault["retry_after"] is not None:
+            self.send_header("Retry-After", str(fault["retry_after"]))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def do_PUT(self):
+        path = urlparse(self.path).path
+        body = self._read_json()
+        with self.server.lock:
+            self.server.requests.append(("PUT", path))
+            self.server.resources[path] = body
+        self._send_json(201, body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        with self.server.lock:
+            self.server.requests.append(("GET", path))
+
+        if path.endswith("/status"):
+            self._send_json(200, {"lastResult": {"status": "success", "itemsProcessed": 0}})
+        elif path in self.server.resources:
+            self._send_json(200, self.server.resources[path])
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients dropping a connection (e.g. the losing request of a hedged pair) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeSearchServer:
+    """Local stand-in for an Azure AI Search service, for tests and benchmarks.
+
+    Runs a threaded HTTP server on localhost and counts the TCP connections it accepts,
+    so callers can check that pooled clients reuse connections.
+
+        with FakeSearchServer() as server:
+            configure_search_client(endpoint=server.url, api_key="fake", api_version="2023-11-01")
+            get_search_results("question", ["index1", "index2"])
+
+    inject() adds latency and errors to the searches of an index, to exercise the resilience layer:
+
+            server.inject("index2", latency=0.05, slow_rate=0.05, slow_latency=2)  # 5% of the calls take 2s more
+            server.inject("index1", fail_next=2, status=429, retry_after=0.1)      # throttles the next 2 calls
+
+    Documents pushed with docs/index (upload, merge, mergeOrUpload, delete) are kept per index, see indexed().
+    Faults apply to them too.
+    """
+
+    def __init__(self, documents: Optional[Dict[str, List[dict]]] = None, host: str = "127.0.0.1", port: int = 0,
+                 handler=FakeSearchHandler):
+        self.httpd = _FakeHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.connections = 0
+        self.httpd.requests = []
+        self.httpd.resources = dict()
+        self.httpd.documents = documents or dict()
+        self.httpd.indexed = dict()
+        self.httpd.faults = dict()
+        self.httpd.random = random.Random(0)
+        self.thread = None
+
+    def inject(self, index: str, latency: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 0.0,
+               error_rate: float = 0.0, fail_next: int = 0, status: int = 503, retry_after: Optional[float] = None):
+        """Faults for the searches and pushes of an index: fixed latency, a share of extra slow calls, a share of failed
+        calls (or the next fail_next calls) answered with status and an optional Retry-After header"""
+        with self.httpd.lock:
+            self.httpd.faults[index] = {"latency": latency, "slow_rate": slow_rate, "slow_latency": slow_latency,
+                                        "error_rate": error_rate, "fail_next": fail_next, "status": status,
+                                        "retry_after": retry_after}
+
+    def clear_faults(self):
+        with self.httpd.lock:
+            self.httpd.faults.clear()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def indexed(self, index: str) -> Dict[str, dict]:
+        """Documents pushed to an index (docs/index), by id"""
+        with self.httpd.lock:
+            return dict(self.httpd.indexed.get(index, {}))
+
+    @property
+    def connections(self) -> int:
+        return self.httpd.connections
+
+    @property
+    def requests(self) -> list:
+        return self.httpd.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake Azure AI Search service on localhost")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    server = FakeSearchServer(port=args.port)
+    print(f"Fake Azure AI Search listening on {server.url}")
+    server.httpd.serve_forever()
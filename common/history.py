@@ -0,0 +1,190 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.output_parsers import StrOutputParser
+
+try:
+    from .prompts import HISTORY_SUMMARY_PROMPT
+    from .tokens import get_token_counter
+except Exception:
+    from prompts import HISTORY_SUMMARY_PROMPT
+    from tokens import get_token_counter
+
+
+# Stored in message.additional_kwargs when a message is added, so windows of later turns do not tokenize it again
+TOKEN_COUNT_KEY = "token_count"
+TOKENS_PER_MESSAGE = 3
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# The summary LLM call runs without the request's callbacks, so it does not show up in its stream_events
+_QUIET_CONFIG = {"callbacks": [], "run_name": "ChatHistorySummary"}
+
+
+class SummaryCache:
+    """Rolling summaries by session: (number of messages folded, fingerprint of the last one, summary).
+    Bounded LRU of max_sessions, shared by the per-request TokenWindowChatHistory instances."""
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[Hashable, Tuple[int, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.extended = 0
+        self.rebuilt = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[int, str, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, folded: int, fingerprint: str, summary: str) -> None:
+        with self._lock:
+            self._entries[key] = (folded, fingerprint, summary)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def record(self, outcome: str) -> None:
+        """Counts a "reused", "extended" or "rebuilt" summary"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def drop(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._entries), "reused": self.reused, "extended": self.extended, "rebuilt": self.rebuilt}
+
+
+_summary_cache = SummaryCache(max_sessions=int(os.environ.get("CHAT_HISTORY_SUMMARY_CACHE_SIZE", 10000)))
+
+
+def get_summary_cache() -> SummaryCache:
+    return _summary_cache
+
+
+def _fingerprint(message: BaseMessage) -> str:
+    return hashlib.sha1((message.type + "\x00" + str(message.content)).encode("utf-8")).hexdigest()
+
+
+class TokenWindowChatHistory(BaseChatMessageHistory):
+    """Chat history exposing only the most recent messages that fit max_tokens, behind a rolling summary
+    of the older ones. Messages are still stored in full in the wrapped history (e.g. CosmosDBChatMessageHistory).
+
+    The window starts at a human message, so question/answer pairs are not split. Once the recent messages
+    outgrow max_tokens, the window jumps forward until they fit fold_to * max_tokens, and the messages it
+    leaves are folded into the summary with one LLM call (previous summary + newly folded messages).
+    Between jumps the cached summary is reused as is, so it is recomputed every few turns, not every turn.
+
+    Token counts are stored with the messages (additional_kwargs["token_count"] of the stored copies, the
+    caller's messages are left as they are) when they are added. llm is required: without a summary the
+    turns leaving the window would be lost.
+
+        history = TokenWindowChatHistory(cosmos, llm, max_tokens=2000, session_key=(session_id, user_id))
+    """
+
+    def __init__(self, history: BaseChatMessageHistory, llm, max_tokens: int = 2000, fold_to: float = 0.5,
+                 summary_words: int = 200, model: Optional[str] = None, session_key: Optional[Hashable] = None,
+                 summary_cache: Optional[SummaryCache] = None):
+        self.history = history
+        self.max_tokens = max_tokens
+        self.fold_to = fold_to
+        self.summary_words = summary_words
+        self.counter = get_token_counter(model)
+        self.session_key = session_key if session_key is not None else id(history)
+        self.summary_cache = summary_cache or get_summary_cache()
+        if llm is None:
+            raise ValueError("TokenWindowChatHistory needs an llm to summarize the messages leaving the window")
+        self.summarizer = HISTORY_SUMMARY_PROMPT | llm | StrOutputParser()
+
+    def token_count(self, message: BaseMessage) -> int:
+        count = message.additional_kwargs.get(TOKEN_COUNT_KEY)
+        if count is None:
+            count = self.counter.count(get_buffer_string([message])) + TOKENS_PER_MESSAGE
+        return count
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        counted = []
+        for message in messages:
+            additional_kwargs = {**message.additional_kwargs, TOKEN_COUNT_KEY: self.token_count(message)}
+            counted.append(message.copy(update={"additional_kwargs": additional_kwargs}))
+        self.history.add_messages(counted)
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def clear(self) -> None:
+        self.summary_cache.drop(self.session_key)
+        self.history.clear()
+
+    def _window_start(self, messages: List[BaseMessage], budget: int, not_before: int = 0) -> int:
+        """First message of the longest suffix of messages (starting at a human message) within budget"""
+        start = len(messages)
+        used = 0
+        for i in range(len(messages) - 1, not_before - 1, -1):
+            used += self.token_count(messages[i])
+            if used > budget:
+                break
+            start = i
+        while start < len(messages) and not isinstance(messages[start], HumanMessage):
+            start += 1
+        return start
+
+    def _plan(self, messages: List[BaseMessage]):
+        """(cut, cached summary or None, messages to fold into it): messages[cut:] is the window"""
+        cached = self.summary_cache.get(self.session_key)
+        if cached is not None:
+            folded, fingerprint, summary = cached
+            if not (0 < folded <= len(messages) and _fingerprint(messages[folded - 1]) == fingerprint):
+                cached = None
+        folded = cached[0] if cached else 0
+        if sum(self.token_count(message) for message in messages[folded:]) <= self.max_tokens:
+            return folded, cached[2] if cached else None, []
+        cut = max(self._window_start(messages, int(self.max_tokens * self.fold_to), not_before=folded), folded)
+        if cached:
+            return cut, cached[2], messages[folded:cut]
+        return cut, None, messages[:cut]
+
+    def _with_summary(self, summary: Optional[str], window: List[BaseMessage]) -> List[BaseMessage]:
+        if not summary:
+            return window
+        return [SystemMessage(content=SUMMARY_PREFIX + summary)] + window
+
+    def _summary_inputs(self, summary: Optional[str], to_fold: List[BaseMessage]) -> dict:
+        return {"summary": summary or "(none)", "messages": get_buffer_string(to_fold), "max_words": self.summary_words}
+
+    def _store(self, messages: List[BaseMessage], cut: int, previous: Optional[str], summary: str) -> None:
+        self.summary_cache.record("rebuilt" if previous is None else "extended")
+        self.summary_cache.put(self.session_key, cut, _fingerprint(messages[cut - 1]), summary)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        messages = list(self.history.messages)
+        cut, summary, to_fold = self._plan(messages)
+        if to_fold:
+            new_summary = self.summarizer.invoke(self._summary_inputs(summary, to_fold), _QUIET_CONFIG)
+            self._store(messages, cut, summary, new_summary)
+            summary = new_summary
+        elif summary is not None:
+            self.summary_cache.record("reused")
+        return self._with_summary(summary, messages[cut:])
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        messages = list(self.history.messages)
+        cut, summary, to_fold = self._plan(messages)
+        if to_fold:
+            new_summary = await self.summarizer.ainvoke(self._summary_inputs(summary, to_fold), _QUIET_CONFIG)
+            self._store(messages, cut, summary, new_summary)
+            summary = new_summary
+        elif summary is not None:
+            self.summary_cache.record("reused")
+        return self._with_summary(summary, messages[cut:])
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import uuid
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+try:
+    from .search_client import get_search_client
+    from .resilience import RETRY_STATUSES, retry_after_seconds
+except Exception:
+    from search_client import get_search_client
+    from resilience import RETRY_STATUSES, retry_after_seconds
+
+
+MAX_BATCH_DOCUMENTS = 1000  # most documents the service takes in one docs/index request
+MAX_BATCH_BYTES = 16 * 2 ** 20  # and the largest request body
+DEFAULT_UPLOAD_WORKERS = int(os.environ.get("INDEX_UPLOAD_WORKERS", 4))
+DEFAULT_MANIFEST_DIR = os.environ.get("INDEX_MANIFEST_DIR", ".index_manifests")
+# Per-document status codes the service documents as transient
+RETRY_ITEM_STATUSES = (409, 422, 429, 503)
+# Field of the documents given to IndexPusher with the path of the file a chunk comes from: recorded in the
+# manifest, never sent to the service ("@" fields are annotations, not index fields)
+SOURCE_FIELD = "@source"
+
+
+class IndexingError(Exception):
+    """A docs/index request was refused with a status that retrying will not change (400, 401, 403, 404, 413...)"""
+
+
+def document_hash(document: dict) -> str:
+    """sha256 of a document's fields (key order does not matter)"""
+    return hashlib.sha256(json.dumps(document, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """Content hashes of the documents pushed to an index, kept in a local JSON file so the next push
+    only sends new or changed documents and deletes the ones that are gone.
+
+    Entries are {key: [hash, name]}, name being the document (e.g. the path of the PDF) the chunk comes from.
+    save() writes the file atomically; entries are only recorded once the service accepted them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, list] = dict()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)["documents"]
+
+    @classmethod
+    def for_index(cls, index: str, directory: str = DEFAULT_MANIFEST_DIR) -> "IndexManifest":
+        """Manifest of an index in directory (INDEX_MANIFEST_DIR, .index_manifests)"""
+        return cls(os.path.join(directory, f"{index}.json"))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def record(self, key: str, digest: str, name: Optional[str]) -> None:
+        with self._lock:
+            self.entries[key] = [digest, name]
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self.entries.pop(key, None)
+
+    def stale_keys(self, seen: set, names: Optional[set] = None, keep: Iterable[str] = ()) -> List[str]:
+        """Keys not seen in a push: all of them, or only those of the documents in names, except those of
+        the documents in keep"""
+        keep = set(keep)
+        with self._lock:
+            return [key for key, (_, name) in self.entries.items()
+                    if key not in seen and (names is None or name in names) and name not in keep]
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with self._lock:
+            payload = {"documents": dict(self.entries)}
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+
+
+class IndexPusher:
+    """Pushes documents to an Azure AI Search index with the docs/index API, in batches of up to
+    batch_size documents (1000) and max_batch_bytes, with up to max_workers batches in flight.
+
+    Back-pressure: a 503 or 429 (whole request or single documents) is retried after Retry-After or an
+    exponential backoff, and halves the number of batches in flight; each accepted batch lets one more
+    through again, up to max_workers. Other per-document failures are counted and left out of the
+    manifest, so the next push sends them again.
+
+    With a manifest, documents whose hash did not change are skipped, and documents of the manifest not
+    seen in the push are deleted: those of the pushed names (e.g. chunks of a shorter new version of a
+    PDF), or all of them with full_sync=True, except those of the documents in keep (e.g. files that
+    failed to extract and are missing from the push for that reason). Documents are told apart by source_field (SOURCE_FIELD, the
+    full path, not sent) or else name_field, so two files with the same basename keep their own chunks.
+    embed(texts) -> vectors, when given, fills vector_field
+    from text_field for the documents actually sent, so unchanged chunks are not embedded again.
+
+        with FakeSearchServer() as server:
+            configure_search_client(endpoint=server.url, api_key="fake", api_version="2023-11-01")
+            pusher = IndexPusher("cogsrch-index-files", manifest=IndexManifest.for_index("cogsrch-index-files"))
+            pusher.push(doc for batch in iter_index_batches(chunks) for doc in batch)
+    """
+
+    def __init__(self, index: str, manifest: Optional[IndexManifest] = None, client: Optional[httpx.Client] = None,
+                 batch_size: int = MAX_BATCH_DOCUMENTS, max_batch_bytes: int = MAX_BATCH_BYTES,
+                 max_workers: int = DEFAULT_UPLOAD_WORKERS, max_attempts: int = 8, backoff_base: float = 0.5,
+                 backoff_max: float = 30, key_field: str = "id", name_field: str = "name",
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None, text_field: str = "chunk",
+                 vector_field: str = "chunkVector", source_field: str = SOURCE_FIELD):
+        self.index = index
+        self.manifest = manifest
+        self.client = client
+        self.batch_size = min(batch_size, MAX_BATCH_DOCUMENTS)
+        self.max_batch_bytes = max_batch_bytes
+        self.max_workers = max(1, max_workers)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.key_field = key_field
+        self.name_field = name_field
+        self.embed = embed
+        self.text_field = text_field
+        self.vector_field = vector_field
+        self.source_field = source_field
+        self._lock = threading.Lock()
+        self._limit = self.max_workers
+        self._counters = dict()
+
+    @property
+    def path(self) -> str:
+        return f"/indexes/{self.index}/docs/index"
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + n
+
+    def _throttled(self) -> None:
+        with self._lock:
+            self._limit = max(1, self._limit // 2)
+            self._counters["throttled"] = self._counters.get("throttled", 0) + 1
+
+    def _accepted(self) -> None:
+        with self._lock:
+            self._limit = min(self.max_workers, self._limit + 1)
+
+    @property
+    def limit(self) -> int:
+        """Batches allowed in flight now"""
+        with self._lock:
+            return self._limit
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def send(self, actions: List[dict]) -> Tuple[List[str], Dict[str, str]]:
+        """Sends one batch of actions until every document is accepted, failed for good or out of attempts.
+        Returns the accepted keys and {key: error} of the others."""
+        client = self.client or get_search_client()
+        accepted = []
+        failed = dict()
+        for attempt in range(self.max_attempts):
+            try:
+                response = client.post(self.path, json={"value": actions})
+            except httpx.TransportError as e:
+                retry_after, error = None, str(e) or type(e).__name__
+            else:
+                if response.status_code in RETRY_STATUSES:
+                    self._throttled()
+                    retry_after, error = retry_after_seconds(response), f"HTTP {response.status_code}"
+                elif response.status_code in (200, 207):
+                    retry, retry_after, error = [], None, None
+                    by_key = {action[self.key_field]: action for action in actions}
+                    for result in response.json()["value"]:
+                        if result["status"]:
+                            accepted.append(result["key"])
+                            failed.pop(result["key"], None)
+                        else:
+                            failed[result["key"]] = result.get("errorMessage") or f"HTTP {result.get('statusCode')}"
+                            if result.get("statusCode") in RETRY_ITEM_STATUSES:
+                                retry.append(by_key[result["key"]])
+                    if not retry:
+                        self._accepted()
+                        return accepted, failed
+                    self._throttled()
+                    actions = retry
+                    error = f"{len(retry)} document(s) throttled"
+                else:
+                    raise IndexingError(f"docs/index on {self.index} answered HTTP {response.status_code}: {response.text[:500]}")
+            if attempt + 1 < self.max_attempts:
+                self._count("retries")
+                time.sleep(self.backoff(attempt, retry_after))
+        for action in actions:
+            failed.setdefault(action[self.key_field], error)
+        return accepted, failed
+
+    def _batches(self, documents: Iterable[dict], stats: dict, seen: set, names: set) -> Iterable[List[Tuple[dict, str, str]]]:
+        """Batches of (mergeOrUpload action, hash, source name) of the new or changed documents"""
+        batch = []
+        size = 0
+        for document in documents:
+            key = document[self.key_field]
+            seen.add(key)
+            if self.source_field in document:
+                document = dict(document)
+                name = document.pop(self.source_field)
+            else:
+                name = document.get(self.name_field)
+            names.add(name)
+            digest = document_hash(document)
+            if self.manifest is not None and self.manifest.get(key) == digest:
+                stats["unchanged"] += 1
+                continue
+            action = dict(document, **{"@search.action": "mergeOrUpload"})
+            action_size = len(json.dumps(action, ensure_ascii=False)) + 1
+            if batch and (len(batch) >= self.batch_size or size + action_size > self.max_batch_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append((action, digest, name))
+            size += action_size
+        if batch:
+            yield batch
+
+    def _send_batch(self, batch: List[tuple]) -> Tuple[List[tuple], Dict[str, str]]:
+        accepted, failed = self.send([item[0] for item in batch])
+        accepted = set(accepted)
+        return [item for item in batch if item[0][self.key_field] in accepted], failed
+
+    def _upload(self, batch: List[Tuple[dict, str, str]]) -> Tuple[List[Tuple[dict, str, str]], Dict[str, str]]:
+        if self.embed is not None:
+            vectors = self.embed([action[self.text_field] for action, _, _ in batch])
+            for (action, _, _), vector in zip(batch, vectors):
+                action[self.vector_field] = vector
+        return self._send_batch(batch)
+
+    def _run(self, pool: ThreadPoolExecutor, batches: Iterable, on_done: Callable, stats: dict) -> None:
+        """Runs the (fn, batch) calls with at most self.limit in flight, on_done(*result) in this thread"""
+        in_flight = set()
+
+        def drain(block_until: int) -> None:
+            nonlocal in_flight
+            while len(in_flight) > block_until:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    on_done(*future.result())
+
+        for fn, batch in batches:
+            drain(self.limit - 1)
+            in_flight.add(pool.submit(fn, batch))
+            stats["batches"] += 1
+        drain(0)
+
+    def push(self, documents: Iterable[dict], full_sync: bool = False, keep: Iterable[str] = (),
+             processed: Iterable[str] = ()) -> dict:
+        """Uploads the new and changed documents, then deletes the stale ones (see the class docstring).
+        processed names the source documents handled by this push besides those of the documents (e.g. files
+        that now yield no chunk at all), so their old chunks are deleted too.
+        keep is only read once the documents are consumed, so it can be filled while they stream.
+        The manifest is saved even when the push stops half way, with what the service accepted."""
+        stats = {"index": self.index, "uploaded": 0, "unchanged": 0, "deleted": 0, "failed": 0, "batches": 0}
+        errors = dict()
+        seen, names = set(), set(processed)
+        start = time.perf_counter()
+        with self._lock:
+            self._counters = {"retries": 0, "throttled": 0}
+
+        def uploaded(accepted: List[Tuple[dict, str, str]], failed: Dict[str, str]) -> None:
+            for action, digest, name in accepted:
+                if self.manifest is not None:
+                    self.manifest.record(action[self.key_field], digest, name)
+            stats["uploaded"] += len(accepted)
+            stats["failed"] += len(failed)
+            errors.update(failed)
+
+        def deleted(accepted: List[tuple], failed: Dict[str, str]) -> None:
+            for action, _ in accepted:
+                self.manifest.remove(action[self.key_field])
+            stats["deleted"] += len(accepted)
+            stats["failed"] += len(failed)
+            errors.update(failed)
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"index-{self.index}")
+        try:
+            self._run(pool, ((self._upload, batch) for batch in self._batches(documents, stats, seen, names)), uploaded, stats)
+            if self.manifest is not None:
+                stale = self.manifest.stale_keys(seen, None if full_sync else names, keep)
+                delete_batches = [[({self.key_field: key, "@search.action": "delete"}, None) for key in stale[i:i + self.batch_size]]
+                                  for i in range(0, len(stale), self.batch_size)]
+                self._run(pool, ((self._send_batch, batch) for batch in delete_batches), deleted, stats)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            if self.manifest is not None:
+                self.manifest.save()
+        seconds = time.perf_counter() - start
+        with self._lock:
+            stats.update(self._counters)
+        stats.update(seconds=round(seconds, 3), documents_per_second=round(stats["uploaded"] / seconds, 1) if seconds else 0.0,
+                     errors=dict(list(errors.items())[:20]))
+        return stats
+
+
+def push_documents(index: str, documents: Iterable[dict], manifest: Optional[IndexManifest] = None, full_sync: bool = False,
+                   keep: Iterable[str] = (), processed: Iterable[str] = (), **kwargs) -> dict:
+    """IndexPusher(index, manifest, **kwargs).push(documents, full_sync, keep, processed): returns the push stats"""
+    return IndexPusher(index, manifest=manifest, **kwargs).push(documents, full_sync=full_sync, keep=keep, processed=processed)
@@ -0,0 +1,114 @@
+"""Bulk ingestion of a folder of documents (PDF, Word, HTML, text, see common/extractors.py) into an
+Azure AI Search index, streaming: files are extracted on a process pool, cut into token-sized chunks
+and pushed in batches as they come, with per-format throughput stats at the end.
+
+    python common/ingest.py data/runbooks --index cogsrch-index-runbooks --workers 4
+    python common/ingest.py data/ --output chunks.jsonl                 # chunk documents to a file
+    python common/ingest.py data/ --pages-only --output pages.jsonl     # extraction only
+    python common/ingest.py data/ --extensions .docx .html              # throughput of the extraction alone
+
+AZURE_SEARCH_ENDPOINT / AZURE_SEARCH_KEY / AZURE_SEARCH_API_VERSION configure the service, as for searches.
+Only new or changed chunks are pushed (manifest in INDEX_MANIFEST_DIR, .index_manifests).
+Files that fail to extract are listed after the stats and keep their chunks in the index.
+"""
+import os
+import json
+import argparse
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    from .extractors import ExtractionStats, iter_extracted_pages, registered_extensions
+    from .chunking import TokenChunker, iter_chunks, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_OVERLAP
+    from .indexing import IndexManifest, IndexPusher, DEFAULT_UPLOAD_WORKERS, SOURCE_FIELD
+    from .ingest_cache import IngestionCache
+except Exception:
+    from extractors import ExtractionStats, iter_extracted_pages, registered_extensions
+    from chunking import TokenChunker, iter_chunks, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_OVERLAP
+    from indexing import IndexManifest, IndexPusher, DEFAULT_UPLOAD_WORKERS, SOURCE_FIELD
+    from ingest_cache import IngestionCache
+
+
+def find_files(paths: Iterable[str], extensions: Optional[Iterable[str]] = None) -> List[str]:
+    """Files of the given paths (folders walked recursively) with a registered (or one of extensions) extension, sorted"""
+    extensions = {extension.lower() for extension in (extensions or registered_extensions())}
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = [os.path.join(folder, name) for folder, _, names in os.walk(path) for name in names]
+        files.extend(file for file in candidates if os.path.splitext(file)[1].lower() in extensions)
+    return sorted(set(files))
+
+
+def write_jsonl(records: Iterator[dict], path: str) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def format_stats(summary: dict) -> str:
+    lines = [f"{'format':<8} {'files':>6} {'cached':>6} {'errors':>6} {'pages':>8} {'MB':>8} {'seconds':>8} {'pages/s':>9} {'MB/s':>7}"]
+    for format, row in sorted(summary["formats"].items()):
+        lines.append(f"{format:<8} {row['files']:>6} {row['cached']:>6} {row['errors']:>6} {row['pages']:>8} "
+                     f"{row['bytes'] / 2 ** 20:>8.1f} {row['seconds']:>8.2f} {row['pages_per_second'] or 0:>9.1f} {row['mb_per_second'] or 0:>7.2f}")
+    for name, error in sorted(summary["failed"].items()):
+        lines.append(f"failed   {name}: {error}")
+    lines.append(f"wall time {summary['wall_seconds']:.2f} s (seconds per format are extraction time summed over workers)")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description="Extract, chunk and push documents to an Azure AI Search index")
+    parser.add_argument("paths", nargs="+", help="files or folders")
+    parser.add_argument("--extensions", nargs="+", help=f"only these extensions (registered: {' '.join(registered_extensions())})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="extraction processes")
+    parser.add_argument("--chunk-workers", type=int, default=1, help="chunking processes")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--embedding-model", help="model or encoding the chunk tokens are counted with")
+    parser.add_argument("--index", help="push the chunks to this index")
+    parser.add_argument("--upload-workers", type=int, default=DEFAULT_UPLOAD_WORKERS)
+    parser.add_argument("--full-sync", action="store_true", help="also delete the chunks of files no longer in the paths")
+    parser.add_argument("--output", help="write the chunks (or pages) to this JSON lines file")
+    parser.add_argument("--pages-only", action="store_true", help="skip chunking, output pages")
+    parser.add_argument("--cache-dir", help="ingestion cache folder (default INGESTION_CACHE_DIR, none when unset)")
+    args = parser.parse_args(argv)
+    if args.index and args.pages_only:
+        parser.error("--index pushes chunks, it cannot be used with --pages-only")
+
+    files = find_files(args.paths, args.extensions)
+    print(f"{len(files)} files")
+    stats = ExtractionStats()
+    pages = iter_extracted_pages(files, max_workers=args.workers, stats=stats,
+                                 cache=IngestionCache(args.cache_dir) if args.cache_dir else None)
+    result = {"files": len(files)}
+    if args.pages_only:
+        records = ({"name": page.name, "page_num": page.page_num, "offset": page.offset, "source": page.source, "text": page.text}
+                   for page in pages)
+    else:
+        chunker = TokenChunker(args.chunk_tokens, args.overlap_tokens, model=args.embedding_model)
+        source_field = SOURCE_FIELD if args.index else None  # the pusher tells files apart by their path
+        records = (chunk.to_document(source_field) for chunk in iter_chunks(pages, chunker, max_workers=args.chunk_workers))
+
+    if args.index and not args.pages_only:
+        pusher = IndexPusher(args.index, manifest=IndexManifest.for_index(args.index), max_workers=args.upload_workers)
+        # Every file found was processed, even those now yielding no chunk: their old chunks are deleted. Files that
+        # failed to extract keep their chunks, even with --full-sync (stats.failed fills as they stream)
+        result["push"] = pusher.push(records, full_sync=args.full_sync, keep=stats.failed, processed=files)
+        print(json.dumps(result["push"], indent=2))
+    elif args.output:
+        result["records"] = write_jsonl(records, args.output)
+        print(f"{result['records']} records written to {args.output}")
+    else:
+        result["records"] = sum(1 for _ in records)
+    result["extraction"] = stats.summary()
+    print(format_stats(result["extraction"]))
+    return result
+
+
+if __name__ == "__main__":
+    main()
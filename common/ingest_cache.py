@@ -0,0 +1,139 @@
+import os
+import gzip
+import json
+import uuid
+import hashlib
+import threading
+from typing import Iterator, Optional
+
+
+# Part of every cache key: bump it when the page text a parser produces changes (e.g. the table HTML)
+PARSER_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+
+_ingestion_cache = None
+_ingestion_cache_lock = threading.Lock()
+
+
+def file_fingerprint(file) -> str:
+    """sha256 of the content of a path or file-like object, read in blocks (the position of a file-like object is kept)"""
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    elif hasattr(file, "getvalue"):
+        digest.update(file.getvalue())
+    else:
+        position = file.tell()
+        file.seek(0)
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+        file.seek(position)
+    return digest.hexdigest()
+
+
+class CacheWriter:
+    """Page texts of one document written as they are parsed, published by commit() (atomically, so a parse
+    stopped half way never leaves a partial entry)"""
+
+    def __init__(self, cache: "IngestionCache", key: str, header: dict):
+        self.cache = cache
+        self.key = key
+        self.path = cache.path(key)
+        self.tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = gzip.open(self.tmp_path, "wt", encoding="utf-8")
+        self._file.write(json.dumps(header) + "\n")
+        self.pages = 0
+
+    def add(self, text: str) -> None:
+        self._file.write(json.dumps(text) + "\n")
+        self.pages += 1
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        self.cache._record("writes")
+
+    def discard(self) -> None:
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class IngestionCache:
+    """Content-addressed on-disk cache of parsed documents.
+
+    The key is the sha256 of the file content plus the parser settings (parser, model, versions), so a
+    renamed file is a hit and a changed file or parser is a miss. An entry is a gzip file of JSON lines: a
+    header, then the text of every page in order; page numbers and offsets are rebuilt on load.
+
+        cache = IngestionCache("./.ingestion_cache")
+        for page in iter_pdf_files(files, cache=cache): ...
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, fingerprint: str, **version) -> str:
+        settings = json.dumps(dict(version, parser_version=PARSER_VERSION), sort_keys=True)
+        return hashlib.sha256((fingerprint + settings).encode("utf-8")).hexdigest()
+
+    def file_key(self, file, **version) -> str:
+        return self.key(file_fingerprint(file), **version)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".jsonl.gz")
+
+    def _record(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def load(self, key: str) -> Optional[Iterator[str]]:
+        """Page texts of a cached document, read lazily, or None on a miss"""
+        try:
+            f = gzip.open(self.path(key), "rt", encoding="utf-8")
+        except FileNotFoundError:
+            self._record("misses")
+            return None
+        self._record("hits")
+
+        def texts() -> Iterator[str]:
+            with f:
+                f.readline()  # header
+                for line in f:
+                    yield json.loads(line)
+        return texts()
+
+    def writer(self, key: str, **header) -> CacheWriter:
+        return CacheWriter(self, key, header)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+
+def get_ingestion_cache() -> Optional[IngestionCache]:
+    """Shared cache in INGESTION_CACHE_DIR, None when it is not set"""
+    global _ingestion_cache
+    directory = os.environ.get("INGESTION_CACHE_DIR")
+    if not directory:
+        return None
+    with _ingestion_cache_lock:
+        if _ingestion_cache is None or _ingestion_cache.directory != directory:
+            _ingestion_cache = IngestionCache(directory)
+        return _ingestion_cache
+
+
+def resolve_cache(cache) -> Optional[IngestionCache]:
+    """cache argument of the parsing functions: an IngestionCache, None for the shared one, False for none"""
+    if cache is False:
+        return None
+    return get_ingestion_cache() if cache is None else cache
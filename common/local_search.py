@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    from .semantic_cache import LocalHashEmbeddings
+except Exception:
+    from semantic_cache import LocalHashEmbeddings
+
+
+DOCS_FILE = "docs.jsonl"
+EMBEDDINGS_FILE = "embeddings.f32"
+META_FILE = "meta.json"
+CENTROIDS_FILE = "ivf_centroids.npy"
+ORDER_FILE = "ivf_order.npy"
+OFFSETS_FILE = "ivf_offsets.npy"
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on normalized vectors, returns the (n_lists, dimensions) centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for list_id in range(n_lists):
+            members = vectors[assignments == list_id]
+            if len(members):
+                centroids[list_id] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+
+def build_local_index(root: str, index: str, documents: List[dict], embeddings=None, n_lists: Optional[int] = None) -> str:
+    """Writes an offline index under root/index from documents with the fields of the Azure index
+    (id, title, name, chunk, location). Chunks are embedded with the given embeddings
+    (LocalHashEmbeddings when None) and stored as a float32 matrix, partitioned into IVF lists."""
+    embeddings = embeddings or LocalHashEmbeddings()
+    path = os.path.join(root, index)
+    os.makedirs(path, exist_ok=True)
+
+    if documents:
+        vectors = _normalize_rows(np.asarray(embeddings.embed_documents([doc["chunk"] for doc in documents]), dtype=np.float32))
+        n, dimensions = vectors.shape
+        n_lists = n_lists or max(1, int(math.sqrt(n)))
+        n_lists = min(n_lists, n)
+
+        centroids = _kmeans(vectors, n_lists)
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+    else:
+        # An empty index: searches answer no documents
+        n, dimensions, n_lists = 0, len(embeddings.embed_query("")), 0
+        vectors = np.zeros((0, dimensions), dtype=np.float32)
+        centroids = np.zeros((0, dimensions), dtype=np.float32)
+        order = np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(1, dtype=np.int64)
+
+    with open(os.path.join(path, DOCS_FILE), "w", encoding="utf-8") as f:
+        for doc in documents:
+            f.write(json.dumps({field: doc.get(field, "") for field in ("id", "title", "name", "chunk", "location")}) + "\n")
+    vectors.tofile(os.path.join(path, EMBEDDINGS_FILE))
+    np.save(os.path.join(path, CENTROIDS_FILE), centroids)
+    np.save(os.path.join(path, ORDER_FILE), order)
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({"count": n, "dimensions": dimensions, "n_lists": n_lists}, f)
+    return path
+
+
+class LocalSearchIndex:
+    """One offline index: memory-mapped embeddings with an IVF partition for the vector half and
+    an in-memory BM25 inverted index for the keyword half."""
+
+    def __init__(self, path: str, embeddings=None, n_probe: int = 4, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.embeddings = embeddings or LocalHashEmbeddings()
+        self.n_probe = n_probe
+        self.k1 = k1
+        self.b = b
+
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, DOCS_FILE), encoding="utf-8") as f:
+            self.documents = [json.loads(line) for line in f]
+        if self.meta["count"]:
+            self.vectors = np.memmap(os.path.join(path, EMBEDDINGS_FILE), dtype=np.float32, mode="r",
+                                     shape=(self.meta["count"], self.meta["dimensions"]))
+        else:
+            self.vectors = np.zeros((0, self.meta["dimensions"]), dtype=np.float32)  # an empty file cannot be mapped
+        self.centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+        self.order = np.load(os.path.join(path, ORDER_FILE))
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        self._build_bm25()
+
+    def _build_bm25(self):
+        self.postings = defaultdict(list)
+        self.doc_lengths = np.zeros(len(self.documents), dtype=np.float32)
+        for doc_id, doc in enumerate(self.documents):
+            terms = Counter(tokenize(doc["title"] + " " + doc["chunk"]))
+            self.doc_lengths[doc_id] = sum(terms.values())
+            for term, tf in terms.items():
+                self.postings[term].append((doc_id, tf))
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.documents) else 0.0
+
+    def vector_search(self, query: str, k: int) -> List[tuple]:
+        """Approximate nearest neighbours: exact cosine over the n_probe IVF lists closest to the query"""
+        if not len(self.documents):
+            return []
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return []
+        vector /= norm
+        lists = np.argsort(self.centroids @ vector)[::-1][:self.n_probe]
+        # Sorted ids read the memory-mapped rows in file order
+        candidates = np.sort(np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists]))
+        if len(candidates) == 0:
+            return []
+        scores = self.vectors[candidates] @ vector
+        top = np.argsort(scores)[::-1][:k]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def bm25_search(self, query: str, k: int) -> List[tuple]:
+        n = len(self.documents)
+        avg_length = max(self.avg_length, 1.0)  # 0.0 for an empty index or chunks without a single token
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        # doc_lengths is float32: plain floats, so the results stay JSON serializable
+        return [(doc_id, float(score)) for doc_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]]
+
+    def search(self, query: str, k: int = 5) -> dict:
+        """Hybrid search returning the same JSON shape as the Azure AI Search /docs/search call.
+
+        @search.rerankerScore mixes the cosine similarity and the max-normalized BM25 score on the
+        0-4 scale of the semantic reranker, so reranker_threshold keeps its meaning.
+        """
+        vector_hits = dict(self.vector_search(query, k))
+        keyword_hits = dict(self.bm25_search(query, k))
+        max_bm25 = max(keyword_hits.values()) if keyword_hits else 1.0
+
+        scored = []
+        for doc_id in set(vector_hits) | set(keyword_hits):
+            cosine = max(0.0, float(vector_hits.get(doc_id, 0.0)))
+            bm25 = float(keyword_hits.get(doc_id, 0.0)) / max_bm25
+            scored.append((4 * (0.5 * cosine + 0.5 * bm25), doc_id))
+        scored.sort(reverse=True)
+
+        value = []
+        for score, doc_id in scored[:k]:
+            doc = self.documents[doc_id]
+            value.append(dict(doc, **{"@search.rerankerScore": round(float(score), 4),
+                                      "@search.captions": [{"text": self.caption(doc["chunk"], query), "highlights": ""}]}))
+        return {"@odata.count": len(scored), "value": value}
+
+    @staticmethod
+    def caption(chunk: str, query: str, length: int = 200) -> str:
+        """Sentence of the chunk sharing the most terms with the query (extractive caption stand-in)"""
+        terms = set(tokenize(query))
+        sentences = re.split(r"(?<=[.!?])\s+", chunk)
+        best = max(sentences, key=lambda sentence: len(terms & set(tokenize(sentence))))
+        return best[:length]
+
+
+class LocalSearchEngine:
+    """Offline stand-in for the Azure AI Search service: one LocalSearchIndex per sub-directory of root"""
+
+    def __init__(self, root: str, embeddings=None, n_probe: int = 4):
+        self.root = root
+        self.embeddings = embeddings
+        self.n_probe = n_probe
+        self._indexes: Dict[str, LocalSearchIndex] = dict()
+        self._lock = threading.Lock()
+
+    def get_index(self, index: str) -> LocalSearchIndex:
+        with self._lock:
+            if index not in self._indexes:
+                self._indexes[index] = LocalSearchIndex(os.path.join(self.root, index), self.embeddings, n_probe=self.n_probe)
+            return self._indexes[index]
+
+    def search_index(self, query: str, index: str, k: int) -> dict:
+        return self.get_index(index).search(query, k)
+
+
+def search_backend() -> str:
+    """"azure" (default) or "local", from the SEARCH_BACKEND environment variable"""
+    return os.environ.get("SEARCH_BACKEND", "azure").lower()
+
+
+def configure_local_search(root: str, embeddings=None, n_probe: int = 4) -> LocalSearchEngine:
+    """Replaces the shared local engine (used when SEARCH_BACKEND=local)"""
+    global _engine
+    with _engine_lock:
+        _engine = LocalSearchEngine(root, embeddings, n_probe=n_probe)
+    return _engine
+
+
+def get_local_search_engine() -> LocalSearchEngine:
+    """Returns the shared local engine, reading its directory from LOCAL_SEARCH_PATH on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LocalSearchEngine(os.environ.get("LOCAL_SEARCH_PATH", "local_search"),
+                                        n_probe=int(os.environ.get("LOCAL_SEARCH_N_PROBE", 4)))
+        return _engine
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build an offline search index from a JSONL file of documents")
+    parser.add_argument("source", help="JSONL file with id, title, name, chunk and location per line")
+    parser.add_argument("--index", required=True)
+    parser.add_argument("--root", default=os.environ.get("LOCAL_SEARCH_PATH", "local_search"))
+    parser.add_argument("--n-lists", type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.source, encoding="utf-8") as f:
+        documents = [json.loads(line) for line in f if line.strip()]
+    print("Index written to", build_local_index(args.root, args.index, documents, n_lists=args.n_lists))
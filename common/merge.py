@@ -0,0 +1,127 @@
+import heapq
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+try:
+    from .dedup import MinHashDeduplicator
+except Exception:
+    from dedup import MinHashDeduplicator
+
+
+MERGE_STRATEGIES = ("score", "rrf", "minmax")
+
+
+class StreamingMerger:
+    """Bounded-heap top-k merge of the results of several indexes.
+
+    Each index's hits are streamed through a min-heap of at most k entries, so memory stays O(k)
+    however many hits the indexes return. Strategies:
+
+    - "score": raw @search.rerankerScore (the historical behaviour of get_search_results)
+    - "rrf": reciprocal rank fusion, 1 / (rrf_k + rank) of the hit within its own index
+    - "minmax": reranker score min-max normalized to [0, 1] within its own index
+
+    Raw reranker scores of different indexes are not comparable, "rrf" and "minmax" give a stable
+    multi-index ranking. Hits at or below reranker_threshold are dropped with every strategy, and
+    an id returned by several indexes keeps its best score.
+
+    An entry's "score" is the score it is ranked by: the raw @search.rerankerScore with the default
+    "score" strategy, so callers of get_search_results see the values they always did, and the rrf or
+    minmax score when that strategy is asked for. "reranker_score" is always the raw reranker score.
+
+    With dedup_threshold (0-1), chunks whose MinHash similarity to a chunk already in the top k is at
+    or above the threshold are collapsed into the higher-scored one, before the top-k cut. Only hits
+    that would enter the heap are signed, so the cost stays linear in the number of hits.
+    """
+
+    def __init__(self, k: int = 5, strategy: str = "score", reranker_threshold: float = 1, sas_token: str = "", rrf_k: int = 60,
+                 dedup_threshold: Optional[float] = None):
+        if strategy not in MERGE_STRATEGIES:
+            raise ValueError(f"Unknown merge strategy {strategy}, use one of {MERGE_STRATEGIES}")
+        self.k = k
+        self.strategy = strategy
+        self.reranker_threshold = reranker_threshold
+        self.sas_token = sas_token
+        self.rrf_k = rrf_k
+        self._heap = []  # (score, -seq, id, entry): the root is the weakest of the current top k
+        self._in_heap = dict()  # id -> score of the entry currently in the heap
+        self._seq = 0
+        self._dedup = MinHashDeduplicator(dedup_threshold) if dedup_threshold else None
+
+    def _strategy_scores(self, results: list) -> Iterable[float]:
+        if self.strategy == "rrf":
+            return (1 / (self.rrf_k + rank) for rank in range(1, len(results) + 1))
+        if self.strategy == "minmax":
+            scores = [result['@search.rerankerScore'] for result in results]
+            low, high = min(scores, default=0), max(scores, default=0)
+            return ((score - low) / (high - low) if high > low else 1.0 for score in scores)
+        return (result['@search.rerankerScore'] for result in results)
+
+    def add(self, index: str, results: list) -> None:
+        """Streams the hits of one index (the 'value' list of its response) into the heap"""
+        heap = self._heap
+        threshold = self.reranker_threshold
+        for result, score in zip(results, self._strategy_scores(results)):
+            if result['@search.rerankerScore'] <= threshold:
+                continue
+            if len(heap) >= self.k and score <= heap[0][0]:
+                continue  # not better than the weakest of a full top k (ties keep the earlier hit)
+            self._push(index, result, score)
+
+    def _push(self, index: str, result: dict, score: float) -> None:
+        doc_id = result['id']
+        if doc_id in self._in_heap:
+            if score <= self._in_heap[doc_id]:
+                return
+            # Rare (same id in two indexes): drop the weaker copy, O(k)
+            self._remove(doc_id)
+
+        self._seq += 1
+        key = (score, -self._seq)
+        if len(self._heap) >= self.k and key <= self._heap[0][:2]:
+            return
+
+        signature = None
+        if self._dedup is not None:
+            signature = self._dedup.signature(result['chunk'])
+            duplicate_id = self._dedup.find(signature)
+            if duplicate_id is not None:
+                if score <= self._in_heap[duplicate_id]:
+                    return
+                self._remove(duplicate_id)
+
+        if len(self._heap) >= self.k:
+            evicted = heapq.heappop(self._heap)
+            del self._in_heap[evicted[2]]
+            if self._dedup is not None:
+                self._dedup.remove(evicted[2])
+
+        entry = {
+                    "title": result['title'],
+                    "name": result['name'],
+                    "chunk": result['chunk'],
+                    "location": result['location'] + self.sas_token if result['location'] else "",
+                    "caption": result['@search.captions'][0]['text'],
+                    "score": score,
+                    "reranker_score": result['@search.rerankerScore'],
+                    "index": index
+                }
+        heapq.heappush(self._heap, (score, -self._seq, doc_id, entry))
+        self._in_heap[doc_id] = score
+        if signature is not None:
+            self._dedup.add(doc_id, signature)
+
+    def _remove(self, doc_id: str) -> None:
+        """Takes an entry out of the heap, O(k)"""
+        self._heap[:] = [item for item in self._heap if item[2] != doc_id]
+        heapq.heapify(self._heap)
+        del self._in_heap[doc_id]
+        if self._dedup is not None:
+            self._dedup.remove(doc_id)
+
+    def results(self) -> OrderedDict:
+        """Top k entries ordered by score (ties keep arrival order), keyed by document id"""
+        ordered_content = OrderedDict()
+        for score, neg_seq, doc_id, entry in sorted(self._heap, key=lambda item: (-item[0], -item[1])):
+            ordered_content[doc_id] = entry
+        return ordered_content
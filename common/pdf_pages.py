@@ -0,0 +1,210 @@
+import os
+from io import BytesIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import pypdf
+from pypdf import PdfReader
+
+try:
+    from .ingest_cache import IngestionCache, resolve_cache
+except Exception:
+    from ingest_cache import IngestionCache, resolve_cache
+
+
+DEFAULT_WORKERS = int(os.environ.get("PDF_INGEST_WORKERS", 1))
+PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 64))
+
+
+def pdf_name(file) -> str:
+    """Name used for the sources of a PDF: the path, or the .name of a file-like object (as read_pdf_files always did)"""
+    return os.fspath(file) if isinstance(file, (str, os.PathLike)) else file.name
+
+
+def pdf_source(file) -> Union[str, bytes]:
+    """What a worker process can open again: the path, or the bytes of a file-like object"""
+    if isinstance(file, (str, os.PathLike)):
+        return os.fspath(file)
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    position = file.tell()
+    file.seek(0)
+    data = file.read()
+    file.seek(position)
+    return data
+
+
+def open_pdf(source) -> PdfReader:
+    return PdfReader(BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def extract_page_texts(source, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """extract_text() of the pages [start, stop) of a PDF path, bytes or file-like object"""
+    reader = open_pdf(source)
+    stop = len(reader.pages) if stop is None else stop
+    return [reader.pages[page_num].extract_text() for page_num in range(start, stop)]
+
+
+class PdfPage(NamedTuple):
+    """One page of a PDF: offset counts the characters of the pages before it in the same file"""
+    name: str
+    page_num: int
+    offset: int
+    text: str
+
+    @property
+    def source(self) -> str:
+        """Source name of the page in the search index, as read_pdf_files names it"""
+        return self.name + "_page_" + str(self.page_num + 1)
+
+
+def page_ranges(page_count: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def pages_from_texts(name: str, texts: Iterable[str]) -> Iterator[PdfPage]:
+    """PdfPages of consecutive page texts of one document, offsets counted from its first page"""
+    offset = 0
+    for page_num, text in enumerate(texts):
+        yield PdfPage(name, page_num, offset, text)
+        offset += len(text)
+
+
+def cached_pages(cache: Optional[IngestionCache], file, parse: Callable[[], Iterator[PdfPage]], **version) -> Iterator[PdfPage]:
+    """Pages of one document from the ingestion cache, or from parse() (stored in the cache as they go by)"""
+    if cache is None:
+        yield from parse()
+        return
+    key = cache.file_key(file, **version)
+    texts = cache.load(key)
+    if texts is not None:
+        yield from pages_from_texts(pdf_name(file), texts)
+        return
+    writer = cache.writer(key, **version)
+    try:
+        for page in parse():
+            writer.add(page.text)
+            yield page
+        writer.commit()
+    finally:
+        writer.discard()
+
+
+def pypdf_version() -> dict:
+    """Cache version key of pypdf extraction"""
+    return {"parser": "pypdf", "pypdf": pypdf.__version__}
+
+
+def is_pdf(source) -> bool:
+    """Whether a path or bytes (see pdf_source) hold a PDF, by the %PDF- header"""
+    if isinstance(source, bytes):
+        return source[:5] == b"%PDF-"
+    with open(source, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def iter_range_jobs(files, pages_per_task: Optional[int], cache: Optional[IngestionCache], version: dict,
+                    start_job: Callable) -> Iterator[tuple]:
+    """(name, start, last range of the file, cache key, job) per page range of the files, the job being
+    start_job(source, start, stop, page_count); (name, 0, True, None, cached page texts) per cached file.
+    A job is only started when its tuple is taken from the iterator.
+
+    Without pages_per_task, or for a file that is not a PDF (e.g. an image or a Word document sent to
+    Document Intelligence), the whole file is one job, start_job(source, 0, None, None), and it is not
+    opened to count its pages."""
+    for file in files:
+        name = pdf_name(file)
+        key = cache.file_key(file, **version) if cache is not None else None
+        texts = cache.load(key) if key is not None else None
+        if texts is not None:
+            yield name, 0, True, None, texts
+            continue
+        source = pdf_source(file)
+        if not pages_per_task or not is_pdf(source):
+            yield name, 0, True, key, start_job(source, 0, None, None)
+            continue
+        page_count = len(open_pdf(source).pages)
+        for start, stop in page_ranges(page_count, pages_per_task) or [(0, 0)]:
+            yield name, start, stop == page_count, key, start_job(source, start, stop, page_count)
+
+
+def iter_page_jobs(jobs: Iterator[tuple], max_pending: int, cache: Optional[IngestionCache], version: dict) -> Iterator[PdfPage]:
+    """Pages of the iter_range_jobs() jobs in order, with max_pending jobs started ahead of the consumer.
+    A job is a future-like object whose result() is the page texts of its range, or the page texts of a
+    cached file. Extracted files are stored in the cache as their pages go by."""
+    pending = deque()
+    writer = None
+
+    def start_next() -> bool:
+        job = next(jobs, None)
+        if job is None:
+            return False
+        pending.append(job)
+        return True
+
+    try:
+        while len(pending) < max_pending and start_next():
+            pass
+        offset = 0
+        while pending:
+            name, start, last, key, job = pending.popleft()
+            if not hasattr(job, "result"):
+                start_next()
+                yield from pages_from_texts(name, job)
+                continue
+            texts = job.result()
+            start_next()
+            if start == 0:
+                offset = 0
+                writer = cache.writer(key, **version) if key is not None else None
+            for page_num, text in enumerate(texts, start):
+                if writer is not None:
+                    writer.add(text)
+                yield PdfPage(name, page_num, offset, text)
+                offset += len(text)
+            if writer is not None and last:
+                writer.commit()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.discard()
+
+
+def _iter_file_pages(file) -> Iterator[PdfPage]:
+    return pages_from_texts(pdf_name(file), (page.extract_text() for page in open_pdf(file).pages))
+
+
+def iter_pypdf_pages(files, max_workers: Optional[int] = None, pages_per_task: int = PAGES_PER_TASK,
+                     max_pending: Optional[int] = None, cache=None) -> Iterator[PdfPage]:
+    """Yields the pages of the PDFs one at a time, in order, with their text extracted by pypdf.
+
+    Nothing is kept once a page is yielded, so memory stays flat whatever the size of the documents
+    when the pages go straight into a chunker or an uploader.
+
+    pypdf text extraction is CPU-bound, so with max_workers > 1 it runs on a process pool: one task per
+    pages_per_task pages, at most max_pending tasks (2 per worker) ahead of the consumer. Workers get the
+    path of the file, or its bytes for file-like objects (e.g. uploads). max_workers defaults to
+    PDF_INGEST_WORKERS (1, in process).
+
+    Files already in the ingestion cache (common/ingest_cache.py: an IngestionCache, None for the one in
+    INGESTION_CACHE_DIR, False for none) are read from it instead of being parsed.
+
+        for page in iter_pypdf_pages(files, max_workers=os.cpu_count()):
+            upload(page.source, page.text)
+    """
+    max_workers = DEFAULT_WORKERS if max_workers is None else max_workers
+    cache = resolve_cache(cache)
+    if max_workers <= 1:
+        for file in files:
+            yield from cached_pages(cache, file, lambda: _iter_file_pages(file), **pypdf_version())
+        return
+
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+    jobs = iter_range_jobs(files, pages_per_task, cache, pypdf_version(),
+                           lambda source, start, stop, page_count: pool.submit(extract_page_texts, source, start, stop))
+    try:
+        yield from iter_page_jobs(jobs, max_pending or 2 * max_workers, cache, pypdf_version())
+    finally:
+        # The consumer may stop early: drop the queued ranges instead of extracting them
+        pool.shutdown(wait=True, cancel_futures=True)
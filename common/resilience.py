@@ -0,0 +1,405 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+try:
+    from .executors import get_executor
+except Exception:
+    from executors import get_executor
+
+
+RETRY_STATUSES = (429, 503)
+
+_resilience = None
+_resilience_lock = threading.Lock()
+
+
+class SearchUnavailable(Exception):
+    """An index could not answer: circuit open, deadline exceeded or retries exhausted"""
+
+    def __init__(self, index: str, reason: str):
+        super().__init__(f"Index {index} unavailable: {reason}")
+        self.index = index
+        self.reason = reason
+
+
+class _RetryableResponse(Exception):
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+def _usable(response: httpx.Response) -> bool:
+    """Whether an answer can win a hedged race: not throttled and not a server error"""
+    return response.status_code < 500 and response.status_code not in RETRY_STATUSES
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Delay asked by the service, from retry-after-ms or Retry-After (seconds or HTTP date)"""
+    if "retry-after-ms" in response.headers:
+        try:
+            return float(response.headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class CircuitBreaker:
+    """Per-index breaker: opens after failure_threshold consecutive failures, lets one probe request
+    through after reset_timeout seconds (half-open) and closes again when it succeeds"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.acquire()[0]
+
+    def acquire(self) -> Tuple[bool, bool]:
+        """(allowed, probe): probe is True for the one call let through while half-open, which must
+        end with record_success(), record_failure() or release_probe()"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True, False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True, True
+            return False, False
+
+    def release_probe(self) -> None:
+        """Ends a probe that neither succeeded nor failed (cancelled, or an unexpected error): the next
+        call may probe again"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class LatencyTracker:
+    """Latencies of the last window successful requests of an index"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class SearchResilience:
+    """Deadlines, retries, hedged requests and circuit breakers for the per-index search calls.
+
+    - every call has a deadline (seconds) shared by all its attempts
+    - 429/503 answers and transport errors are retried up to max_attempts times with full-jitter
+      exponential backoff, waiting at least the Retry-After the service asked for
+    - with hedge=True, a duplicate request is sent when an attempt is slower than the p95 latency
+      of its index (or hedge_after seconds) and the first answer wins
+    - an index failing failure_threshold calls in a row is skipped for reset_timeout seconds;
+      get_search_results then answers from the remaining indexes
+
+        configure_search_resilience(deadline=3, hedge=True)
+    """
+
+    def __init__(self, deadline: float = 10, max_attempts: int = 3, backoff_base: float = 0.2, backoff_max: float = 5,
+                 hedge: bool = False, hedge_after: Optional[float] = None, hedge_quantile: float = 95,
+                 failure_threshold: int = 5, reset_timeout: float = 30):
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = dict()
+        self._latencies: Dict[str, LatencyTracker] = dict()
+        self._counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0, "rejected": 0}
+
+    def breaker(self, index: str) -> CircuitBreaker:
+        with self._lock:
+            if index not in self._breakers:
+                self._breakers[index] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[index]
+
+    def latencies(self, index: str) -> LatencyTracker:
+        with self._lock:
+            if index not in self._latencies:
+                self._latencies[index] = LatencyTracker()
+            return self._latencies[index]
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def hedge_delay(self, index: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        return self.latencies(index).percentile(self.hedge_quantile)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def _check(self, response: httpx.Response) -> dict:
+        if response.status_code in RETRY_STATUSES:
+            raise _RetryableResponse(response)
+        response.raise_for_status()
+        return response.json()
+
+    def _start(self, index: str) -> Tuple[float, bool]:
+        """(deadline, probe) of a new call, see CircuitBreaker.acquire"""
+        self._count("calls")
+        allowed, probe = self.breaker(index).acquire()
+        if not allowed:
+            self._count("rejected")
+            raise SearchUnavailable(index, "circuit open")
+        return time.monotonic() + self.deadline, probe
+
+    def _retry_delay(self, index: str, attempt: int, error: Exception, deadline: float) -> float:
+        """Seconds to wait before the next attempt, or SearchUnavailable when there is none"""
+        retry_after = retry_after_seconds(error.response) if isinstance(error, _RetryableResponse) else None
+        delay = self.backoff(attempt, retry_after)
+        if attempt + 1 >= self.max_attempts or time.monotonic() + delay >= deadline:
+            self._fail(index)
+            raise SearchUnavailable(index, f"{error} after {attempt + 1} attempt(s)") from error
+        self._count("retries")
+        return delay
+
+    def _fail(self, index: str) -> None:
+        self._count("failures")
+        self.breaker(index).record_failure()
+
+    def _succeed(self, index: str, seconds: float) -> None:
+        self.breaker(index).record_success()
+        self.latencies(index).record(seconds)
+
+    def call(self, index: str, send: Callable[[float], httpx.Response]) -> dict:
+        """Runs send(timeout) -> httpx.Response under the policy and returns the JSON body"""
+        deadline, probe = self._start(index)
+        try:
+            for attempt in range(self.max_attempts):
+                started = time.monotonic()
+                try:
+                    result = self._check(self._send_hedged(index, send, deadline))
+                    self._succeed(index, time.monotonic() - started)
+                    return result
+                except httpx.HTTPStatusError as e:
+                    # Other error answers are not retried; only server errors count against the index
+                    self._status_error(index, e)
+                    raise
+                except SearchUnavailable:
+                    self._fail(index)
+                    raise
+                except (_RetryableResponse, httpx.TransportError) as e:
+                    time.sleep(self._retry_delay(index, attempt, e, deadline))
+        finally:
+            if probe:
+                # A probe stopped by anything else (e.g. a bad JSON body) must not keep the breaker half-open
+                self.breaker(index).release_probe()
+
+    async def acall(self, index: str, send: Callable[[float], Awaitable[httpx.Response]]) -> dict:
+        """Async twin of call, send(timeout) being a coroutine function"""
+        deadline, probe = self._start(index)
+        try:
+            for attempt in range(self.max_attempts):
+                started = time.monotonic()
+                try:
+                    result = self._check(await self._asend_hedged(index, send, deadline))
+                    self._succeed(index, time.monotonic() - started)
+                    return result
+                except httpx.HTTPStatusError as e:
+                    self._status_error(index, e)
+                    raise
+                except SearchUnavailable:
+                    self._fail(index)
+                    raise
+                except (_RetryableResponse, httpx.TransportError) as e:
+                    await asyncio.sleep(self._retry_delay(index, attempt, e, deadline))
+        finally:
+            if probe:
+                # Cancelled (stream closed, speculation dropped) or an unexpected error: neither a success
+                # nor a failure of the index
+                self.breaker(index).release_probe()
+
+    def _status_error(self, index: str, error: httpx.HTTPStatusError) -> None:
+        if error.response.status_code >= 500:
+            self._fail(index)
+        else:
+            self.breaker(index).record_success()
+
+    def _remaining(self, index: str, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise SearchUnavailable(index, "deadline exceeded")
+        return remaining
+
+    def _send_hedged(self, index: str, send: Callable[[float], httpx.Response], deadline: float) -> httpx.Response:
+        hedge_delay = self.hedge_delay(index)
+        remaining = self._remaining(index, deadline)
+        if hedge_delay is None or hedge_delay >= remaining:
+            try:
+                return send(remaining)
+            except httpx.TimeoutException:
+                self._remaining(index, deadline)  # SearchUnavailable once the deadline is gone, otherwise retried
+                raise
+
+        executor = get_executor("search-hedge")
+        primary = executor.submit(send, remaining)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        hedged = executor.submit(send, self._remaining(index, deadline))
+        pending = {primary, hedged}
+        error = None
+        failed_response = None
+        while pending:
+            done, pending = wait(pending, timeout=self._remaining(index, deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                raise SearchUnavailable(index, "deadline exceeded")
+            for future in done:
+                if future.exception() is None:
+                    if not _usable(future.result()):
+                        failed_response = future.result()  # a fast 429/503/5xx does not beat a slower answer
+                        continue
+                    if future is hedged:
+                        self._count("hedge_wins")
+                    # The slower request is left to finish on its own, a blocking call cannot be cancelled
+                    return future.result()
+                error = future.exception()
+        if failed_response is not None:
+            return failed_response
+        if isinstance(error, httpx.TimeoutException):
+            self._remaining(index, deadline)
+        raise error
+
+    async def _asend_hedged(self, index: str, send: Callable[[float], Awaitable[httpx.Response]], deadline: float) -> httpx.Response:
+        hedge_delay = self.hedge_delay(index)
+        remaining = self._remaining(index, deadline)
+        primary = asyncio.ensure_future(send(remaining))
+        pending = {primary}
+        hedged = None
+        try:
+            if hedge_delay is not None and hedge_delay < remaining:
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self._count("hedges")
+                    hedged = asyncio.ensure_future(send(self._remaining(index, deadline)))
+                    pending.add(hedged)
+                else:
+                    return primary.result()
+            error = None
+            failed_response = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=self._remaining(index, deadline),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise SearchUnavailable(index, "deadline exceeded")
+                for task in done:
+                    if task.exception() is None:
+                        if not _usable(task.result()):
+                            failed_response = task.result()
+                            continue
+                        if task is hedged:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            if failed_response is not None:
+                return failed_response
+            if isinstance(error, httpx.TimeoutException):
+                self._remaining(index, deadline)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            indexes = list(self._breakers)
+        counters["indexes"] = dict()
+        for index in indexes:
+            p95 = self.latencies(index).percentile(95)
+            counters["indexes"][index] = {"circuit": self.breaker(index).state, "p95_ms": p95 * 1000 if p95 is not None else None}
+        return counters
+
+
+def configure_search_resilience(**settings) -> SearchResilience:
+    """Replaces the shared resilience policy (see SearchResilience for the settings)"""
+    global _resilience
+    with _resilience_lock:
+        _resilience = SearchResilience(**settings)
+    return _resilience
+
+
+def get_search_resilience() -> SearchResilience:
+    """Returns the shared policy, built on first use from SEARCH_DEADLINE, SEARCH_MAX_ATTEMPTS, SEARCH_HEDGE,
+    SEARCH_HEDGE_AFTER, SEARCH_BREAKER_FAILURES and SEARCH_BREAKER_RESET"""
+    global _resilience
+    with _resilience_lock:
+        if _resilience is None:
+            hedge_after = os.environ.get("SEARCH_HEDGE_AFTER")
+            _resilience = SearchResilience(deadline=float(os.environ.get("SEARCH_DEADLINE", 10)),
+                                           max_attempts=int(os.environ.get("SEARCH_MAX_ATTEMPTS", 3)),
+                                           hedge=os.environ.get("SEARCH_HEDGE", "false").lower() in ("1", "true", "yes"),
+                                           hedge_after=float(hedge_after) if hedge_after else None,
+                                           failure_threshold=int(os.environ.get("SEARCH_BREAKER_FAILURES", 5)),
+                                           reset_timeout=float(os.environ.get("SEARCH_BREAKER_RESET", 30)))
+        return _resilience
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class LocalHashEmbeddings:
+    """Deterministic, offline embedder (hashed word and character n-grams).
+
+    Implements the embed_query/aembed_query part of the LangChain Embeddings interface, so it can
+    stand in for AzureOpenAIEmbeddings in tests and local runs.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> List[str]:
+        words = re.findall(r"\w+", text.lower())
+        grams = [word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))]
+        return words + grams
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+def default_embeddings():
+    """AzureOpenAIEmbeddings on the EMBEDDING_DEPLOYMENT_NAME deployment"""
+    from langchain_openai import AzureOpenAIEmbeddings
+    return AzureOpenAIEmbeddings(deployment=os.environ["EMBEDDING_DEPLOYMENT_NAME"], chunk_size=1)
+
+
+class SemanticCache:
+    """Answer cache keyed on the meaning of the question instead of its exact text.
+
+    Questions are embedded and kept as rows of a normalized float32 matrix; a lookup is one
+    matrix-vector product (cosine similarity against every live entry of the tool) and returns the
+    cached answer when the best match is at or above the similarity threshold. Entries expire after
+    ttl seconds and can be invalidated per tool.
+
+    An entry only answers lookups of the same tool and scope: the scope carries what else the answer
+    depends on (the indexes searched, the tenant or user it was given to, see semantic_cache_scope).
+
+        cache = SemanticCache(threshold=0.9)
+        doc_search = DocSearchAgent(llm=llm, indexes=indexes, semantic_cache=cache, ...)
+    """
+
+    def __init__(self, embeddings=None, threshold: float = 0.92, ttl: float = 3600, max_entries: int = 10000):
+        self._embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None  # (capacity, dimensions) float32, rows [0, _size) are in use
+        self._size = 0
+        self._expires_at = None
+        # Tool and scope of each row as ids into _tool_ids / _scope_ids, so lookups compare integers
+        self._tool_of = None
+        self._scope_of = None
+        self._tool_ids: Dict[str, int] = dict()
+        self._scope_ids: Dict[str, int] = dict()
+        self._answers = []
+        self._recent_vectors = OrderedDict()  # question -> vector, so lookup + add embed only once
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = default_embeddings()
+        return self._embeddings
+
+    def _normalize(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _remember(self, question: str, vector: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._recent_vectors[question] = vector
+            if len(self._recent_vectors) > 256:
+                self._recent_vectors.popitem(last=False)
+        return vector
+
+    def _recent(self, question: str) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._recent_vectors.get(question)
+
+    def embed(self, question: str) -> np.ndarray:
+        vector = self._recent(question)
+        if vector is None:
+            vector = self._remember(question, self._normalize(self.embeddings.embed_query(question)))
+        return vector
+
+    async def aembed(self, question: str) -> np.ndarray:
+        vector = self._recent(question)
+        if vector is None:
+            vector = self._remember(question, self._normalize(await self.embeddings.aembed_query(question)))
+        return vector
+
+    def _search(self, vector: np.ndarray, tool: str, scope: str) -> Optional[str]:
+        with self._lock:
+            size = self._size
+            tool_id, scope_id = self._tool_ids.get(tool, -1), self._scope_ids.get(scope, -1)
+            live = ((self._expires_at[:size] > time.time()) & (self._tool_of[:size] == tool_id)
+                    & (self._scope_of[:size] == scope_id)) if size and tool_id >= 0 and scope_id >= 0 else None
+            if live is None or not live.any():
+                self.misses += 1
+                return None
+            similarities = np.where(live, self._vectors[:size] @ vector, -1.0)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._answers[best]
+
+    def _add(self, vector: np.ndarray, answer: str, tool: str, scope: str) -> None:
+        with self._lock:
+            self._compact()
+            if self._vectors is None:
+                self._vectors = np.zeros((64, vector.shape[0]), dtype=np.float32)
+                self._expires_at = np.zeros(64, dtype=np.float64)
+                self._tool_of = np.zeros(64, dtype=np.int32)
+                self._scope_of = np.zeros(64, dtype=np.int32)
+            if self._size == self._vectors.shape[0]:
+                # Grow geometrically so adding stays amortized O(1)
+                self._vectors = np.vstack([self._vectors, np.zeros_like(self._vectors)])
+                self._expires_at = np.concatenate([self._expires_at, np.zeros_like(self._expires_at)])
+                self._tool_of = np.concatenate([self._tool_of, np.zeros_like(self._tool_of)])
+                self._scope_of = np.concatenate([self._scope_of, np.zeros_like(self._scope_of)])
+            self._vectors[self._size] = vector
+            self._expires_at[self._size] = time.time() + self.ttl
+            self._tool_of[self._size] = self._tool_ids.setdefault(tool, len(self._tool_ids))
+            self._scope_of[self._size] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._answers.append(answer)
+            self._size += 1
+
+    def _compact(self) -> None:
+        """Drops expired entries, then the oldest ones above max_entries. Called with the lock held."""
+        if self._size == 0:
+            return
+        keep = self._expires_at[:self._size] > time.time()
+        overflow = int(keep.sum()) - self.max_entries + 1
+        if overflow > 0:
+            keep[np.flatnonzero(keep)[:overflow]] = False
+        if keep.all():
+            return
+        kept = int(keep.sum())
+        self._vectors[:kept] = self._vectors[:self._size][keep]
+        self._expires_at[:kept] = self._expires_at[:self._size][keep]
+        self._tool_of[:kept] = self._tool_of[:self._size][keep]
+        self._scope_of[:kept] = self._scope_of[:self._size][keep]
+        self._answers = [answer for answer, k in zip(self._answers, keep) if k]
+        self._size = kept
+        if len(self._scope_ids) > 2 * kept + 64:
+            # Scopes are per user: forget the ids of those without entries left
+            self._scope_ids, self._scope_of[:kept] = _renumber(self._scope_ids, self._scope_of[:kept])
+
+    def lookup(self, question: str, tool: str = "default", scope: str = "") -> Optional[str]:
+        """Returns the cached answer of the most similar earlier question of this tool and scope, or None"""
+        return self._search(self.embed(question), tool, scope)
+
+    async def alookup(self, question: str, tool: str = "default", scope: str = "") -> Optional[str]:
+        return self._search(await self.aembed(question), tool, scope)
+
+    def add(self, question: str, answer: str, tool: str = "default", scope: str = "") -> None:
+        self._add(self.embed(question), answer, tool, scope)
+
+    async def aadd(self, question: str, answer: str, tool: str = "default", scope: str = "") -> None:
+        self._add(await self.aembed(question), answer, tool, scope)
+
+    def invalidate(self, tool: Optional[str] = None) -> None:
+        """Removes every entry of a tool, or all entries when tool is None"""
+        with self._lock:
+            if self._size == 0:
+                return
+            if tool is None:
+                self._expires_at[:self._size] = 0
+            elif tool in self._tool_ids:
+                self._expires_at[:self._size][self._tool_of[:self._size] == self._tool_ids[tool]] = 0
+            self._compact()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": self._size,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+def _renumber(ids: Dict[str, int], rows: np.ndarray) -> tuple:
+    """(ids, rows) keeping only the ids still used by rows, renumbered from 0"""
+    used, rows = np.unique(rows, return_inverse=True)
+    names = {value: name for name, value in ids.items()}
+    return {names[value]: i for i, value in enumerate(used.tolist())}, rows
+
+
+def semantic_cache_scope(run_manager=None, *parts) -> str:
+    """Scope of the semantic cache entries of a tool run: parts (e.g. the indexes it searches) plus the
+    tenant_id and user_id of the request, from the run metadata (where LangChain copies the
+    config["configurable"] values), so answers are not shared across indexes, tenants or users"""
+    metadata = getattr(run_manager, "metadata", None) or dict()
+    return json.dumps([sorted(map(str, parts)), str(metadata.get("tenant_id", "")), str(metadata.get("user_id", ""))])
@@ -0,0 +1,142 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import tiktoken
+from tiktoken.model import encoding_name_for_model
+
+
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_THREADS = int(os.environ.get("TOKEN_COUNT_THREADS", min(8, os.cpu_count() or 1)))
+DEFAULT_MEMO_SIZE = int(os.environ.get("TOKEN_COUNT_MEMO_SIZE", 65536))
+
+_counters: Dict[str, "TokenCounter"] = dict()
+_counters_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """tiktoken encoder, loaded once per encoding name"""
+    return tiktoken.get_encoding(encoding_name)
+
+
+def encoding_name_for(model: Optional[str] = None) -> str:
+    """Encoding of a model or Azure deployment name: o200k_base for the GPT-4o / o-series family,
+    cl100k_base for GPT-4 / GPT-3.5 and unknown names. Encoding names are returned as they are."""
+    if not model:
+        return DEFAULT_ENCODING
+    if model in tiktoken.list_encoding_names():
+        return model
+    try:
+        return encoding_name_for_model(model)
+    except KeyError:
+        pass
+    # Deployment names are free text (e.g. "gpt4o-mini-prod"), match on the model family
+    name = model.lower().replace("-", "").replace("_", "").replace(".", "")
+    if "4o" in name or name.startswith(("o1", "o3", "o4")):
+        return "o200k_base"
+    return DEFAULT_ENCODING
+
+
+class TokenCounter:
+    """Token counts for one encoding: the encoder is loaded once, counts of repeated strings are
+    memoized (LRU of memo_size strings, keyed by their sha1 digest so the memo does not hold the texts)
+    and lists are encoded in batches on several threads (tiktoken releases the GIL while encoding).
+
+    Text is counted as ordinary text: special tokens such as <|endoftext|> do not raise.
+
+        counter = get_token_counter("gpt-4o")
+        counter.count("question"), counter.count_many(chunks), counter.count_documents(docs)
+    """
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, memo_size: int = DEFAULT_MEMO_SIZE, num_threads: int = DEFAULT_THREADS):
+        self.encoding_name = encoding_name
+        self.memo_size = memo_size
+        self.num_threads = num_threads
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        return get_encoding(self.encoding_name)
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+
+    def _lookup(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            count = self._memo.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def _remember(self, counts: Dict[bytes, int]) -> None:
+        with self._lock:
+            self._memo.update(counts)
+            for key in counts:
+                self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        key = self._key(text)
+        count = self._lookup(key)
+        if count is None:
+            count = len(self.encoding.encode_ordinary(text))
+            self._remember({key: count})
+        return count
+
+    def count_many(self, texts: Iterable[str]) -> List[int]:
+        """Counts of a list of strings, in order. Unseen strings are encoded in one threaded batch."""
+        texts = list(texts)
+        keys = [self._key(text) for text in texts]
+        counts = dict()
+        missing = dict()  # key -> text
+        for key, text in zip(keys, texts):
+            if key in counts:
+                continue
+            count = self._lookup(key)
+            counts[key] = count
+            if count is None:
+                missing[key] = text
+        if missing:
+            if self.num_threads > 1 and len(missing) > 1:
+                encoded = self.encoding.encode_ordinary_batch(list(missing.values()), num_threads=self.num_threads)
+            else:
+                encoded = [self.encoding.encode_ordinary(text) for text in missing.values()]
+            new_counts = {key: len(tokens) for key, tokens in zip(missing, encoded)}
+            counts.update(new_counts)
+            self._remember(new_counts)
+        return [counts[key] for key in keys]
+
+    def count_documents(self, docs) -> int:
+        """Total tokens of the page_content of LangChain Documents"""
+        return sum(self.count_many(doc.page_content for doc in docs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"encoding": self.encoding_name, "memoized": len(self._memo), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+def get_token_counter(model: Optional[str] = None) -> TokenCounter:
+    """Shared TokenCounter of a model, deployment or encoding name (cl100k_base when None)"""
+    encoding_name = encoding_name_for(model)
+    with _counters_lock:
+        if encoding_name not in _counters:
+            _counters[encoding_name] = TokenCounter(encoding_name)
+        return _counters[encoding_name]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return get_token_counter(model).count(text)
@@ -0,0 +1,51 @@
+"""BoundedExecutor counters: tasks cancelled before they start (future.cancel() or shutdown with
+cancel_futures) leave the queue depth.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.executors import BoundedExecutor
+
+
+def blocked_executor(queued: int):
+    """Executor with its one worker blocked until the returned event is set, and queued tasks waiting"""
+    executor = BoundedExecutor("test", max_workers=1)
+    release, started = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    running = executor.submit(block)
+    started.wait(5)
+    waiting = [executor.submit(lambda: None) for _ in range(queued)]
+    return executor, release, running, waiting
+
+
+def test_cancelled_futures_leave_the_queue():
+    executor, release, running, waiting = blocked_executor(3)
+    assert executor.stats()["queued"] == 3
+
+    assert waiting[0].cancel()
+    assert executor.stats()["queued"] == 2
+    release.set()
+    running.result()
+    for future in waiting[1:]:
+        future.result()
+    assert executor.stats() == {"max_workers": 1, "queued": 0, "active": 0, "completed": 3}
+    executor.shutdown()
+
+
+def test_shutdown_with_cancel_futures_empties_the_queue():
+    executor, release, running, waiting = blocked_executor(5)
+    executor.shutdown(wait=False, cancel_futures=True)
+    assert all(future.cancelled() for future in waiting)
+    assert executor.stats()["queued"] == 0
+    release.set()
+    running.result()
+    assert executor.stats() == {"max_workers": 1, "queued": 0, "active": 0, "completed": 1}
@@ -0,0 +1,72 @@
+"""Text extraction of the registered formats from the small files in tests/fixtures, and files that fail
+to extract (recorded in the stats and skipped).
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.extractors import ExtractionStats, extract_docx, extract_html, iter_extracted_pages, paginate
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+HTML = os.path.join(FIXTURES, "runbook.html")
+DOCX = os.path.join(FIXTURES, "runbook.docx")
+
+
+def test_html_keeps_visible_text_only():
+    pytest.importorskip("bs4")
+    text = "".join(extract_html(HTML))
+    assert "Quarantine the reported message" in text and "Notify the security operations center" in text
+    for hidden in ("font-family", "analytics", "Enable JavaScript", "Unused template row"):
+        assert hidden not in text
+    assert "\n\n\n" not in text
+
+
+def test_html_from_bytes():
+    pytest.importorskip("bs4")
+    with open(HTML, "rb") as f:
+        assert extract_html(f.read()) == extract_html(HTML)
+
+
+def test_docx_paragraphs():
+    pytest.importorskip("docx2txt")
+    text = "".join(extract_docx(DOCX))
+    assert text.startswith("Ransomware response runbook")
+    assert "Isolate the infected hosts from the network." in text
+    with open(DOCX, "rb") as f:
+        assert extract_docx(f.read()) == extract_docx(DOCX)
+
+
+def test_paginate_keeps_offsets_exact():
+    text = "First paragraph of the runbook.\n\nSecond one, a bit longer than the first.\n\n" * 20
+    pages = paginate(text, page_chars=120)
+    assert "".join(pages) == text
+    assert all(len(page) <= 120 for page in pages)
+
+
+def test_pages_of_both_formats_in_order():
+    pytest.importorskip("bs4")
+    pytest.importorskip("docx2txt")
+    stats = ExtractionStats()
+    pages = list(iter_extracted_pages([DOCX, HTML], max_workers=1, cache=False, stats=stats))
+    assert [page.name for page in pages] == [DOCX, HTML]
+    summary = stats.summary()
+    assert summary["formats"]["docx"]["files"] == 1 and summary["formats"]["html"]["files"] == 1
+    assert summary["failed"] == {}
+
+
+def test_failed_file_is_recorded_and_skipped(tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a PDF at all")
+    notes = tmp_path / "notes.txt"
+    notes.write_text("Escalate to the on-call analyst.", encoding="utf-8")
+    stats = ExtractionStats()
+    pages = list(iter_extracted_pages([str(broken), str(notes)], max_workers=1, cache=False, stats=stats))
+    assert [page.name for page in pages] == [str(notes)]
+    assert list(stats.failed) == [str(broken)]
+    assert stats.summary()["formats"]["pdf"]["errors"] == 1
@@ -0,0 +1,120 @@
+"""IndexPusher against the local fake search server: uploads, unchanged chunks skipped, stale chunks
+deleted (per file, told apart by their full path) and 503s with Retry-After retried.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.fake_search import FakeSearchServer
+from common.chunking import TokenChunker
+from common.indexing import IndexManifest, IndexPusher, SOURCE_FIELD
+from common.search_client import build_search_client
+
+
+INDEX = "test-push"
+
+
+def chunk_documents(path: str, n: int, version: int = 0) -> list:
+    name = os.path.basename(path)
+    return [{"id": f"{path.replace('/', '-')}-{i}", "title": name, "name": name, "location": f"{name}_page_{i + 1}",
+             "chunk": f"Chunk {i} of {path}, version {version}", SOURCE_FIELD: path} for i in range(n)]
+
+
+@pytest.fixture
+def server():
+    with FakeSearchServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    return build_search_client(endpoint=server.url, api_key="fake", api_version="2023-11-01")
+
+
+def test_uploads_in_batches_without_the_source_field(server, client, tmp_path):
+    documents = chunk_documents("a/runbook.pdf", 25)
+    stats = IndexPusher(INDEX, manifest=IndexManifest.for_index(INDEX, str(tmp_path)), client=client, batch_size=10).push(documents)
+    assert stats["uploaded"] == 25 and stats["batches"] == 3 and not stats["failed"]
+    indexed = server.indexed(INDEX)
+    assert set(indexed) == {document["id"] for document in documents}
+    assert all(SOURCE_FIELD not in document for document in indexed.values())
+
+
+def test_unchanged_documents_are_skipped(server, client, tmp_path):
+    manifest = IndexManifest.for_index(INDEX, str(tmp_path))
+    IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 10))
+    changed = chunk_documents("a/runbook.pdf", 10)
+    changed[3]["chunk"] += " revised"
+    stats = IndexPusher(INDEX, manifest=IndexManifest.for_index(INDEX, str(tmp_path)), client=client).push(changed)
+    assert (stats["uploaded"], stats["unchanged"], stats["deleted"]) == (1, 9, 0)
+    assert server.indexed(INDEX)[changed[3]["id"]]["chunk"].endswith("revised")
+
+
+def test_stale_chunks_are_deleted_per_file(server, client, tmp_path):
+    manifest = IndexManifest.for_index(INDEX, str(tmp_path))
+    IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 10)
+                                                              + chunk_documents("b/runbook.pdf", 10))
+    # a/runbook.pdf got shorter; b/runbook.pdf, same basename, is not in the push and keeps its chunks
+    stats = IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 6))
+    assert (stats["uploaded"], stats["unchanged"], stats["deleted"]) == (0, 6, 4)
+    assert len(server.indexed(INDEX)) == 16
+
+    stats = IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 6), full_sync=True)
+    assert stats["deleted"] == 10
+    assert set(server.indexed(INDEX)) == {document["id"] for document in chunk_documents("a/runbook.pdf", 6)}
+    assert len(IndexManifest.for_index(INDEX, str(tmp_path)).entries) == 6
+
+
+def test_kept_files_are_not_deleted_on_full_sync(server, client, tmp_path):
+    manifest = IndexManifest.for_index(INDEX, str(tmp_path))
+    IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 4)
+                                                              + chunk_documents("b/broken.docx", 3))
+    # b/broken.docx failed to extract this time: it is missing from the push but keeps its chunks
+    stats = IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 4), full_sync=True,
+                                                                      keep={"b/broken.docx"})
+    assert stats["deleted"] == 0
+    assert len(server.indexed(INDEX)) == 7
+
+
+def test_processed_files_without_chunks_lose_their_chunks(server, client, tmp_path):
+    manifest = IndexManifest.for_index(INDEX, str(tmp_path))
+    IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 4)
+                                                              + chunk_documents("b/emptied.docx", 3))
+    # b/emptied.docx was processed but has no text left: nothing of it is pushed, its chunks still go
+    stats = IndexPusher(INDEX, manifest=manifest, client=client).push(chunk_documents("a/runbook.pdf", 4),
+                                                                      processed=["a/runbook.pdf", "b/emptied.docx"])
+    assert (stats["unchanged"], stats["deleted"]) == (4, 3)
+    assert len(server.indexed(INDEX)) == 4
+
+
+class WordCounter:
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def test_inserted_paragraph_only_pushes_the_chunks_it_changes(server, client, tmp_path):
+    chunker = TokenChunker(chunk_tokens=12, overlap_tokens=0, counter=WordCounter())
+    paragraphs = [f"Paragraph {i} of the runbook has a few words.\n\n" for i in range(10)]
+    manifest = IndexManifest.for_index(INDEX, str(tmp_path))
+
+    def push(texts):
+        documents = [chunk.to_document(SOURCE_FIELD) for chunk in chunker.split_document("a/runbook.txt", texts)]
+        return IndexPusher(INDEX, manifest=manifest, client=client).push(documents)
+
+    assert push(["".join(paragraphs)])["uploaded"] == 10
+    stats = push(["".join(paragraphs[:3] + ["A new warning paragraph.\n\n"] + paragraphs[3:])])
+    assert (stats["uploaded"], stats["unchanged"], stats["deleted"]) == (1, 10, 0)
+    assert len(server.indexed(INDEX)) == 11
+
+
+def test_503_with_retry_after_is_retried(server, client):
+    server.inject(INDEX, fail_next=2, status=503, retry_after=0.05)
+    stats = IndexPusher(INDEX, client=client, max_workers=2, backoff_base=0.01).push(chunk_documents("a/runbook.pdf", 5))
+    assert stats["uploaded"] == 5 and not stats["failed"]
+    assert stats["retries"] == 2 and stats["throttled"] == 2
+    assert len(server.indexed(INDEX)) == 5
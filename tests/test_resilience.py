@@ -0,0 +1,150 @@
+"""SearchResilience against the local fake search server with injected faults: Retry-After honoured,
+circuit breaker opening / half-open probe / closing, hedged requests beating a slow tail, and indexes
+behind an open breaker answered with degraded_response.
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.fake_search import FakeSearchServer
+from common.resilience import SearchResilience, SearchUnavailable, configure_search_resilience
+from common.search_client import build_search_client, close_search_client, configure_search_client
+
+
+INDEX = "test-resilience"
+
+
+@pytest.fixture
+def server():
+    with FakeSearchServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    client = build_search_client(endpoint=server.url, api_key="fake", api_version="2023-11-01")
+    yield client
+    client.close()
+
+
+def search_sender(client, index: str = INDEX, before=None):
+    """send(timeout) searching the index, calling before(attempt) ahead of every request"""
+    body = json.dumps({"search": "question", "top": 5})
+    attempts = []
+
+    def send(timeout):
+        attempts.append(timeout)
+        if before is not None:
+            before(len(attempts))
+        return client.post("/indexes/" + index + "/docs/search", content=body, timeout=timeout)
+    return send
+
+
+def searches(server, index: str = INDEX) -> int:
+    return sum(1 for method, path in server.requests if path == f"/indexes/{index}/docs/search")
+
+
+def test_429_waits_for_retry_after(server, client):
+    server.inject(INDEX, fail_next=1, status=429, retry_after=0.3)
+    policy = SearchResilience(backoff_base=0.001)
+
+    started = time.monotonic()
+    result = policy.call(INDEX, search_sender(client))
+
+    assert time.monotonic() - started >= 0.3
+    assert len(result["value"]) == 5
+    assert searches(server) == 2
+    assert policy.stats()["retries"] == 1
+    assert policy.breaker(INDEX).state == "closed"
+
+
+def test_breaker_opens_probes_half_open_and_closes(server, client):
+    server.inject(INDEX, fail_next=2, status=503)
+    policy = SearchResilience(max_attempts=1, failure_threshold=2, reset_timeout=0.2)
+    send = search_sender(client)
+    breaker = policy.breaker(INDEX)
+
+    for _ in range(2):
+        with pytest.raises(SearchUnavailable):
+            policy.call(INDEX, send)
+    assert breaker.state == "open"
+
+    # Open: rejected without a request
+    with pytest.raises(SearchUnavailable, match="circuit open"):
+        policy.call(INDEX, send)
+    assert searches(server) == 2
+    assert policy.stats()["rejected"] == 1
+
+    time.sleep(0.25)
+    assert breaker.state == "half_open"
+    # Half-open: one probe at a time
+    assert breaker.acquire() == (True, True)
+    assert breaker.acquire() == (False, False)
+    breaker.release_probe()
+
+    # The probe succeeds (no fault left) and closes the breaker
+    assert len(policy.call(INDEX, send)["value"]) == 5
+    assert breaker.state == "closed"
+    assert searches(server) == 3
+
+
+def test_failed_probe_reopens_the_breaker(server, client):
+    server.inject(INDEX, fail_next=2, status=503)
+    policy = SearchResilience(max_attempts=1, failure_threshold=1, reset_timeout=0.2)
+    send = search_sender(client)
+
+    with pytest.raises(SearchUnavailable):
+        policy.call(INDEX, send)
+    time.sleep(0.25)
+    with pytest.raises(SearchUnavailable):
+        policy.call(INDEX, send)  # the probe fails
+    assert policy.breaker(INDEX).state == "open"
+
+
+def test_hedged_request_beats_the_slow_tail(server, client):
+    # The first request of the call hits a 1s stall, the hedge sent after 50ms gets a fast answer
+    server.inject(INDEX, slow_rate=1.0, slow_latency=1.0)
+    policy = SearchResilience(hedge=True, hedge_after=0.05)
+
+    def before(attempt):
+        if attempt == 2:
+            server.clear_faults()
+
+    started = time.monotonic()
+    result = policy.call(INDEX, search_sender(client, before=before))
+
+    assert time.monotonic() - started < 0.5
+    assert len(result["value"]) == 5
+    stats = policy.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_open_breaker_index_gets_degraded_response(server):
+    utils = pytest.importorskip("common.utils")
+    configure_search_client(endpoint=server.url, api_key="fake", api_version="2023-11-01")
+    policy = configure_search_resilience(max_attempts=1, failure_threshold=1, reset_timeout=60)
+    try:
+        policy.breaker("index-b").record_failure()
+
+        with pytest.raises(SearchUnavailable, match="circuit open"):
+            utils.search_index("question", "index-b", 3)
+        results = utils.get_search_results("question", ["index-a", "index-b"], k=3, max_concurrency=1)
+
+        assert list(results) == ["index-a-0", "index-a-1", "index-a-2"]
+        assert searches(server, "index-b") == 0
+        assert utils.degraded_response("index-b", SearchUnavailable("index-b", "circuit open")) == \
+            {"value": [], "@search.degraded": "Index index-b unavailable: circuit open"}
+        # No index answering is an error, not an empty answer
+        policy.breaker("index-a").record_failure()
+        with pytest.raises(SearchUnavailable, match="no index answered"):
+            utils.get_search_results("question", ["index-a", "index-b"], k=3)
+    finally:
+        close_search_client()
+        configure_search_resilience()
@@ -0,0 +1,93 @@
+"""Shared search clients against the local fake search server: pooled connections are reused across
+searches, each event loop gets its own async client and the close functions close them.
+
+    python -m pytest tests
+"""
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.fake_search import FakeSearchServer
+from common import search_client
+from common.search_client import (aclose_search_client, close_search_client, configure_search_client,
+                                  get_async_search_client, get_search_client)
+
+
+POOL_SIZE = 4
+
+
+@pytest.fixture
+def server():
+    with FakeSearchServer() as server:
+        configure_search_client(endpoint=server.url, api_key="fake", api_version="2023-11-01", pool_size=POOL_SIZE)
+        yield server
+        close_search_client()
+
+
+def search(index: str = "index-a") -> dict:
+    response = get_search_client().post("/indexes/" + index + "/docs/search", content=json.dumps({"search": "question"}))
+    response.raise_for_status()
+    return response.json()
+
+
+def test_pooled_connections_are_reused(server):
+    # One thread per pooled connection: 200 searches, no new connection after the first POOL_SIZE
+    with ThreadPoolExecutor(max_workers=POOL_SIZE) as executor:
+        results = list(executor.map(lambda i: search(), range(200)))
+    assert all(result["value"] for result in results)
+    assert 1 <= server.connections <= POOL_SIZE
+
+
+def test_get_search_results_reuses_connections(server):
+    utils = pytest.importorskip("common.utils")
+    for _ in range(50):
+        assert utils.get_search_results("question", ["index-a", "index-b", "index-c"], k=3)
+    assert server.connections <= POOL_SIZE
+
+
+def test_one_async_client_per_event_loop(server):
+    async def clients():
+        first = get_async_search_client()
+        assert get_async_search_client() is first
+        response = await first.post("/indexes/index-a/docs/search", content=json.dumps({"search": "question"}))
+        assert response.status_code == 200
+        return first
+
+    first, second = asyncio.run(clients()), asyncio.run(clients())
+    assert first is not second
+    # The client of a closed loop is dropped when the next one is built, not reused
+    assert list(search_client._async_clients.values()) == [second]
+
+
+def test_aget_search_results_uses_the_loop_client(server):
+    utils = pytest.importorskip("common.utils")
+
+    async def run():
+        results = await asyncio.gather(*[utils.aget_search_results("question", ["index-a", "index-b"], k=3) for _ in range(20)])
+        assert all(results)
+        assert list(search_client._async_clients) == [asyncio.get_running_loop()]
+        return get_async_search_client()
+
+    assert asyncio.run(run()) is not asyncio.run(run())
+    assert server.connections <= 2 * POOL_SIZE
+
+
+def test_aclose_search_client_closes_the_clients(server):
+    async def run():
+        client = get_async_search_client()
+        await client.post("/indexes/index-a/docs/search", content=json.dumps({"search": "question"}))
+        sync_client = get_search_client()
+        await aclose_search_client()
+        assert client.is_closed and sync_client.is_closed
+        assert not search_client._async_clients
+        # The next call builds a new client
+        assert get_async_search_client() is not client
+        await aclose_search_client()
+
+    asyncio.run(run())
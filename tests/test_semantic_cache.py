@@ -0,0 +1,98 @@
+"""SemanticCache with the offline LocalHashEmbeddings: similarity threshold, TTL expiry, isolation
+between tools, scopes and tenants, invalidation and eviction at max_entries.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.semantic_cache import LocalHashEmbeddings, SemanticCache, semantic_cache_scope
+
+
+QUESTION = "How do I reset my VPN password?"
+ANSWER = "Open the self-service portal and choose Reset VPN password."
+
+
+def make_cache(**settings) -> SemanticCache:
+    return SemanticCache(embeddings=LocalHashEmbeddings(), **dict(dict(threshold=0.8), **settings))
+
+
+def test_threshold_hit_and_miss():
+    cache = make_cache()
+    cache.add(QUESTION, ANSWER)
+
+    assert cache.lookup("how do i reset my vpn password") == ANSWER
+    assert cache.lookup("How can I reset my VPN password?") == ANSWER  # cosine 0.86
+    assert cache.lookup("Steps to reset the VPN password") is None  # cosine 0.43
+    assert cache.lookup("What were the quarterly sales in Europe?") is None
+    assert cache.stats() == {"hits": 2, "misses": 2, "entries": 1, "hit_rate": 0.5}
+
+
+def test_async_lookup():
+    cache = make_cache()
+
+    async def run():
+        await cache.aadd(QUESTION, ANSWER)
+        return await cache.alookup("How can I reset my VPN password?")
+
+    assert asyncio.run(run()) == ANSWER
+
+
+def test_entries_expire_after_ttl():
+    cache = make_cache(ttl=0.2)
+    cache.add(QUESTION, ANSWER)
+    assert cache.lookup(QUESTION) == ANSWER
+    time.sleep(0.25)
+    assert cache.lookup(QUESTION) is None
+    cache.add("Who approves VPN access?", "Your manager.")
+    assert cache.stats()["entries"] == 1  # the expired entry was dropped
+
+
+def test_tools_and_scopes_are_isolated():
+    cache = make_cache()
+    files = SimpleNamespace(metadata={"tenant_id": "contoso", "user_id": "ana"})
+    cache.add(QUESTION, ANSWER, tool="docsearch", scope=semantic_cache_scope(files, "srch-index-files"))
+
+    assert cache.lookup(QUESTION, tool="docsearch", scope=semantic_cache_scope(files, "srch-index-files")) == ANSWER
+    assert cache.lookup(QUESTION, tool="sqlsearch", scope=semantic_cache_scope(files, "srch-index-files")) is None
+    assert cache.lookup(QUESTION, tool="docsearch", scope=semantic_cache_scope(files, "srch-index-books")) is None
+    other_tenant = SimpleNamespace(metadata={"tenant_id": "fabrikam", "user_id": "ana"})
+    assert cache.lookup(QUESTION, tool="docsearch", scope=semantic_cache_scope(other_tenant, "srch-index-files")) is None
+    other_user = SimpleNamespace(metadata={"tenant_id": "contoso", "user_id": "ben"})
+    assert cache.lookup(QUESTION, tool="docsearch", scope=semantic_cache_scope(other_user, "srch-index-files")) is None
+
+    # The same question in another scope gets its own answer
+    cache.add(QUESTION, "Ask the Fabrikam service desk.", tool="docsearch", scope=semantic_cache_scope(other_tenant, "srch-index-files"))
+    assert cache.lookup(QUESTION, tool="docsearch", scope=semantic_cache_scope(other_tenant, "srch-index-files")) == "Ask the Fabrikam service desk."
+    assert cache.lookup(QUESTION, tool="docsearch", scope=semantic_cache_scope(files, "srch-index-files")) == ANSWER
+
+
+def test_invalidate_per_tool():
+    cache = make_cache()
+    cache.add(QUESTION, ANSWER, tool="docsearch")
+    cache.add(QUESTION, "SELECT 1", tool="sqlsearch")
+
+    cache.invalidate("docsearch")
+    assert cache.lookup(QUESTION, tool="docsearch") is None
+    assert cache.lookup(QUESTION, tool="sqlsearch") == "SELECT 1"
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+
+def test_oldest_entries_evicted_at_max_entries():
+    cache = make_cache(max_entries=20)
+    for i in range(250):
+        cache.add(f"What is the status of ticket {i}?", f"Ticket {i} is open.", scope=f"user-{i}")
+
+    assert cache.stats()["entries"] == 20
+    assert cache.lookup("What is the status of ticket 0?", scope="user-0") is None
+    assert cache.lookup("What is the status of ticket 229?", scope="user-229") is None
+    # Scopes without entries left are forgotten along the way, the remaining ones still match
+    for i in range(230, 250):
+        assert cache.lookup(f"What is the status of ticket {i}?", scope=f"user-{i}") == f"Ticket {i} is open."
+    assert cache.lookup("What is the status of ticket 249?", scope="user-0") is None
@@ -0,0 +1,83 @@
+"""Tests of the speculative retrieval claims: the docsearch agent rephrases the user question before it
+searches, a rephrasing must still claim the warm results and an unrelated query must not."""
+
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+pytest.importorskip("langchain_core")
+
+from common.speculation import SpeculativeRetrieval, claim_speculation, same_search
+
+
+QUESTION = "What is the escalation procedure in the phishing runbook?"
+
+
+def make_retrieval(searched):
+    async def asearch(question):
+        searched.append(question)
+        return {"results": question}
+
+    def search(question):
+        searched.append(question)
+        return {"results": question}
+
+    return SpeculativeRetrieval(key="docsearch", asearch=asearch, search=search)
+
+
+def test_same_search():
+    assert same_search("what is the escalation procedure in the phishing runbook", QUESTION)
+    assert same_search("phishing runbook escalation procedure", QUESTION)
+    assert not same_search("quarterly sales by region", QUESTION)
+    assert not same_search("phishing runbook escalation procedure", QUESTION, min_overlap=1.1)
+
+
+def test_async_claim_hits_for_rephrased_query():
+    searched = []
+    retrieval = make_retrieval(searched)
+
+    async def request():
+        async with retrieval.aspeculate(QUESTION):
+            speculation = claim_speculation("docsearch", "escalation procedure phishing runbook")
+            assert speculation is not None
+            assert await speculation.aresult() == {"results": QUESTION}
+            # A second claim in the same request gets nothing, the tool searches by itself
+            assert claim_speculation("docsearch", "escalation procedure phishing runbook") is None
+
+    asyncio.run(request())
+    assert searched == [QUESTION]
+    stats = retrieval.stats()
+    assert (stats["started"], stats["used"], stats["mismatched"], stats["cancelled"]) == (1, 1, 0, 0)
+
+
+def test_sync_claim_hits_for_rephrased_query():
+    searched = []
+    retrieval = make_retrieval(searched)
+    with retrieval.speculate(QUESTION):
+        speculation = claim_speculation("docsearch", "Phishing runbook: escalation procedure")
+        assert speculation is not None
+        assert speculation.result() == {"results": QUESTION}
+    assert retrieval.stats()["used"] == 1
+
+
+def test_claim_drops_unrelated_query():
+    retrieval = make_retrieval([])
+
+    async def request():
+        async with retrieval.aspeculate(QUESTION):
+            assert claim_speculation("docsearch", "quarterly sales by region") is None
+            # Dropped: not claimable any more, even by the right query
+            assert claim_speculation("docsearch", QUESTION) is None
+            assert claim_speculation("booksearch", QUESTION) is None
+
+    asyncio.run(request())
+    stats = retrieval.stats()
+    assert (stats["started"], stats["used"], stats["mismatched"], stats["cancelled"]) == (1, 0, 1, 1)
+
+
+def test_no_claim_outside_a_request():
+    assert claim_speculation("docsearch", QUESTION) is None
@@ -2,7 +2,7 @@ import re
 import os
 import json
 from io import BytesIO
-from typing import Any, Dict, List, Optional, Awaitable, Callable, Tuple, Type, Union
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Awaitable, Callable, Tuple, Type, Union
 import requests
 import asyncio
 
@@ -25,7 +25,7 @@ from langchain.callbacks.manager import AsyncCallbackManagerForToolRun, Callback
 from langchain.pydantic_v1 import BaseModel, Field, Extra
 from langchain.tools import BaseTool, StructuredTool, tool
 from typing import Dict, List
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import BaseOutputParser, OutputParserException
 from langchain.chains import LLMChain
@@ -50,7 +50,7 @@ from langchain_openai import AzureOpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from operator import itemgetter
 from typing import List 
@@ -58,12 +58,40 @@ from typing import List
 
 
 try:
-    from .prompts import (AGENT_DOCSEARCH_PROMPT, CSV_PROMPT_PREFIX, MSSQL_AGENT_PREFIX,
+    from .prompts import (DOCSEARCH_PROMPT, AGENT_DOCSEARCH_PROMPT, CSV_PROMPT_PREFIX, MSSQL_AGENT_PREFIX,
                           CHATGPT_PROMPT, BINGSEARCH_PROMPT, APISEARCH_PROMPT)
+    from .search_client import get_search_client, get_async_search_client
+    from .executors import get_executor
+    from .local_search import search_backend, get_local_search_engine
+    from .merge import StreamingMerger
+    from .context_packer import pack_documents
+    from .tokens import get_token_counter
+    from .resilience import get_search_resilience, SearchUnavailable
+    from .speculation import SpeculativeRetrieval, claim_speculation
+    from .semantic_cache import semantic_cache_scope
+    from .cache import get_search_cache, make_search_cache_key
+    from .pdf_pages import PdfPage, iter_pypdf_pages, pdf_name
+    from .doc_intelligence import build_document_analysis_client, iter_analyzed_pages, iter_result_pages, table_to_html
+    from .chunking import Chunk, TokenChunker, iter_chunks, iter_index_batches, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_OVERLAP
+    from .indexing import IndexManifest, push_documents, SOURCE_FIELD
 except Exception as e:
     print(e)
-    from prompts import (AGENT_DOCSEARCH_PROMPT, CSV_PROMPT_PREFIX, MSSQL_AGENT_PREFIX,
+    from prompts import (DOCSEARCH_PROMPT, AGENT_DOCSEARCH_PROMPT, CSV_PROMPT_PREFIX, MSSQL_AGENT_PREFIX,
                          CHATGPT_PROMPT, BINGSEARCH_PROMPT, APISEARCH_PROMPT)
+    from search_client import get_search_client, get_async_search_client
+    from executors import get_executor
+    from local_search import search_backend, get_local_search_engine
+    from merge import StreamingMerger
+    from context_packer import pack_documents
+    from tokens import get_token_counter
+    from resilience import get_search_resilience, SearchUnavailable
+    from speculation import SpeculativeRetrieval, claim_speculation
+    from semantic_cache import semantic_cache_scope
+    from cache import get_search_cache, make_search_cache_key
+    from pdf_pages import PdfPage, iter_pypdf_pages, pdf_name
+    from doc_intelligence import build_document_analysis_client, iter_analyzed_pages, iter_result_pages, table_to_html
+    from chunking import Chunk, TokenChunker, iter_chunks, iter_index_batches, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_OVERLAP
+    from indexing import IndexManifest, push_documents, SOURCE_FIELD
 
 
 def text_to_base64(text):
@@ -78,106 +106,118 @@ def text_to_base64(text):
 
     return base64_text
 
-def table_to_html(table):
-    table_html = "<table>"
-    rows = [sorted([cell for cell in table.cells if cell.row_index == i], key=lambda cell: cell.column_index) for i in range(table.row_count)]
-    for row_cells in rows:
-        table_html += "<tr>"
-        for cell in row_cells:
-            tag = "th" if (cell.kind == "columnHeader" or cell.kind == "rowHeader") else "td"
-            cell_spans = ""
-            if cell.column_span > 1: cell_spans += f" colSpan={cell.column_span}"
-            if cell.row_span > 1: cell_spans += f" rowSpan={cell.row_span}"
-            table_html += f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>"
-        table_html +="</tr>"
-    table_html += "</table>"
-    return table_html
-
-
-def parse_pdf(file, form_recognizer=False, formrecognizer_endpoint=None, formrecognizerkey=None, model="prebuilt-document", from_url=False, verbose=False):
-    """Parses PDFs using PyPDF or Azure Document Intelligence SDK (former Azure Form Recognizer)"""
-    offset = 0
-    page_map = []
+
+def iter_parse_pdf(file, form_recognizer=False, formrecognizer_endpoint=None, formrecognizerkey=None, model="prebuilt-document", from_url=False, verbose=False,
+                   max_workers=None, cache=None, client=None, max_in_flight=None, pages_per_request=None) -> Iterator[PdfPage]:
+    """Yields the pages of a PDF one at a time (PdfPage: name, page_num, offset, text), parsed with PyPDF or
+    Azure Document Intelligence SDK (former Azure Form Recognizer).
+    With PyPDF, max_workers > 1 extracts page ranges of the file on a process pool (common/pdf_pages.py).
+    With Document Intelligence, max_in_flight > 1 analyzes page ranges of pages_per_request pages concurrently
+    (common/doc_intelligence.py); client replaces the DocumentAnalysisClient (e.g. FakeDocumentAnalysisClient).
+    Unchanged files are read from the ingestion cache (common/ingest_cache.py: an IngestionCache, None for
+    the one in INGESTION_CACHE_DIR, False for none), keyed by content hash, parser and model."""
     if not form_recognizer:
         if verbose: print(f"Extracting text using PyPDF")
-        reader = PdfReader(file)
-        pages = reader.pages
-        for page_num, p in enumerate(pages):
-            page_text = p.extract_text()
-            page_map.append((page_num, offset, page_text))
-            offset += len(page_text)
-    else:
-        if verbose: print(f"Extracting text using Azure Document Intelligence")
-        credential = AzureKeyCredential(os.environ["FORM_RECOGNIZER_KEY"])
-        form_recognizer_client = DocumentAnalysisClient(endpoint=os.environ["FORM_RECOGNIZER_ENDPOINT"], credential=credential)
-        
-        if not from_url:
-            with open(file, "rb") as filename:
-                poller = form_recognizer_client.begin_analyze_document(model, document = filename)
-        else:
-            poller = form_recognizer_client.begin_analyze_document_from_url(model, document_url = file)
-            
-        form_recognizer_results = poller.result()
-
-        for page_num, page in enumerate(form_recognizer_results.pages):
-            tables_on_page = [table for table in form_recognizer_results.tables if table.bounding_regions[0].page_number == page_num + 1]
-
-            # mark all positions of the table spans in the page
-            page_offset = page.spans[0].offset
-            page_length = page.spans[0].length
-            table_chars = [-1]*page_length
-            for table_id, table in enumerate(tables_on_page):
-                for span in table.spans:
-                    # replace all table spans with "table_id" in table_chars array
-                    for i in range(span.length):
-                        idx = span.offset - page_offset + i
-                        if idx >=0 and idx < page_length:
-                            table_chars[idx] = table_id
-
-            # build page text by replacing charcters in table spans with table html
-            page_text = ""
-            added_tables = set()
-            for idx, table_id in enumerate(table_chars):
-                if table_id == -1:
-                    page_text += form_recognizer_results.content[page_offset + idx]
-                elif not table_id in added_tables:
-                    page_text += table_to_html(tables_on_page[table_id])
-                    added_tables.add(table_id)
-
-            page_text += " "
-            page_map.append((page_num, offset, page_text))
-            offset += len(page_text)
-
-    return page_map    
-
-
-def read_pdf_files(files, form_recognizer=False, verbose=False, formrecognizer_endpoint=None, formrecognizerkey=None):
+        yield from iter_pypdf_pages([file], max_workers=max_workers, cache=cache)
+        return
+
+    if verbose: print(f"Extracting text using Azure Document Intelligence")
+    client = client or build_document_analysis_client(formrecognizer_endpoint, formrecognizerkey)
+    if from_url:
+        poller = client.begin_analyze_document_from_url(model, document_url = file)
+        yield from iter_result_pages(poller.result(), pdf_name(file))
+        return
+    yield from iter_analyzed_pages([file], client=client, model=model, max_in_flight=max_in_flight,
+                                   pages_per_request=pages_per_request, cache=cache)
+
+
+def parse_pdf(file, form_recognizer=False, formrecognizer_endpoint=None, formrecognizerkey=None, model="prebuilt-document", from_url=False, verbose=False,
+              max_workers=None, cache=None, client=None, max_in_flight=None, pages_per_request=None):
+    """Parses PDFs using PyPDF or Azure Document Intelligence SDK (former Azure Form Recognizer).
+    Returns the whole page map [(page_num, offset, page_text)], see iter_parse_pdf to stream the pages."""
+    return [(page.page_num, page.offset, page.text)
+            for page in iter_parse_pdf(file, form_recognizer=form_recognizer, formrecognizer_endpoint=formrecognizer_endpoint,
+                                       formrecognizerkey=formrecognizerkey, model=model, from_url=from_url, verbose=verbose,
+                                       max_workers=max_workers, cache=cache, client=client, max_in_flight=max_in_flight,
+                                       pages_per_request=pages_per_request)]
+
+
+def iter_pdf_files(files, form_recognizer=False, verbose=False, formrecognizer_endpoint=None, formrecognizerkey=None, max_workers=None,
+                   cache=None, client=None, max_in_flight=None, pages_per_request=None) -> Iterator[PdfPage]:
+    """Yields the pages of all the PDFs one at a time, in order. page.text and page.source are what
+    read_pdf_files returns, without holding the whole corpus in memory:
+
+        for page in iter_pdf_files(files, max_workers=4):
+            upload(page.source, page.text)
+
+    With PyPDF and max_workers > 1 (or PDF_INGEST_WORKERS), files and page ranges of large files are
+    extracted in parallel on a process pool. With Document Intelligence and max_in_flight > 1, up to
+    max_in_flight analyses (page ranges of any of the files) run at once. Files in the ingestion cache
+    are not parsed again."""
+    if not form_recognizer:
+        if verbose: print(f"Extracting text using PyPDF")
+        yield from iter_pypdf_pages(files, max_workers=max_workers, cache=cache)
+        return
+    if verbose: print(f"Extracting text using Azure Document Intelligence")
+    yield from iter_analyzed_pages(files, client=client or build_document_analysis_client(formrecognizer_endpoint, formrecognizerkey),
+                                   max_in_flight=max_in_flight, pages_per_request=pages_per_request, cache=cache)
+
+
+def read_pdf_files(files, form_recognizer=False, verbose=False, formrecognizer_endpoint=None, formrecognizerkey=None, max_workers=None, cache=None,
+                   client=None, max_in_flight=None, pages_per_request=None):
     """This function will go through pdf and extract and return list of page texts (chunks)."""
     text_list = []
     sources_list = []
-    for file in files:
-        page_map = parse_pdf(file, form_recognizer=form_recognizer, verbose=verbose, formrecognizer_endpoint=formrecognizer_endpoint, formrecognizerkey=formrecognizerkey)
-        for page in enumerate(page_map):
-            text_list.append(page[1][2])
-            sources_list.append(file.name + "_page_"+str(page[1][0]+1))
+    for page in iter_pdf_files(files, form_recognizer=form_recognizer, verbose=verbose, formrecognizer_endpoint=formrecognizer_endpoint,
+                               formrecognizerkey=formrecognizerkey, max_workers=max_workers, cache=cache, client=client,
+                               max_in_flight=max_in_flight, pages_per_request=pages_per_request):
+        text_list.append(page.text)
+        sources_list.append(page.source)
     return [text_list,sources_list]
+
+
+def iter_pdf_chunks(files, chunk_tokens=None, overlap_tokens=None, embedding_model=None, chunk_workers=None, **parse_kwargs) -> Iterator[Chunk]:
+    """Yields index-ready chunks of the PDFs (common/chunking.py): at most chunk_tokens tokens of the
+    embedding_model encoding, overlap_tokens shared by consecutive chunks, with the pages they come from.
+    parse_kwargs go to iter_pdf_files; with chunk_workers > 1 documents are split on a process pool.
+
+        for batch in iter_index_batches(iter_pdf_chunks(files, max_workers=4, chunk_workers=4)):
+            upload(batch)
+    """
+    chunker = TokenChunker(chunk_tokens=chunk_tokens or DEFAULT_CHUNK_TOKENS,
+                           overlap_tokens=DEFAULT_CHUNK_OVERLAP if overlap_tokens is None else overlap_tokens,
+                           model=embedding_model)
+    yield from iter_chunks(iter_pdf_files(files, **parse_kwargs), chunker=chunker, max_workers=chunk_workers)
+
+
+def push_pdf_files(files, index, manifest=None, full_sync=False, embed=None, upload_workers=None, chunk_tokens=None, overlap_tokens=None,
+                   embedding_model=None, chunk_workers=None, **parse_kwargs) -> dict:
+    """Parses, chunks and pushes PDFs to an Azure AI Search index in one stream (common/indexing.py), instead
+    of the blob indexer of the notebooks. Only new or changed chunks are sent, in batches of up to 1000 with
+    upload_workers (INDEX_UPLOAD_WORKERS, 4) in flight, and chunks gone from the files are deleted. manifest
+    defaults to .index_manifests/<index>.json; embed (e.g. AzureOpenAIEmbeddings(...).embed_documents)
+    fills chunkVector of the chunks sent. Returns the push stats.
+
+        push_pdf_files(files, "cogsrch-index-files", embed=embedder.embed_documents, max_workers=4)
+    """
+    chunks = iter_pdf_chunks(files, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens, embedding_model=embedding_model,
+                             chunk_workers=chunk_workers, **parse_kwargs)
+    kwargs = {"max_workers": upload_workers} if upload_workers else {}
+    return push_documents(index, (chunk.to_document(SOURCE_FIELD) for chunk in chunks), manifest=manifest or IndexManifest.for_index(index),
+                          full_sync=full_sync, embed=embed, **kwargs)
     
     
 
 # Returns the num of tokens used on a string
-def num_tokens_from_string(string: str) -> int:
-    encoding_name ='cl100k_base'
-    """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+def num_tokens_from_string(string: str, model: Optional[str] = None) -> int:
+    """Returns the number of tokens in a text string (cl100k_base, or the encoding of model).
+    The encoder is loaded once and repeated strings are memoized (common/tokens.py)."""
+    return get_token_counter(model).count(string)
 
 # Returns num of toknes used on a list of Documents objects
-def num_tokens_from_docs(docs: List[Document]) -> int:
-    num_tokens = 0
-    for i in range(len(docs)):
-        num_tokens += num_tokens_from_string(docs[i].page_content)
-    return num_tokens
+def num_tokens_from_docs(docs: List[Document], model: Optional[str] = None) -> int:
+    """Counts all the Documents in one batch, encoded on several threads"""
+    return get_token_counter(model).count_documents(docs)
 
 
 @dataclass(frozen=True)
@@ -249,63 +289,299 @@ def reduce_openapi_spec(spec: dict, dereference: bool = True) -> ReducedOpenAPIS
     )
 
 
+def build_search_payload(query: str, k: int) -> dict:
+    """Body of the hybrid (semantic + vector) query sent to each index"""
+    return {
+        "search": query,
+        "select": "id, title, chunk, name, location",
+        "queryType": "semantic",
+        "vectorQueries": [{"text": query, "fields": "chunkVector", "kind": "text", "k": k}],
+        "semanticConfiguration": "my-semantic-config",
+        "captions": "extractive",
+        "answers": "extractive",
+        "count":"true",
+        "top": k    
+    }
+
+
+def search_index(query: str, index: str, k: int) -> dict:
+    """Runs the hybrid (semantic + vector) query against a single index and returns the raw response.
+    Uses the shared keep-alive client, so repeated queries reuse pooled connections.
+    With SEARCH_BACKEND=local the query runs on the offline engine in common/local_search.py instead."""
+    
+    if search_backend() == "local":
+        return get_local_search_engine().search_index(query, index, k)
+    
+    search_payload = build_search_payload(query, k)
+    client = get_search_client()
+    
+    # Deadline, retries on 429/503, optional hedging and the per-index circuit breaker (common/resilience.py)
+    def send(timeout):
+        return client.post("/indexes/" + index + "/docs/search", content=json.dumps(search_payload), timeout=timeout)
+
+    return get_search_resilience().call(index, send)
+
+
+def degraded_response(index: str, error: Exception) -> dict:
+    """Empty response standing in for an index that could not answer, so the other indexes still count"""
+    print(f"Skipping index {index}: {error}")
+    return {"value": [], "@search.degraded": str(error)}
+
+
+def _check_degraded(agg_search_results: dict) -> bool:
+    """True when some index was skipped; raises SearchUnavailable when all of them were"""
+    degraded = [index for index, response in agg_search_results.items() if "@search.degraded" in response]
+    if degraded and len(degraded) == len(agg_search_results):
+        raise SearchUnavailable(", ".join(degraded), "no index answered")
+    return bool(degraded)
+
+
 def get_search_results(query: str, indexes: list, 
                        k: int = 5,
                        reranker_threshold: int = 1,
-                       sas_token: str = "") -> List[dict]:
-    """Performs multi-index hybrid search and returns ordered dictionary with the combined results"""
+                       sas_token: str = "",
+                       max_concurrency: int = 4,
+                       use_cache: bool = False,
+                       merge_strategy: str = "score",
+                       dedup_threshold: Optional[float] = None) -> List[dict]:
+    """Performs multi-index hybrid search and returns ordered dictionary with the combined results.
+    
+    The indexes are queried at the same time (fan-out), with at most max_concurrency requests in flight,
+    so latency tracks the slowest index instead of the sum of all of them. Use max_concurrency=1 to
+    query the indexes one after another.
+    With use_cache=True, repeated questions are answered from the shared TTL/LRU search cache.
+    merge_strategy selects how the results of the indexes are ranked together (see merge_search_results).
+    With dedup_threshold (0-1), near-duplicate chunks across indexes are collapsed before the top k cut.
+    An index that cannot answer (see common/resilience.py) is skipped and the others are merged; results
+    missing an index are not cached. SearchUnavailable is raised only when no index answered.
+    """
+    
+    if use_cache:
+        cache_key = make_search_cache_key(query, indexes, k, reranker_threshold, sas_token, merge_strategy, dedup_threshold)
+        cached_results = get_search_cache().get(cache_key)
+        if cached_results is not None:
+            return cached_results
+    
+    agg_search_results = dict()
+    
+    if max_concurrency > 1 and len(indexes) > 1:
+        # Runs on the shared "search" executor, keeping at most max_concurrency queries of this call in flight
+        executor = get_executor("search")
+        pending = list(indexes)
+        futures = dict()
+        in_flight = set()
+        while pending or in_flight:
+            while pending and len(in_flight) < max_concurrency:
+                index = pending.pop(0)
+                futures[index] = executor.submit(search_index, query, index, k)
+                in_flight.add(futures[index])
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        # Collect in the order of indexes so the merge behaves exactly like the sequential loop
+        for index in indexes:
+            try:
+                agg_search_results[index] = futures[index].result()
+            except SearchUnavailable as e:
+                agg_search_results[index] = degraded_response(index, e)
+    else:
+        for index in indexes:
+            try:
+                agg_search_results[index] = search_index(query, index, k)
+            except SearchUnavailable as e:
+                agg_search_results[index] = degraded_response(index, e)
+    
+    degraded = _check_degraded(agg_search_results)
     
-    headers = {'Content-Type': 'application/json','api-key': os.environ["AZURE_SEARCH_KEY"]}
-    params = {'api-version': os.environ['AZURE_SEARCH_API_VERSION']}
+    ordered_content = merge_search_results(agg_search_results, k=k, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                                           strategy=merge_strategy, dedup_threshold=dedup_threshold)
+    if use_cache and not degraded:
+        get_search_cache().set(cache_key, ordered_content)
+    
+    return ordered_content
 
+
+async def asearch_index(query: str, index: str, k: int) -> dict:
+    """Async twin of search_index, on the shared async client"""
+    
+    if search_backend() == "local":
+        return await get_executor("search").run(get_local_search_engine().search_index, query, index, k)
+    
+    search_payload = build_search_payload(query, k)
+    client = get_async_search_client()
+    
+    async def send(timeout):
+        return await client.post("/indexes/" + index + "/docs/search", content=json.dumps(search_payload), timeout=timeout)
+
+    return await get_search_resilience().acall(index, send)
+
+
+async def aget_search_results(query: str, indexes: list, 
+                              k: int = 5,
+                              reranker_threshold: int = 1,
+                              sas_token: str = "",
+                              max_concurrency: int = 4,
+                              use_cache: bool = False,
+                              merge_strategy: str = "score",
+                              dedup_threshold: Optional[float] = None) -> List[dict]:
+    """Async twin of get_search_results. The indexes are queried concurrently on the event loop
+    (at most max_concurrency at a time), so no thread is held while waiting on the network."""
+    
+    if use_cache:
+        cache_key = make_search_cache_key(query, indexes, k, reranker_threshold, sas_token, merge_strategy, dedup_threshold)
+        cached_results = get_search_cache().get(cache_key)
+        if cached_results is not None:
+            return cached_results
+    
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def search(index):
+        async with semaphore:
+            try:
+                return await asearch_index(query, index, k)
+            except SearchUnavailable as e:
+                return degraded_response(index, e)
+    
+    responses = await asyncio.gather(*[search(index) for index in indexes])
+    agg_search_results = dict(zip(indexes, responses))
+    degraded = _check_degraded(agg_search_results)
+    
+    ordered_content = merge_search_results(agg_search_results, k=k, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                                           strategy=merge_strategy, dedup_threshold=dedup_threshold)
+    if use_cache and not degraded:
+        get_search_cache().set(cache_key, ordered_content)
+    
+    return ordered_content
+
+
+async def astream_search_results(query: str, indexes: list, 
+                                  k: int = 5,
+                                  reranker_threshold: int = 1,
+                                  sas_token: str = "",
+                                  max_concurrency: int = 4,
+                                  merge_strategy: str = "score",
+                                  dedup_threshold: Optional[float] = None) -> AsyncIterator[dict]:
+    """Streaming twin of aget_search_results. Yields a provisional top k each time an index answers,
+    then the final ranking (merged in the order of indexes, same as aget_search_results):
+    
+        {"final": False, "indexes": ["srch-index-files"], "results": OrderedDict(...)}
+        ...
+        {"final": True, "indexes": [...all...], "results": OrderedDict(...)}
+    
+    Closing the generator early cancels the queries still in flight.
+    """
+    
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def search(index):
+        async with semaphore:
+            try:
+                return index, await asearch_index(query, index, k)
+            except SearchUnavailable as e:
+                return index, degraded_response(index, e)
+    
+    tasks = [asyncio.ensure_future(search(index)) for index in indexes]
+    merger = StreamingMerger(k=k, strategy=merge_strategy, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                             dedup_threshold=dedup_threshold)
     agg_search_results = dict()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, search_results = await next_done
+            agg_search_results[index] = search_results
+            if len(agg_search_results) < len(indexes):
+                merger.add(index, search_results['value'])
+                yield {"final": False, "indexes": list(agg_search_results), "results": merger.results()}
+    finally:
+        for task in tasks:
+            task.cancel()
     
-    for index in indexes:
-        search_payload = {
-            "search": query,
-            "select": "id, title, chunk, name, location",
-            "queryType": "semantic",
-            "vectorQueries": [{"text": query, "fields": "chunkVector", "kind": "text", "k": k}],
-            "semanticConfiguration": "my-semantic-config",
-            "captions": "extractive",
-            "answers": "extractive",
-            "count":"true",
-            "top": k    
-        }
+    agg_search_results = {index: agg_search_results[index] for index in indexes}
+    _check_degraded(agg_search_results)
+    yield {"final": True, "indexes": list(indexes),
+           "results": merge_search_results(agg_search_results, k=k, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                                           strategy=merge_strategy, dedup_threshold=dedup_threshold)}
+
+
+def _batch_result(query: str, results, started: float, error: Optional[Exception] = None) -> dict:
+    return {"query": query, "results": results, "elapsed_ms": (time.perf_counter() - started) * 1000, "error": error}
+
+
+def get_search_results_batch(queries: List[str], indexes: list,
+                             max_concurrent_queries: int = 8,
+                             return_exceptions: bool = False,
+                             **search_kwargs) -> List[dict]:
+    """Runs get_search_results for many queries (evaluation sets, bulk jobs) and returns, in the order of queries:
+    
+        [{"query": ..., "results": OrderedDict(...), "elapsed_ms": 231.4, "error": None}, ...]
+    
+    At most max_concurrent_queries queries run at a time, on the shared "search-batch" executor; each of them
+    fans out to its indexes on the shared "search" executor and connection pool as usual. search_kwargs
+    (k, reranker_threshold, sas_token, max_concurrency, use_cache, merge_strategy, dedup_threshold) go to
+    get_search_results. With return_exceptions=True a failed query gets results=None and its exception in
+    "error" instead of failing the batch.
+    """
+    
+    def run(query):
+        started = time.perf_counter()
+        try:
+            return _batch_result(query, get_search_results(query, indexes, **search_kwargs), started)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return _batch_result(query, None, started, e)
+    
+    executor = get_executor("search-batch")
+    batch_results = [None] * len(queries)
+    pending = list(enumerate(queries))
+    in_flight = dict()
+    while pending or in_flight:
+        while pending and len(in_flight) < max(1, max_concurrent_queries):
+            position, query = pending.pop(0)
+            in_flight[executor.submit(run, query)] = position
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            batch_results[in_flight.pop(future)] = future.result()
+    
+    return batch_results
 
-        resp = requests.post(os.environ['AZURE_SEARCH_ENDPOINT'] + "/indexes/" + index + "/docs/search",
-                         data=json.dumps(search_payload), headers=headers, params=params)
 
-        search_results = resp.json()
-        agg_search_results[index] = search_results
+async def aget_search_results_batch(queries: List[str], indexes: list,
+                                    max_concurrent_queries: int = 8,
+                                    return_exceptions: bool = False,
+                                    **search_kwargs) -> List[dict]:
+    """Async twin of get_search_results_batch, running aget_search_results on the shared async client"""
     
-    content = dict()
-    ordered_content = OrderedDict()
+    semaphore = asyncio.Semaphore(max(1, max_concurrent_queries))
     
+    async def run(query):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                return _batch_result(query, await aget_search_results(query, indexes, **search_kwargs), started)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return _batch_result(query, None, started, e)
+    
+    return list(await asyncio.gather(*[run(query) for query in queries]))
+
+
+def merge_search_results(agg_search_results: dict, k: int = 5, reranker_threshold: int = 1, sas_token: str = "",
+                         strategy: str = "score", dedup_threshold: Optional[float] = None) -> OrderedDict:
+    """Combines the raw responses of several indexes ({index: response}) into one ordered dictionary
+    with the top k results above the reranker threshold.
+    
+    Results are streamed through a bounded heap (memory O(k)). strategy="score" ranks by the raw
+    reranker score; "rrf" (reciprocal rank fusion) and "minmax" make scores comparable across indexes.
+    An id returned by several indexes keeps its best score. An entry's "score" is the score it is ranked by
+    (the raw reranker score with strategy="score"), "reranker_score" always the raw reranker score.
+    dedup_threshold collapses near-duplicate chunks (MinHash similarity at or above it) into the best-scored one.
+    """
+    
+    merger = StreamingMerger(k=k, strategy=strategy, reranker_threshold=reranker_threshold, sas_token=sas_token,
+                             dedup_threshold=dedup_threshold)
     for index,search_results in agg_search_results.items():
-        for result in search_results['value']:
-            if result['@search.rerankerScore'] > reranker_threshold: # Show results that are at least N% of the max possible score=4
-                content[result['id']]={
-                                        "title": result['title'], 
-                                        "name": result['name'], 
-                                        "chunk": result['chunk'],
-                                        "location": result['location'] + sas_token if result['location'] else "",
-                                        "caption": result['@search.captions'][0]['text'],
-                                        "score": result['@search.rerankerScore'],
-                                        "index": index
-                                    }
-                
-
-    topk = k
-        
-    count = 0  # To keep track of the number of results added
-    for id in sorted(content, key=lambda x: content[x]["score"], reverse=True):
-        ordered_content[id] = content[id]
-        count += 1
-        if count >= topk:  # Stop after adding topK results
-            break
+        merger.add(index, search_results['value'])
 
-    return ordered_content
+    return merger.results()
 
 
 
@@ -315,14 +591,65 @@ class CustomAzureSearchRetriever(BaseRetriever):
     topK : int
     reranker_threshold : int
     sas_token : str = ""
+    max_concurrency : int = 4
+    use_cache : bool = True
+    merge_strategy : str = "score"
+    dedup_threshold : Optional[float] = None
     
     
     def _get_relevant_documents(
         self, input: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> List[Document]:
         
-        ordered_results = get_search_results(input, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, sas_token=self.sas_token)
+        ordered_results = get_search_results(input, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, 
+                                             sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache, 
+                                             merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
+        
+        return self.to_documents(ordered_results)
+
+    async def _aget_relevant_documents(
+        self, input: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        
+        ordered_results = await aget_search_results(input, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, 
+                                                    sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache, 
+                                                    merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
         
+        return self.to_documents(ordered_results)
+
+    async def astream_documents(self, query: str) -> AsyncIterator[dict]:
+        """Yields {"final": bool, "indexes": [...], "documents": [...]} as the indexes answer:
+        provisional top documents first, then the reconciled ranking with final=True"""
+        
+        async for update in astream_search_results(query, self.indexes, k=self.topK, reranker_threshold=self.reranker_threshold, 
+                                                   sas_token=self.sas_token, max_concurrency=self.max_concurrency, 
+                                                   merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold):
+            yield {"final": update["final"], "indexes": update["indexes"], "documents": self.to_documents(update["results"])}
+
+    def _search_kwargs(self) -> dict:
+        return dict(k=self.topK, reranker_threshold=self.reranker_threshold, sas_token=self.sas_token, max_concurrency=self.max_concurrency,
+                    use_cache=self.use_cache, merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
+
+    def batch_documents(self, queries: List[str], max_concurrent_queries: int = 8, return_exceptions: bool = False) -> List[dict]:
+        """Documents of many queries, in input order: [{"query", "documents", "elapsed_ms", "error"}, ...]"""
+        
+        batch_results = get_search_results_batch(queries, self.indexes, max_concurrent_queries=max_concurrent_queries,
+                                                 return_exceptions=return_exceptions, **self._search_kwargs())
+        return [self._batch_documents(result) for result in batch_results]
+
+    async def abatch_documents(self, queries: List[str], max_concurrent_queries: int = 8, return_exceptions: bool = False) -> List[dict]:
+        
+        batch_results = await aget_search_results_batch(queries, self.indexes, max_concurrent_queries=max_concurrent_queries,
+                                                        return_exceptions=return_exceptions, **self._search_kwargs())
+        return [self._batch_documents(result) for result in batch_results]
+
+    def _batch_documents(self, result: dict) -> dict:
+        documents = self.to_documents(result["results"]) if result["results"] is not None else None
+        return {"query": result["query"], "documents": documents, "elapsed_ms": result["elapsed_ms"], "error": result["error"]}
+
+    @staticmethod
+    def to_documents(ordered_results: OrderedDict) -> List[Document]:
+        """Converts the results of get_search_results into LangChain Documents"""
         top_docs = []
         for key,value in ordered_results.items():
             location = value["location"] if value["location"] is not None else ""
@@ -334,16 +661,23 @@ class CustomAzureSearchRetriever(BaseRetriever):
 def get_answer(llm: AzureChatOpenAI,
                retriever: CustomAzureSearchRetriever, 
                query: str,
-               memory: ConversationBufferMemory = None
+               memory: ConversationBufferMemory = None,
+               max_context_tokens: Optional[int] = None
               ) -> Dict[str, Any]:
     
-    """Gets an answer to a question from a list of Documents."""
+    """Gets an answer to a question from a list of Documents.
+    With max_context_tokens, the retrieved Documents are packed into that token budget first (the tokens
+    used and dropped are logged, see common/context_packer.py)."""
 
     # Get the answer
+    
+    context = itemgetter("question") | retriever # Passes the question to the retriever and the results are assign to context
+    if max_context_tokens is not None:
+        context = context | (lambda docs: pack_documents(docs, max_context_tokens))
         
     chain = (
         {
-            "context": itemgetter("question") | retriever, # Passes the question to the retriever and the results are assign to context
+            "context": context,
             "question": itemgetter("question")
         }
         | DOCSEARCH_PROMPT  # Passes the 4 variables above to the prompt template
@@ -355,12 +689,54 @@ def get_answer(llm: AzureChatOpenAI,
 
     return answer
 
+
+async def astream_answer(llm: AzureChatOpenAI,
+                         retriever: CustomAzureSearchRetriever, 
+                         query: str,
+                         slow_index_timeout: float = 2.0,
+                         max_context_tokens: Optional[int] = None
+                        ) -> AsyncIterator[str]:
+    
+    """Streaming version of get_answer that does not wait for a slow index.
+    
+    Once the first index has answered, the other ones get slow_index_timeout more seconds; if the
+    final ranking is not in by then, the prompt is built from the provisional top documents and
+    the late results are dropped."""
+    
+    chain = DOCSEARCH_PROMPT | llm | StrOutputParser()
+    
+    updates = retriever.astream_documents(query)
+    documents = []
+    try:
+        first = await updates.__anext__()
+        documents = first["documents"]
+        deadline = time.monotonic() + slow_index_timeout
+        while not first["final"]:
+            first = await asyncio.wait_for(updates.__anext__(), timeout=max(0, deadline - time.monotonic()))
+            documents = first["documents"]
+    except (StopAsyncIteration, asyncio.TimeoutError):
+        pass
+    finally:
+        await updates.aclose()
+    
+    if max_context_tokens is not None:
+        documents = pack_documents(documents, max_context_tokens)
+    
+    async for chunk in chain.astream({"context": documents, "question": query}):
+        yield chunk
+
     
 
 #####################################################################################################
 ############################### AGENTS AND TOOL CLASSES #############################################
 #####################################################################################################
     
+
+def _child_config(run_manager) -> Optional[dict]:
+    """Config handing a tool run's callbacks (token accounting, tracing) down to the agent or chain it runs"""
+    return {"callbacks": run_manager.get_child()} if run_manager else None
+
+
 class SearchInput(BaseModel):
     query: str = Field(description="should be a search query")
     return_direct: bool = Field(
@@ -368,6 +744,11 @@ class SearchInput(BaseModel):
         default=False,
     )
 
+def doc_search_key(indexes: List[str], k: int, reranker_th: int, sas_token: str, merge_strategy: str, dedup_threshold: Optional[float]) -> tuple:
+    """Identifies the searches of a GetDocSearchResults_Tool, so a speculative search with the same settings can stand in for them"""
+    return (tuple(indexes), k, reranker_th, sas_token, merge_strategy, dedup_threshold)
+
+
 class GetDocSearchResults_Tool(BaseTool):
     name = "docsearch"
     description = "useful when the questions includes the term: docsearch"
@@ -377,29 +758,60 @@ class GetDocSearchResults_Tool(BaseTool):
     k: int = 10
     reranker_th: int = 1
     sas_token: str = "" 
+    max_concurrency: int = 4
+    use_cache: bool = True
+    merge_strategy: str = "score"
+    dedup_threshold: Optional[float] = None
+    max_context_tokens: Optional[int] = None  # when set, the results are packed into this many tokens
 
     def _run(
         self, query: str,  return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
 
+        # Results searched ahead of time for the user question (SpeculativeRetrieval), when the request has them
+        speculation = claim_speculation(doc_search_key(self.indexes, self.k, self.reranker_th, self.sas_token,
+                                                       self.merge_strategy, self.dedup_threshold), query)
+        if speculation is not None:
+            try:
+                return self._pack(CustomAzureSearchRetriever.to_documents(speculation.result()), run_manager)
+            except Exception as e:
+                print(e)
+
         retriever = CustomAzureSearchRetriever(indexes=self.indexes, topK=self.k, reranker_threshold=self.reranker_th, 
-                                               sas_token=self.sas_token, callback_manager=self.callbacks)
+                                               sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache,
+                                               merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold,
+                                               callback_manager=self.callbacks)
         results = retriever.invoke(input=query)
         
-        return results
+        return self._pack(results, run_manager)
 
     async def _arun(
         self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool asynchronously."""
         
+        speculation = claim_speculation(doc_search_key(self.indexes, self.k, self.reranker_th, self.sas_token,
+                                                       self.merge_strategy, self.dedup_threshold), query)
+        if speculation is not None:
+            try:
+                return self._pack(CustomAzureSearchRetriever.to_documents(await speculation.aresult()),
+                                  run_manager.get_sync() if run_manager else None)
+            except Exception as e:
+                print(e)
+        
         retriever = CustomAzureSearchRetriever(indexes=self.indexes, topK=self.k, reranker_threshold=self.reranker_th, 
-                                               sas_token=self.sas_token, callback_manager=self.callbacks)
-        # Please note below that running a non-async function like run_agent in a separate thread won't make it truly asynchronous. 
-        # It allows the function to be called without blocking the event loop, but it may still have synchronous behavior internally.
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(ThreadPoolExecutor(), retriever.invoke, query)
+                                               sas_token=self.sas_token, max_concurrency=self.max_concurrency, use_cache=self.use_cache,
+                                               merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold,
+                                               callback_manager=self.callbacks)
+        # The retriever queries Azure AI Search with the async client, so no thread is used while waiting on the network
+        results = await retriever.ainvoke(query)
         
+        return self._pack(results, run_manager.get_sync() if run_manager else None)
+
+    def _pack(self, results: List[Document], run_manager: Optional[CallbackManagerForToolRun] = None) -> List[Document]:
+        """The results packed into max_context_tokens, when set; the tokens used and dropped go to the log and the tool run"""
+        if self.max_context_tokens is not None:
+            results = pack_documents(results, self.max_context_tokens, run_manager=run_manager)
         return results
 
 
@@ -415,30 +827,61 @@ class DocSearchAgent(BaseTool):
     k: int = 10
     reranker_th: int = 1
     sas_token: str = ""   
+    max_concurrency: int = 4
+    use_cache: bool = True
+    merge_strategy: str = "score"
+    dedup_threshold: Optional[float] = None
+    max_context_tokens: Optional[int] = None
+    semantic_cache: Any = None  # optional SemanticCache answering paraphrased questions (per indexes and user_id / tenant_id of the request)
     
     class Config:
         extra = Extra.allow  # Allows setting attributes not declared in the model
     
     def __init__(self, **data):
         super().__init__(**data)
-        tools = [GetDocSearchResults_Tool(indexes=self.indexes, k=self.k, reranker_th=self.reranker_th, sas_token=self.sas_token)]
+        tools = [GetDocSearchResults_Tool(indexes=self.indexes, k=self.k, reranker_th=self.reranker_th, sas_token=self.sas_token,
+                                          max_concurrency=self.max_concurrency, use_cache=self.use_cache,
+                                          merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold,
+                                          max_context_tokens=self.max_context_tokens)]
 
         agent = create_openai_tools_agent(self.llm, tools, AGENT_DOCSEARCH_PROMPT)
 
         self.agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=self.verbose, callback_manager=self.callbacks, handle_parsing_errors=True)
         
+    def speculative_retrieval(self) -> SpeculativeRetrieval:
+        """SpeculativeRetrieval running this agent's search for the raw user question, claimed by its docsearch tool"""
+        search_kwargs = dict(k=self.k, reranker_threshold=self.reranker_th, sas_token=self.sas_token, max_concurrency=self.max_concurrency,
+                             use_cache=self.use_cache, merge_strategy=self.merge_strategy, dedup_threshold=self.dedup_threshold)
+        return SpeculativeRetrieval(key=doc_search_key(self.indexes, self.k, self.reranker_th, self.sas_token, self.merge_strategy,
+                                                       self.dedup_threshold),
+                                    asearch=lambda question: aget_search_results(question, self.indexes, **search_kwargs),
+                                    search=lambda question: get_search_results(question, self.indexes, **search_kwargs))
     
     def _run(self, query: str,  return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        scope = semantic_cache_scope(run_manager, *self.indexes)
+        if self.semantic_cache is not None:
+            cached_answer = self.semantic_cache.lookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
-            result = self.agent_executor.invoke({"question": query})
+            result = self.agent_executor.invoke({"question": query}, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                self.semantic_cache.add(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
             return str(e)  # Return an empty string or some error indicator
 
     async def _arun(self, query: str,  return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
+        scope = semantic_cache_scope(run_manager, *self.indexes)
+        if self.semantic_cache is not None:
+            cached_answer = await self.semantic_cache.alookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
-            result = await self.agent_executor.ainvoke({"question": query})
+            result = await self.agent_executor.ainvoke({"question": query}, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                await self.semantic_cache.aadd(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
@@ -473,7 +916,7 @@ class CSVTabularAgent(BaseTool):
     def _run(self, query: str, return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         try:
             # Use the initialized agent_executor to invoke the query
-            result = self.agent_executor.invoke(query)
+            result = self.agent_executor.invoke(query, _child_config(run_manager))
             return result['output']
         except Exception as e:
             print(e)
@@ -483,7 +926,7 @@ class CSVTabularAgent(BaseTool):
         # Note: Implementation assumes the agent_executor and its methods support async operations
         try:
             # Use the initialized agent_executor to asynchronously invoke the query
-            result = await self.agent_executor.ainvoke(query)
+            result = await self.agent_executor.ainvoke(query, _child_config(run_manager))
             return result['output']
         except Exception as e:
             print(e)
@@ -500,6 +943,7 @@ class SQLSearchAgent(BaseTool):
 
     llm: AzureChatOpenAI
     k: int = 30
+    semantic_cache: Any = None  # optional SemanticCache answering paraphrased questions (per user_id / tenant_id of the request)
 
     class Config:
         extra = Extra.allow  # Allows setting attributes not declared in the model
@@ -534,9 +978,16 @@ class SQLSearchAgent(BaseTool):
         }
 
     def _run(self, query: str, return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        scope = semantic_cache_scope(run_manager)
+        if self.semantic_cache is not None:
+            cached_answer = self.semantic_cache.lookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
             # Use the initialized agent_executor to invoke the query
-            result = self.agent_executor.invoke(query)
+            result = self.agent_executor.invoke(query, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                self.semantic_cache.add(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
@@ -544,9 +995,16 @@ class SQLSearchAgent(BaseTool):
 
     async def _arun(self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         # Note: Implementation assumes the agent_executor and its methods support async operations
+        scope = semantic_cache_scope(run_manager)
+        if self.semantic_cache is not None:
+            cached_answer = await self.semantic_cache.alookup(query, tool=self.name, scope=scope)
+            if cached_answer is not None:
+                return cached_answer
         try:
             # Use the initialized agent_executor to asynchronously invoke the query
-            result = await self.agent_executor.ainvoke(query)
+            result = await self.agent_executor.ainvoke(query, _child_config(run_manager))
+            if self.semantic_cache is not None:
+                await self.semantic_cache.aadd(query, result['output'], tool=self.name, scope=scope)
             return result['output']
         except Exception as e:
             print(e)
@@ -574,7 +1032,7 @@ class ChatGPTTool(BaseTool):
 
     def _run(self, query: str, return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         try:
-            response = self.chatgpt_chain.invoke({"question": query})
+            response = self.chatgpt_chain.invoke({"question": query}, _child_config(run_manager))
             return response
         except Exception as e:
             print(e)
@@ -583,7 +1041,7 @@ class ChatGPTTool(BaseTool):
     async def _arun(self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         """Implement the tool to be used asynchronously."""
         try:
-            response = await self.chatgpt_chain.ainvoke({"question": query})
+            response = await self.chatgpt_chain.ainvoke({"question": query}, _child_config(run_manager))
             return response
         except Exception as e:
             print(e)
@@ -599,6 +1057,7 @@ class GetBingSearchResults_Tool(BaseTool):
     args_schema: Type[BaseModel] = SearchInput
 
     k: int = 5
+    executor_name: str = "bing"  # shared executor used by _arun, sized with configure_executor()
     
     def _run(self, query: str,  return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         bing = BingSearchAPIWrapper(k=self.k)
@@ -609,9 +1068,8 @@ class GetBingSearchResults_Tool(BaseTool):
     
     async def _arun(self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         bing = BingSearchAPIWrapper(k=self.k)
-        loop = asyncio.get_event_loop()
         try:
-            results = await loop.run_in_executor(ThreadPoolExecutor(), bing.results, query, self.k)
+            results = await get_executor(self.executor_name).run(bing.results, query, self.k)
             return results
         except:
             return "No Results Found"
@@ -665,7 +1123,7 @@ class BingSearchAgent(BaseTool):
 
     def _run(self, query: str,  return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         try:
-            response = self.agent_executor.invoke({"question": query})
+            response = self.agent_executor.invoke({"question": query}, _child_config(run_manager))
             return response['output']
         except Exception as e:
             print(e)
@@ -674,7 +1132,7 @@ class BingSearchAgent(BaseTool):
     async def _arun(self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         """Implements the tool to be used asynchronously."""
         try:
-            response = await self.agent_executor.ainvoke({"question": query})
+            response = await self.agent_executor.ainvoke({"question": query}, _child_config(run_manager))
             return response['output']
         except Exception as e:
             print(e)
@@ -694,6 +1152,7 @@ class GetAPISearchResults_Tool(BaseTool):
     headers: dict = {}
     limit_to_domains: list = None
     verbose: bool = False
+    executor_name: str = "apisearch"  # shared executor used by _arun, sized with configure_executor()
     
     class Config:
         extra = Extra.allow  # Allows setting attributes not declared in the model
@@ -712,7 +1171,7 @@ class GetAPISearchResults_Tool(BaseTool):
         try:
             # Optionally sleep to avoid possible TPM rate limits
             sleep(2)
-            response = self.chain.invoke(query)
+            response = self.chain.invoke(query, _child_config(run_manager))
         except Exception as e:
             response = str(e)  # Ensure the response is always a string
 
@@ -720,12 +1179,11 @@ class GetAPISearchResults_Tool(BaseTool):
 
     async def _arun(self, query: str, return_direct = False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         """Use the tool asynchronously."""
-        loop = asyncio.get_event_loop()
         try:
             # Optionally sleep to avoid possible TPM rate limits, handled differently in async context
             await asyncio.sleep(2)
-            # Execute the synchronous function in a separate thread
-            response = await loop.run_in_executor(ThreadPoolExecutor(), self.chain.invoke, query)
+            # Execute the synchronous function on the shared, bounded executor
+            response = await get_executor(self.executor_name).run(self.chain.invoke, query)
         except Exception as e:
             response = str(e)  # Ensure the response is always a string
 
@@ -767,7 +1225,7 @@ class APISearchAgent(BaseTool):
     def _run(self, query: str, return_direct = False, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         try:
             # Use the initialized agent_executor to invoke the query
-            response = self.agent_executor.invoke({"question":query})
+            response = self.agent_executor.invoke({"question":query}, _child_config(run_manager))
             return response['output']
         except Exception as e:
             print(e)
@@ -777,7 +1235,7 @@ class APISearchAgent(BaseTool):
         # Note: Implementation assumes the agent_executor and its methods support async operations
         try:
             # Use the initialized agent_executor to asynchronously invoke the query
-            response = await self.agent_executor.ainvoke({"question":query})
+            response = await self.agent_executor.ainvoke({"question":query}, _child_config(run_manager))
             return response['output']
         except Exception as e:
             print(e)